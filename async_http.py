@@ -0,0 +1,114 @@
+# async_http.py
+# -*- coding: utf-8 -*-
+"""
+异步调用基础设施：
+1. 每个服务商一个长连接复用的 httpx.AsyncClient（keep-alive，可用时启用 HTTP/2）
+2. 一个常驻后台事件循环，供同步代码通过 run_async() 并发执行多个异步调用
+"""
+import asyncio
+import logging
+import threading
+import httpx
+
+# 连接池参数：同一服务商的并发请求共享连接
+_POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60.0)
+_DEFAULT_TIMEOUT = 600
+
+# (provider, loop_id) -> (loop, client)。httpx 的连接绑定在创建它的事件循环上，因此按循环区分
+_clients: dict = {}
+# 可重入：创建 SDK 客户端的 factory 内部还会获取共享的 httpx 客户端
+_clients_lock = threading.RLock()
+
+_background_loop = None
+_background_thread = None
+_loop_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    """httpx 的 HTTP/2 支持依赖可选包 h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_loop_resource(cache: dict, name: str, factory, is_valid=None):
+    """
+    按当前事件循环缓存资源（客户端等）：cache 的结构为 {(name, loop_id): (loop, 资源)}，
+    不存在或 is_valid(资源) 为假时调用 factory() 创建。
+    每次先清理已关闭事件循环遗留的条目，因此资源不会随短命的事件循环累积，
+    循环 id 被新循环复用时也不会取到绑定在旧循环上的资源。必须在协程内调用。
+    """
+    loop = asyncio.get_running_loop()
+    key = (name, id(loop))
+    with _clients_lock:
+        for stale_key in [k for k, (lp, _) in cache.items() if lp.is_closed()]:
+            cache.pop(stale_key, None)
+        entry = cache.get(key)
+        if entry is not None and entry[0] is loop and (is_valid is None or is_valid(entry[1])):
+            return entry[1]
+        resource = factory()
+        cache[key] = (loop, resource)
+        return resource
+
+
+def _create_async_http_client(provider: str, timeout=None) -> httpx.AsyncClient:
+    use_http2 = _http2_available()
+    client = httpx.AsyncClient(
+        http2=use_http2,
+        limits=_POOL_LIMITS,
+        timeout=timeout if timeout else _DEFAULT_TIMEOUT,
+    )
+    logging.info(f"[async_http] Created pooled async client for '{provider}' (http2={use_http2}).")
+    return client
+
+
+def get_async_http_client(provider: str, timeout=None) -> httpx.AsyncClient:
+    """
+    获取当前事件循环下某服务商共享的 AsyncClient，不存在则创建。
+    必须在协程内调用。
+    """
+    return get_loop_resource(
+        _clients, provider,
+        lambda: _create_async_http_client(provider, timeout),
+        is_valid=lambda client: not client.is_closed
+    )
+
+
+def _ensure_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop, _background_thread
+    with _loop_lock:
+        if _background_loop is not None and _background_thread is not None and _background_thread.is_alive():
+            return _background_loop
+        _background_loop = asyncio.new_event_loop()
+        _background_thread = threading.Thread(
+            target=_background_loop.run_forever,
+            name="async-http-loop",
+            daemon=True
+        )
+        _background_thread.start()
+        return _background_loop
+
+
+def run_async(coro, timeout=None):
+    """
+    在常驻后台事件循环中执行协程并阻塞等待结果。
+    供同步代码（UI 线程之外的工作线程）调用异步适配器方法使用。
+    """
+    loop = _ensure_background_loop()
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    return future.result(timeout)
+
+
+async def aclose_all_clients():
+    """关闭当前事件循环下的全部共享客户端"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        keys = [k for k, (lp, _) in _clients.items() if lp is loop]
+        clients = [_clients.pop(k)[1] for k in keys]
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logging.warning(f"[async_http] Failed to close async client: {e}")
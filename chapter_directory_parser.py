@@ -1,6 +1,69 @@
 # chapter_blueprint_parser.py
 # -*- coding: utf-8 -*-
+import os
 import re
+import json
+import logging
+import threading
+
+# 兼容是否使用方括号包裹章节标题
+# 例如：
+#   第1章 - 紫极光下的预兆
+# 或
+#   第1章 - [紫极光下的预兆]
+_CHAPTER_NUMBER_PATTERN = re.compile(r'^第\s*(\d+)\s*章\s*-\s*\[?(.*?)\]?$')
+_FIELD_PATTERNS = (
+    ("chapter_role", re.compile(r'^本章定位：\s*\[?(.*)\]?$')),
+    ("chapter_purpose", re.compile(r'^核心作用：\s*\[?(.*)\]?$')),
+    ("suspense_level", re.compile(r'^悬念密度：\s*\[?(.*)\]?$')),
+    ("foreshadowing", re.compile(r'^伏笔操作：\s*\[?(.*)\]?$')),
+    ("plot_twist_level", re.compile(r'^认知颠覆：\s*\[?(.*)\]?$')),
+    ("chapter_summary", re.compile(r'^本章简述：\s*\[?(.*)\]?$')),
+)
+# 章节之间以空行分隔
+_BLOCK_SEPARATOR = re.compile(r'\n\s*\n')
+# 行首的章节标题，用于截取末尾若干章
+_HEADER_AT_LINE_START = re.compile(r'^第\s*\d+\s*章', re.MULTILINE)
+
+CHAPTER_FIELDS = (
+    "chapter_number", "chapter_title", "chapter_role", "chapter_purpose",
+    "suspense_level", "foreshadowing", "plot_twist_level", "chapter_summary"
+)
+
+
+def _parse_block(block: str):
+    """解析单个章节块；首行不是“第X章 - 标题”格式时返回 None"""
+    lines = block.strip().splitlines()
+    if not lines:
+        return None
+    # 先匹配第一行，找到章号和标题
+    header_match = _CHAPTER_NUMBER_PATTERN.match(lines[0].strip())
+    if not header_match:
+        return None
+    info = {field: "" for field in CHAPTER_FIELDS}
+    info["chapter_number"] = int(header_match.group(1))
+    info["chapter_title"] = header_match.group(2).strip()
+    # 从后面的行匹配其他字段
+    for line in lines[1:]:
+        line_stripped = line.strip()
+        if not line_stripped:
+            continue
+        for field, pattern in _FIELD_PATTERNS:
+            match = pattern.match(line_stripped)
+            if match:
+                info[field] = match.group(1).strip()
+                break
+    return info
+
+
+def _iter_blocks(text: str):
+    """逐个产出 (起始字符位置, 结束字符位置, 块文本)"""
+    start = 0
+    for sep in _BLOCK_SEPARATOR.finditer(text):
+        yield start, sep.start(), text[start:sep.start()]
+        start = sep.end()
+    yield start, len(text), text[start:]
+
 
 def parse_chapter_blueprint(blueprint_text: str):
     """
@@ -16,117 +79,212 @@ def parse_chapter_blueprint(blueprint_text: str):
       "chapter_summary": str     # 本章简述
     }
     """
-
     # 先按空行进行分块，以免多章之间混淆
-    chunks = re.split(r'\n\s*\n', blueprint_text.strip())
     results = []
+    for _, _, block in _iter_blocks(blueprint_text.strip()):
+        info = _parse_block(block)
+        if info:
+            results.append(info)
+    # 按照 chapter_number 排序后返回
+    results.sort(key=lambda x: x["chapter_number"])
+    return results
 
-    # 兼容是否使用方括号包裹章节标题
-    # 例如：
-    #   第1章 - 紫极光下的预兆
-    # 或
-    #   第1章 - [紫极光下的预兆]
-    chapter_number_pattern = re.compile(r'^第\s*(\d+)\s*章\s*-\s*\[?(.*?)\]?$')
-
-    role_pattern     = re.compile(r'^本章定位：\s*\[?(.*)\]?$')
-    purpose_pattern  = re.compile(r'^核心作用：\s*\[?(.*)\]?$')
-    suspense_pattern = re.compile(r'^悬念密度：\s*\[?(.*)\]?$')
-    foreshadow_pattern = re.compile(r'^伏笔操作：\s*\[?(.*)\]?$')
-    twist_pattern       = re.compile(r'^认知颠覆：\s*\[?(.*)\]?$')
-    summary_pattern = re.compile(r'^本章简述：\s*\[?(.*)\]?$')
-
-    for chunk in chunks:
-        lines = chunk.strip().splitlines()
-        if not lines:
-            continue
 
-        chapter_number   = None
-        chapter_title    = ""
-        chapter_role     = ""
-        chapter_purpose  = ""
-        suspense_level   = ""
-        foreshadowing    = ""
-        plot_twist_level = ""
-        chapter_summary  = ""
-
-        # 先匹配第一行（或前几行），找到章号和标题
-        header_match = chapter_number_pattern.match(lines[0].strip())
-        if not header_match:
-            # 不符合“第X章 - 标题”的格式，跳过
-            continue
+def default_chapter_info(chapter_number: int) -> dict:
+    info = {field: "" for field in CHAPTER_FIELDS}
+    info["chapter_number"] = chapter_number
+    info["chapter_title"] = f"第{chapter_number}章"
+    return info
 
-        chapter_number = int(header_match.group(1))
-        chapter_title  = header_match.group(2).strip()
-
-        # 从后面的行匹配其他字段
-        for line in lines[1:]:
-            line_stripped = line.strip()
-            if not line_stripped:
-                continue
-
-            m_role = role_pattern.match(line_stripped)
-            if m_role:
-                chapter_role = m_role.group(1).strip()
-                continue
-
-            m_purpose = purpose_pattern.match(line_stripped)
-            if m_purpose:
-                chapter_purpose = m_purpose.group(1).strip()
-                continue
-
-            m_suspense = suspense_pattern.match(line_stripped)
-            if m_suspense:
-                suspense_level = m_suspense.group(1).strip()
-                continue
-
-            m_foreshadow = foreshadow_pattern.match(line_stripped)
-            if m_foreshadow:
-                foreshadowing = m_foreshadow.group(1).strip()
-                continue
-
-            m_twist = twist_pattern.match(line_stripped)
-            if m_twist:
-                plot_twist_level = m_twist.group(1).strip()
-                continue
-
-            m_summary = summary_pattern.match(line_stripped)
-            if m_summary:
-                chapter_summary = m_summary.group(1).strip()
-                continue
-
-        results.append({
-            "chapter_number": chapter_number,
-            "chapter_title": chapter_title,
-            "chapter_role": chapter_role,
-            "chapter_purpose": chapter_purpose,
-            "suspense_level": suspense_level,
-            "foreshadowing": foreshadowing,
-            "plot_twist_level": plot_twist_level,
-            "chapter_summary": chapter_summary
-        })
 
-    # 按照 chapter_number 排序后返回
-    results.sort(key=lambda x: x["chapter_number"])
-    return results
+class BlueprintIndex:
+    """
+    章节目录索引：整份目录只解析一次，按章号保存解析结果及其在文件中的字节区间。
+    单章查询为字典查找；“最近 N 章”直接按字节偏移读取文件末尾，不再扫描全文。
+    同一章号出现多次时以第一次出现为准（与逐块解析后取首个匹配的行为一致）。
+    """
+    VERSION = 1
+
+    def __init__(self, records: list, path: str = None, text: str = None, stamp=None):
+        # records: 按文件顺序排列的 dict，除章节字段外含 start / end 字节偏移
+        self.records = records
+        self.path = path
+        self.stamp = stamp
+        self._text_bytes = text.encode("utf-8") if text is not None else None
+        self._by_number = {}
+        for r in records:
+            self._by_number.setdefault(r["chapter_number"], r)
+
+    @classmethod
+    def from_text(cls, text: str, path: str = None, stamp=None, base_offset: int = 0):
+        records = []
+        byte_pos = base_offset
+        char_pos = 0
+        for start, end, block in _iter_blocks(text):
+            byte_pos += len(text[char_pos:start].encode("utf-8"))
+            block_bytes = len(block.encode("utf-8"))
+            info = _parse_block(block)
+            if info:
+                info["start"] = byte_pos
+                info["end"] = byte_pos + block_bytes
+                records.append(info)
+            byte_pos += block_bytes
+            char_pos = end
+        return cls(records, path=path, text=None if path else text, stamp=stamp)
+
+    @property
+    def max_chapter(self) -> int:
+        return max(self._by_number) if self._by_number else 0
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def get(self, chapter_number: int):
+        record = self._by_number.get(chapter_number)
+        if record is None:
+            return None
+        return {field: record[field] for field in CHAPTER_FIELDS}
+
+    def chapter_info(self, chapter_number: int) -> dict:
+        """与 get_chapter_info_from_blueprint 相同：找不到时返回默认结构"""
+        return self.get(chapter_number) or default_chapter_info(chapter_number)
+
+    def tail_text(self, limit_chapters: int) -> str:
+        """目录中最后 limit_chapters 个章节块（按文件顺序）起至末尾的原文"""
+        if not self.records:
+            return ""
+        start = self.records[max(0, len(self.records) - limit_chapters)]["start"]
+        if self._text_bytes is not None:
+            data = self._text_bytes[start:]
+        else:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                data = f.read()
+        return data.decode("utf-8", errors="replace").replace("\r\n", "\n").strip()
+
+    def to_json(self) -> dict:
+        return {"version": self.VERSION, "stamp": list(self.stamp) if self.stamp else None, "records": self.records}
+
+
+# ============ 按文件缓存的目录索引 ============
+_index_cache: dict = {}   # 绝对路径 -> BlueprintIndex
+_text_index_cache: dict = {}  # (len, hash) -> (text, BlueprintIndex)，仅保留最近几份
+_index_lock = threading.Lock()
+_TEXT_INDEX_CACHE_SIZE = 4
+
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _sidecar_path(path: str) -> str:
+    """索引旁路文件，与项目其他缓存一同放在 .cache 目录下"""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), ".cache", "blueprint_index.json")
+
+
+def _load_sidecar(path: str, stamp):
+    try:
+        with open(_sidecar_path(path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != BlueprintIndex.VERSION or tuple(data.get("stamp") or ()) != stamp:
+        return None
+    return BlueprintIndex(data.get("records") or [], path=path, stamp=stamp)
+
+
+def _save_sidecar(index: BlueprintIndex):
+    sidecar = _sidecar_path(index.path)
+    try:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        tmp = sidecar + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index.to_json(), f, ensure_ascii=False)
+        os.replace(tmp, sidecar)
+    except OSError as e:
+        logging.debug(f"Failed to write blueprint index sidecar: {e}")
+
+
+def get_blueprint_index(directory_file: str, persist: bool = True) -> BlueprintIndex:
+    """
+    获取 Novel_directory.txt 的索引。按文件修改时间与大小在进程内缓存，
+    persist 时另存旁路文件，新进程中文件未变则直接载入而无需重新解析。
+    文件不存在时返回空索引。
+    """
+    path = os.path.abspath(directory_file)
+    stamp = _file_stamp(path)
+    if stamp is None:
+        return BlueprintIndex([], text="")
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached is not None and cached.stamp == stamp:
+            return cached
+    index = _load_sidecar(path, stamp) if persist else None
+    if index is None:
+        with open(path, "rb") as f:
+            raw = f.read()
+        # 解析期间文件可能被改写，以读取到的内容为准
+        stamp = (stamp[0], len(raw)) if len(raw) != stamp[1] else stamp
+        bom = 3 if raw.startswith(b"\xef\xbb\xbf") else 0
+        index = BlueprintIndex.from_text(
+            raw[bom:].decode("utf-8", errors="replace"), path=path, stamp=stamp, base_offset=bom
+        )
+        if persist:
+            _save_sidecar(index)
+        logging.info(f"Indexed chapter blueprint: {len(index)} chapters.")
+    with _index_lock:
+        _index_cache[path] = index
+    return index
+
+
+def _index_for_text(blueprint_text: str) -> BlueprintIndex:
+    """已读入内存的目录文本的索引；同一文本重复查询时不再重新解析"""
+    key = (len(blueprint_text), hash(blueprint_text))
+    with _index_lock:
+        entry = _text_index_cache.get(key)
+        if entry is not None and entry[0] == blueprint_text:
+            return entry[1]
+    index = BlueprintIndex.from_text(blueprint_text)
+    with _index_lock:
+        if len(_text_index_cache) >= _TEXT_INDEX_CACHE_SIZE:
+            _text_index_cache.pop(next(iter(_text_index_cache)))
+        _text_index_cache[key] = (blueprint_text, index)
+    return index
+
+
+def get_chapter_info(directory_file: str, target_chapter_number: int) -> dict:
+    """从目录文件中取某章的结构化信息（经索引缓存），找不到时返回默认结构"""
+    return get_blueprint_index(directory_file).chapter_info(target_chapter_number)
+
+
+def tail_chapters(blueprint_text: str, limit_chapters: int) -> str:
+    """
+    只取目录文本末尾的 limit_chapters 章：从末尾向前按窗口扩展查找行首的章节标题，
+    开销只与所取部分的长度有关。章节数不足时返回原文。
+    """
+    if limit_chapters <= 0:
+        return ""
+    window = 4096
+    length = len(blueprint_text)
+    while True:
+        start = max(0, length - window)
+        # 指定起点时 ^ 只匹配真正的行首，窗口起点落在行中间也不会误判
+        headers = [m.start() for m in _HEADER_AT_LINE_START.finditer(blueprint_text, start)]
+        if len(headers) > limit_chapters:
+            return blueprint_text[headers[-limit_chapters]:].strip()
+        if start == 0:
+            return blueprint_text
+        window *= 2
 
 
 def get_chapter_info_from_blueprint(blueprint_text: str, target_chapter_number: int):
     """
     在已经加载好的章节蓝图文本中，找到对应章号的结构化信息，返回一个 dict。
     若找不到则返回一个默认的结构。
+    同一文本的重复查询复用已建立的索引；已知文件路径时优先使用 get_chapter_info。
     """
-    all_chapters = parse_chapter_blueprint(blueprint_text)
-    for ch in all_chapters:
-        if ch["chapter_number"] == target_chapter_number:
-            return ch
-    # 默认返回
-    return {
-        "chapter_number": target_chapter_number,
-        "chapter_title": f"第{target_chapter_number}章",
-        "chapter_role": "",
-        "chapter_purpose": "",
-        "suspense_level": "",
-        "foreshadowing": "",
-        "plot_twist_level": "",
-        "chapter_summary": ""
-    }
+    return _index_for_text(blueprint_text).chapter_info(target_chapter_number)
@@ -3,8 +3,8 @@
 import json
 import os
 import threading
-from llm_adapters import create_llm_adapter
-from embedding_adapters import create_embedding_adapter
+from llm_adapters import create_llm_adapter, invalidate_llm_adapters
+from embedding_adapters import create_embedding_adapter, invalidate_embedding_adapters
 
 
 def load_config(config_file: str) -> dict:
@@ -85,7 +85,8 @@ def create_config(config_file: str) -> dict:
         "characters_involved": "",
         "key_items": "",
         "scene_location": "",
-        "time_constraint": ""
+        "time_constraint": "",
+        "vector_backend": "chroma"
     },
     "choose_configs": {
         "prompt_draft_llm": "DeepSeek V3",
@@ -112,12 +113,40 @@ def create_config(config_file: str) -> dict:
 
 def save_config(config_data: dict, config_file: str) -> bool:
     """将 config_data 保存到 config_file 中，返回 True/False 表示是否成功。"""
+    old_config = {}
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                old_config = json.load(f)
+        except:
+            old_config = {}
     try:
         with open(config_file, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, ensure_ascii=False, indent=4)
-        return True
     except:
         return False
+    invalidate_changed_adapters(old_config, config_data)
+    return True
+
+
+def invalidate_changed_adapters(old_config: dict, new_config: dict):
+    """
+    对比新旧配置，使被修改或删除的 LLM / Embedding 配置对应的缓存适配器失效。
+    """
+    for section, invalidate in (
+        ("llm_configs", invalidate_llm_adapters),
+        ("embedding_configs", invalidate_embedding_adapters),
+    ):
+        old_profiles = (old_config or {}).get(section, {}) or {}
+        new_profiles = (new_config or {}).get(section, {}) or {}
+        for name, old_profile in old_profiles.items():
+            if not isinstance(old_profile, dict) or new_profiles.get(name) == old_profile:
+                continue
+            invalidate(
+                interface_format=old_profile.get("interface_format", ""),
+                base_url=old_profile.get("base_url", ""),
+                model_name=old_profile.get("model_name", ""),
+            )
 
 def test_llm_config(interface_format, api_key, base_url, model_name, temperature, max_tokens, timeout, log_func, handle_exception_func):
     """测试当前的LLM配置是否可用"""
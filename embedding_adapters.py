@@ -1,10 +1,18 @@
 # embedding_adapters.py
 # -*- coding: utf-8 -*-
+import asyncio
+import hashlib
 import logging
+import threading
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+from async_http import get_async_http_client
 
 def ensure_openai_base_url_has_v1(url: str) -> str:
     """
@@ -19,6 +27,52 @@ def ensure_openai_base_url_has_v1(url: str) -> str:
             url = url.rstrip('/') + '/v1'
     return url
 
+# 单次批量请求包含的文本条数上限（各服务商另有自身上限时取较小值）
+DEFAULT_EMBED_BATCH_SIZE = 32
+# 服务商不支持批量接口时，逐条请求的并发上限
+FALLBACK_EMBED_WORKERS = 4
+
+_sessions: dict = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_http_session(provider: str) -> requests.Session:
+    """每个服务商一个长连接复用的 requests.Session"""
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[provider] = session
+        return session
+
+
+def _iter_batches(texts: List[str], batch_size: int):
+    batch_size = max(1, batch_size)
+    for start in range(0, len(texts), batch_size):
+        yield texts[start:start + batch_size]
+
+
+def _map_bounded(func, items: List[str], max_workers: int = FALLBACK_EMBED_WORKERS) -> list:
+    """有界并发地逐条调用 func，结果保持输入顺序"""
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="embed") as executor:
+        return list(executor.map(func, items))
+
+
+async def _agather_bounded(func, items: List[str], max_workers: int = FALLBACK_EMBED_WORKERS) -> list:
+    """_map_bounded 的异步版本"""
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def _run(item):
+        async with semaphore:
+            return await func(item)
+    return list(await asyncio.gather(*(_run(item) for item in items)))
+
+
 class BaseEmbeddingAdapter:
     """
     Embedding 接口统一基类
@@ -29,6 +83,13 @@ class BaseEmbeddingAdapter:
     def embed_query(self, query: str) -> List[float]:
         raise NotImplementedError
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """异步批量 embedding。未实现原生异步接口的后端在线程池中执行同步方法"""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, query)
+
 class OpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 OpenAIEmbeddings（或兼容接口）的适配器
@@ -46,6 +107,12 @@ class OpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     def embed_query(self, query: str) -> List[float]:
         return self._embedding.embed_query(query)
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._embedding.aembed_documents(texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self._embedding.aembed_query(query)
+
 class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 AzureOpenAIEmbeddings（或兼容接口）的适配器
@@ -73,43 +140,115 @@ class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     def embed_query(self, query: str) -> List[float]:
         return self._embedding.embed_query(query)
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._embedding.aembed_documents(texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self._embedding.aembed_query(query)
+
 class OllamaEmbeddingAdapter(BaseEmbeddingAdapter):
     """
-    其接口路径为 /api/embeddings
+    优先使用批量接口 /api/embed（input 为数组）；
+    旧版本 Ollama 没有该接口时回退到 /api/embeddings 逐条并发请求。
     """
-    def __init__(self, model_name: str, base_url: str):
+    def __init__(self, model_name: str, base_url: str, batch_size: int = DEFAULT_EMBED_BATCH_SIZE):
         self.model_name = model_name
         self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        # None 表示尚未探测；False 表示服务端不支持 /api/embed
+        self._batch_supported = None
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         embeddings = []
-        for text in texts:
-            vec = self._embed_single(text)
-            embeddings.append(vec)
+        for batch in _iter_batches(texts, self.batch_size):
+            vectors = self._embed_batch(batch) if self._batch_supported is not False else None
+            if vectors is None:
+                vectors = _map_bounded(self._embed_single, batch)
+            embeddings.extend(vectors)
         return embeddings
 
     def embed_query(self, query: str) -> List[float]:
         return self._embed_single(query)
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for batch in _iter_batches(texts, self.batch_size):
+            vectors = await self._aembed_batch(batch) if self._batch_supported is not False else None
+            if vectors is None:
+                vectors = await _agather_bounded(self._aembed_single, batch)
+            embeddings.extend(vectors)
+        return embeddings
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self._aembed_single(query)
+
+    def _api_root(self) -> str:
+        url = self.base_url.rstrip("/")
+        if "/api/embeddings" in url:
+            return url[:url.index("/api/embeddings")] + "/api"
+        if "/api" in url:
+            return url
+        if "/v1" in url:
+            url = url[:url.index("/v1")]
+        return f"{url}/api"
+
+    def _embeddings_url(self) -> str:
+        return f"{self._api_root()}/embeddings"
+
+    def _embed_url(self) -> str:
+        return f"{self._api_root()}/embed"
+
+    @staticmethod
+    def _parse_batch(result: dict, expected: int) -> List[List[float]]:
+        vectors = result.get("embeddings")
+        if not vectors or len(vectors) != expected:
+            raise ValueError("Invalid 'embeddings' field in Ollama /api/embed response.")
+        return vectors
+
+    def _embed_batch(self, texts: List[str]):
+        """
+        调用 /api/embed 批量获取 embedding；服务端不支持该接口时返回 None
+        """
+        session = _get_http_session(f"ollama:{self.base_url}")
+        try:
+            response = session.post(self._embed_url(), json={"model": self.model_name, "input": texts})
+            if response.status_code == 404:
+                logging.info("Ollama /api/embed not available, falling back to /api/embeddings.")
+                self._batch_supported = False
+                return None
+            response.raise_for_status()
+            self._batch_supported = True
+            return self._parse_batch(response.json(), len(texts))
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Ollama batch embed request error: {e}\n{traceback.format_exc()}")
+            raise
+
+    async def _aembed_batch(self, texts: List[str]):
+        client = get_async_http_client(f"ollama:{self.base_url}")
+        try:
+            response = await client.post(self._embed_url(), json={"model": self.model_name, "input": texts})
+            if response.status_code == 404:
+                logging.info("Ollama /api/embed not available, falling back to /api/embeddings.")
+                self._batch_supported = False
+                return None
+            response.raise_for_status()
+            self._batch_supported = True
+            return self._parse_batch(response.json(), len(texts))
+        except httpx.HTTPError as e:
+            logging.error(f"Ollama batch embed async request error: {e}\n{traceback.format_exc()}")
+            raise
+
     def _embed_single(self, text: str) -> List[float]:
         """
         调用 Ollama 本地服务 /api/embeddings 接口，获取文本 embedding
         """
-        url = self.base_url.rstrip("/")
-        if "/api/embeddings" not in url:
-            if "/api" in url:
-                url = f"{url}/embeddings"
-            else:
-                if "/v1" in url:
-                    url = url[:url.index("/v1")]
-                url = f"{url}/api/embeddings"
-
+        url = self._embeddings_url()
         data = {
             "model": self.model_name,
             "prompt": text
         }
         try:
-            response = requests.post(url, json=data)
+            response = _get_http_session(f"ollama:{self.base_url}").post(url, json=data)
             response.raise_for_status()
             result = response.json()
             if "embedding" not in result:
@@ -119,6 +258,19 @@ class OllamaEmbeddingAdapter(BaseEmbeddingAdapter):
             logging.error(f"Ollama embeddings request error: {e}\n{traceback.format_exc()}")
             raise
 
+    async def _aembed_single(self, text: str) -> List[float]:
+        client = get_async_http_client(f"ollama:{self.base_url}")
+        try:
+            response = await client.post(self._embeddings_url(), json={"model": self.model_name, "prompt": text})
+            response.raise_for_status()
+            result = response.json()
+            if "embedding" not in result:
+                raise ValueError("No 'embedding' field in Ollama response.")
+            return result["embedding"]
+        except httpx.HTTPError as e:
+            logging.error(f"Ollama embeddings async request error: {e}\n{traceback.format_exc()}")
+            raise
+
 class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 LM Studio 的 embedding 适配器
@@ -178,32 +330,145 @@ class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
             logging.error(f"Error parsing LM Studio API response: {str(e)}")
             raise
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        client = get_async_http_client(f"lmstudio:{self.url}")
+        try:
+            response = await client.post(self.url, json={"input": texts, "model": self.model_name}, headers=self.headers)
+            response.raise_for_status()
+            result = response.json()
+            if "data" not in result:
+                raise ValueError(f"Invalid response format from LM Studio API: {result}")
+            embeddings = [item.get("embedding", []) for item in result["data"]]
+            if not all(embeddings):
+                raise ValueError("Some embeddings are empty in LM Studio API response")
+            return embeddings
+        except httpx.HTTPError as e:
+            logging.error(f"LM Studio API async request failed: {str(e)}")
+            raise
+
+    async def aembed_query(self, query: str) -> List[float]:
+        embeddings = await self.aembed_documents([query])
+        return embeddings[0]
+
 class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 Google Generative AI (Gemini) 接口的 Embedding 适配器
     使用直接 POST 请求方式，URL 示例：
     https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent?key=YOUR_API_KEY
+    批量请求使用 :batchEmbedContents，单次最多 100 条。
     """
-    def __init__(self, api_key: str, model_name: str, base_url: str):
+    MAX_BATCH_SIZE = 100
+
+    def __init__(self, api_key: str, model_name: str, base_url: str, batch_size: int = DEFAULT_EMBED_BATCH_SIZE):
         """
         :param api_key: 传入的 Google API Key
         :param model_name: 这里一般是 "text-embedding-004"
         :param base_url: e.g. https://generativelanguage.googleapis.com/v1beta/models
+        :param batch_size: 单次 batchEmbedContents 请求的文本条数
         """
         self.api_key = api_key
         self.model_name = model_name
         self.base_url = base_url.rstrip("/")
+        self.batch_size = min(batch_size, self.MAX_BATCH_SIZE)
+        self._batch_supported = None
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         embeddings = []
-        for text in texts:
-            vec = self._embed_single(text)
-            embeddings.append(vec)
+        for batch in _iter_batches(texts, self.batch_size):
+            vectors = self._embed_batch(batch) if self._batch_supported is not False else None
+            if vectors is None:
+                vectors = _map_bounded(self._embed_single, batch)
+            embeddings.extend(vectors)
         return embeddings
 
     def embed_query(self, query: str) -> List[float]:
         return self._embed_single(query)
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for batch in _iter_batches(texts, self.batch_size):
+            vectors = await self._aembed_batch(batch) if self._batch_supported is not False else None
+            if vectors is None:
+                vectors = await _agather_bounded(self._aembed_single, batch)
+            embeddings.extend(vectors)
+        return embeddings
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self._aembed_single(query)
+
+    def _model_ref(self) -> str:
+        return self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+
+    def _batch_url(self) -> str:
+        return f"{self.base_url}/{self.model_name}:batchEmbedContents?key={self.api_key}"
+
+    def _batch_payload(self, texts: List[str]) -> dict:
+        model_ref = self._model_ref()
+        return {
+            "requests": [
+                {"model": model_ref, "content": {"parts": [{"text": text}]}}
+                for text in texts
+            ]
+        }
+
+    @staticmethod
+    def _parse_batch(result: dict, expected: int) -> List[List[float]]:
+        vectors = [item.get("values", []) for item in result.get("embeddings", [])]
+        if len(vectors) != expected or not all(vectors):
+            raise ValueError("Invalid embeddings in Gemini batchEmbedContents response")
+        return vectors
+
+    def _embed_batch(self, texts: List[str]):
+        """
+        调用 batchEmbedContents 批量获取 embedding；接口不可用时返回 None
+        """
+        session = _get_http_session(f"gemini:{self.base_url}")
+        try:
+            response = session.post(self._batch_url(), json=self._batch_payload(texts))
+            if response.status_code == 404:
+                logging.info("Gemini batchEmbedContents not available, falling back to embedContent.")
+                self._batch_supported = False
+                return None
+            response.raise_for_status()
+            self._batch_supported = True
+            return self._parse_batch(response.json(), len(texts))
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Gemini batchEmbedContents request error: {e}\n{traceback.format_exc()}")
+            raise
+
+    async def _aembed_batch(self, texts: List[str]):
+        client = get_async_http_client(f"gemini:{self.base_url}")
+        try:
+            response = await client.post(self._batch_url(), json=self._batch_payload(texts))
+            if response.status_code == 404:
+                logging.info("Gemini batchEmbedContents not available, falling back to embedContent.")
+                self._batch_supported = False
+                return None
+            response.raise_for_status()
+            self._batch_supported = True
+            return self._parse_batch(response.json(), len(texts))
+        except httpx.HTTPError as e:
+            logging.error(f"Gemini batchEmbedContents async request error: {e}\n{traceback.format_exc()}")
+            raise
+
+    async def _aembed_single(self, text: str) -> List[float]:
+        url = f"{self.base_url}/{self.model_name}:embedContent?key={self.api_key}"
+        payload = {
+            "model": self.model_name,
+            "content": {"parts": [{"text": text}]}
+        }
+        client = get_async_http_client(f"gemini:{self.base_url}")
+        try:
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+            embedding = response.json().get("embedding", {}).get("values", [])
+            if not embedding:
+                raise ValueError("Empty embedding in Gemini API response")
+            return embedding
+        except httpx.HTTPError as e:
+            logging.error(f"Gemini embed_content async request error: {e}\n{traceback.format_exc()}")
+            raise
+
     def _embed_single(self, text: str) -> List[float]:
         """
         直接调用 Google Generative Language API (Gemini) 接口，获取文本 embedding
@@ -219,8 +484,7 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
         }
 
         try:
-            response = requests.post(url, json=payload)
-            print(response.text)
+            response = _get_http_session(f"gemini:{self.base_url}").post(url, json=payload)
             response.raise_for_status()
             result = response.json()
             embedding_data = result.get("embedding", {})
@@ -238,12 +502,14 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
 class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 SiliconFlow 的 embedding 适配器
+    embed_documents 使用 OpenAI 风格的数组 input 批量请求
     """
-    def __init__(self, api_key: str, base_url: str, model_name: str):
+    def __init__(self, api_key: str, base_url: str, model_name: str, batch_size: int = DEFAULT_EMBED_BATCH_SIZE):
         # 自动为 base_url 添加 scheme（如果缺失）
         if not base_url.startswith("http://") and not base_url.startswith("https://"):
             base_url = "https://" + base_url
         self.url = base_url if base_url else "https://api.siliconflow.cn/v1/embeddings"
+        self.batch_size = batch_size
 
         self.payload = {
             "model": model_name,
@@ -255,44 +521,24 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
             "Content-Type": "application/json"
         }
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            try:
-                self.payload["input"] = text
-                response = requests.post(self.url, json=self.payload, headers=self.headers, timeout=30)
-                
-                if response.status_code >= 500:
-                    error_msg = f"SiliconFlow API server error (HTTP {response.status_code})"
-                    try:
-                        error_detail = response.json()
-                        error_msg += f": {error_detail}"
-                    except:
-                        error_msg += f": {response.text[:200]}"
-                    logging.error(error_msg)
-                    raise requests.exceptions.HTTPError(error_msg)
-                
-                response.raise_for_status()
-                result = response.json()
-                if not result or "data" not in result or not result["data"]:
-                    raise ValueError(f"Invalid response format from SiliconFlow API: {result}")
-                emb = result["data"][0].get("embedding", [])
-                if not emb:
-                    raise ValueError("Empty embedding in SiliconFlow API response")
-                embeddings.append(emb)
-            except requests.exceptions.RequestException as e:
-                logging.error(f"SiliconFlow API request failed: {str(e)}")
-                raise
-            except (KeyError, IndexError, ValueError, TypeError) as e:
-                logging.error(f"Error parsing SiliconFlow API response: {str(e)}")
-                raise
+    @staticmethod
+    def _parse_embeddings(result: dict, expected: int) -> List[List[float]]:
+        if not result or "data" not in result or not result["data"]:
+            raise ValueError(f"Invalid response format from SiliconFlow API: {result}")
+        # 按 index 还原输入顺序
+        data = sorted(result["data"], key=lambda item: item.get("index", 0))
+        embeddings = [item.get("embedding", []) for item in data]
+        if len(embeddings) != expected or not all(embeddings):
+            raise ValueError("Empty embedding in SiliconFlow API response")
         return embeddings
 
-    def embed_query(self, query: str) -> List[float]:
+    def _post(self, input_value, expected: int) -> List[List[float]]:
         try:
-            self.payload["input"] = query
-            response = requests.post(self.url, json=self.payload, headers=self.headers, timeout=30)
-            
+            # 适配器实例会被多个线程共享，请求体使用局部副本
+            payload = dict(self.payload, input=input_value)
+            session = _get_http_session(f"siliconflow:{self.url}")
+            response = session.post(self.url, json=payload, headers=self.headers, timeout=30)
+
             if response.status_code >= 500:
                 error_msg = f"SiliconFlow API server error (HTTP {response.status_code})"
                 try:
@@ -302,15 +548,9 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
                     error_msg += f": {response.text[:200]}"
                 logging.error(error_msg)
                 raise requests.exceptions.HTTPError(error_msg)
-            
+
             response.raise_for_status()
-            result = response.json()
-            if not result or "data" not in result or not result["data"]:
-                raise ValueError(f"Invalid response format from SiliconFlow API: {result}")
-            embedding = result["data"][0].get("embedding", [])
-            if not embedding:
-                raise ValueError("Empty embedding in SiliconFlow API response")
-            return embedding
+            return self._parse_embeddings(response.json(), expected)
         except requests.exceptions.RequestException as e:
             logging.error(f"SiliconFlow API request failed: {str(e)}")
             raise
@@ -318,6 +558,74 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
             logging.error(f"Error parsing SiliconFlow API response: {str(e)}")
             raise
 
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for batch in _iter_batches(texts, self.batch_size):
+            embeddings.extend(self._post(batch, len(batch)))
+        return embeddings
+
+    def embed_query(self, query: str) -> List[float]:
+        return self._post(query, 1)[0]
+
+    async def _apost(self, input_value, expected: int) -> List[List[float]]:
+        client = get_async_http_client(f"siliconflow:{self.url}")
+        payload = dict(self.payload, input=input_value)
+        try:
+            response = await client.post(self.url, json=payload, headers=self.headers, timeout=30)
+            if response.status_code >= 500:
+                error_msg = f"SiliconFlow API server error (HTTP {response.status_code}): {response.text[:200]}"
+                logging.error(error_msg)
+                raise httpx.HTTPStatusError(error_msg, request=response.request, response=response)
+            response.raise_for_status()
+            return self._parse_embeddings(response.json(), expected)
+        except httpx.HTTPError as e:
+            logging.error(f"SiliconFlow API async request failed: {str(e)}")
+            raise
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = list(_iter_batches(texts, self.batch_size))
+        results = await _agather_bounded(lambda batch: self._apost(batch, len(batch)), batches)
+        return [vec for batch_vectors in results for vec in batch_vectors]
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return (await self._apost(query, 1))[0]
+
+# ---------------- 适配器注册表 ----------------
+_EMBEDDING_REGISTRY_SIZE = 16
+_embedding_registry: "OrderedDict[tuple, BaseEmbeddingAdapter]" = OrderedDict()
+_embedding_registry_lock = threading.Lock()
+
+
+def _embedding_registry_key(interface_format, api_key, base_url, model_name) -> tuple:
+    key_digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    return (
+        (interface_format or "").strip().lower(),
+        (base_url or "").strip(),
+        model_name,
+        key_digest,
+    )
+
+
+def invalidate_embedding_adapters(interface_format: str | None = None, base_url: str | None = None, model_name: str | None = None) -> int:
+    """
+    使缓存的 embedding 适配器失效。参数为 None 表示不限制该字段；全部为 None 时清空注册表。
+    """
+    fmt = interface_format.strip().lower() if interface_format is not None else None
+    url = base_url.strip() if base_url is not None else None
+    with _embedding_registry_lock:
+        doomed = [
+            key for key in _embedding_registry
+            if (fmt is None or key[0] == fmt)
+            and (url is None or key[1] == url)
+            and (model_name is None or key[2] == model_name)
+        ]
+        for key in doomed:
+            _embedding_registry.pop(key, None)
+    if doomed:
+        logging.info(f"[embedding_adapters] Invalidated {len(doomed)} cached adapter(s).")
+    return len(doomed)
+
+
 def create_embedding_adapter(
     interface_format: str,
     api_key: str,
@@ -325,7 +633,30 @@ def create_embedding_adapter(
     model_name: str
 ) -> BaseEmbeddingAdapter:
     """
-    工厂函数：根据 interface_format 返回不同的 embedding 适配器实例
+    工厂函数：根据 interface_format 返回 embedding 适配器实例。
+    相同配置的调用共享同一个缓存实例（见 invalidate_embedding_adapters）。
+    """
+    key = _embedding_registry_key(interface_format, api_key, base_url, model_name)
+    with _embedding_registry_lock:
+        adapter = _embedding_registry.get(key)
+        if adapter is not None:
+            _embedding_registry.move_to_end(key)
+            return adapter
+        adapter = _build_embedding_adapter(interface_format, api_key, base_url, model_name)
+        _embedding_registry[key] = adapter
+        while len(_embedding_registry) > _EMBEDDING_REGISTRY_SIZE:
+            _embedding_registry.popitem(last=False)
+        return adapter
+
+
+def _build_embedding_adapter(
+    interface_format: str,
+    api_key: str,
+    base_url: str,
+    model_name: str
+) -> BaseEmbeddingAdapter:
+    """
+    根据 interface_format 构造新的 embedding 适配器实例
     """
     fmt = interface_format.strip().lower()
     if fmt == "openai":
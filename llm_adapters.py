@@ -1,7 +1,11 @@
 # llm_adapters.py
 # -*- coding: utf-8 -*-
+import asyncio
+import hashlib
 import logging
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional
 from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from pydantic import SecretStr
 from google import genai
@@ -9,7 +13,8 @@ from google.genai import types
 from azure.ai.inference import ChatCompletionsClient
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.inference.models import SystemMessage, UserMessage
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from async_http import get_async_http_client, get_loop_resource
 
 
 def check_base_url(url: str) -> str:
@@ -38,6 +43,113 @@ class BaseLLMAdapter:
     def invoke(self, prompt: str) -> str:
         raise NotImplementedError("Subclasses must implement .invoke(prompt) method.")
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        逐段产出模型输出的文本增量。
+        未实现原生流式接口的后端退化为一次性返回完整结果。
+        """
+        result = self.invoke(prompt)
+        if result:
+            yield result
+
+    async def ainvoke(self, prompt: str) -> str:
+        """
+        异步调用。未实现原生异步接口的后端在线程池中执行同步 invoke。
+        """
+        return await asyncio.to_thread(self.invoke, prompt)
+
+    def _loop_resource(self, name: str, factory):
+        """
+        按事件循环缓存异步客户端：httpx 连接绑定在创建它的事件循环上，不能跨循环复用。
+        已关闭事件循环的客户端由 async_http.get_loop_resource 清理。
+        """
+        cache = self.__dict__.setdefault("_async_resources", {})
+        return get_loop_resource(cache, name, factory)
+
+
+def _content_to_str(content) -> str:
+    """将 langchain 消息的 content（str 或分段 list）统一转换为字符串"""
+    if isinstance(content, str):
+        return content
+    elif isinstance(content, list):
+        return str(content)
+    return ""
+
+
+def _stream_langchain_chat(client, prompt: str) -> Iterator[str]:
+    """ChatOpenAI / AzureChatOpenAI 共用的流式输出实现"""
+    for chunk in client.stream(prompt):
+        text = _content_to_str(getattr(chunk, "content", ""))
+        if text:
+            yield text
+
+
+def _async_chat_openai(adapter):
+    """为 ChatOpenAI 类适配器构造绑定共享连接池的异步客户端"""
+    return adapter._loop_resource("chat", lambda: ChatOpenAI(
+        model=adapter.model_name,
+        api_key=SecretStr(adapter.api_key),
+        base_url=adapter.base_url,
+        max_completion_tokens=adapter.max_tokens,
+        temperature=adapter.temperature,
+        timeout=adapter.timeout,
+        http_async_client=get_async_http_client(f"openai:{adapter.base_url}", adapter.timeout)
+    ))
+
+
+async def _ainvoke_langchain_chat(client, prompt: str, adapter_name: str) -> str:
+    response = await client.ainvoke(prompt)
+    if not response:
+        logging.warning(f"No response from {adapter_name}.")
+        return ""
+    return _content_to_str(response.content)
+
+
+def _async_openai_sdk(adapter):
+    """火山引擎、硅基流动使用的 AsyncOpenAI 客户端（共享连接池）"""
+    base_url = str(adapter._client.base_url)
+    return adapter._loop_resource("openai_sdk", lambda: AsyncOpenAI(
+        base_url=base_url,
+        api_key=adapter.api_key,
+        timeout=adapter.timeout,
+        http_client=get_async_http_client(f"openai:{base_url}", adapter.timeout)
+    ))
+
+
+async def _ainvoke_openai_chat(client, model_name: str, prompt: str, timeout) -> str:
+    response = await client.chat.completions.create(
+        model=model_name,
+        messages=[
+            {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+            {"role": "user", "content": prompt},
+        ],
+        timeout=timeout
+    )
+    if response and response.choices:
+        content = response.choices[0].message.content
+        return content if content is not None else ""
+    return ""
+
+
+def _stream_openai_chat(client, model_name: str, prompt: str, timeout) -> Iterator[str]:
+    """openai SDK（火山引擎、硅基流动）共用的流式输出实现"""
+    response = client.chat.completions.create(
+        model=model_name,
+        messages=[
+            {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+            {"role": "user", "content": prompt},
+        ],
+        timeout=timeout,
+        stream=True
+    )
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        text = getattr(delta, "content", None) if delta else None
+        if text:
+            yield text
+
 class DeepSeekAdapter(BaseLLMAdapter):
     """
     适配官方/OpenAI兼容接口（使用 langchain.ChatOpenAI）
@@ -72,6 +184,13 @@ class DeepSeekAdapter(BaseLLMAdapter):
             return str(content)
         return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from _stream_langchain_chat(self._client, prompt)
+
+    async def ainvoke(self, prompt: str) -> str:
+        return await _ainvoke_langchain_chat(_async_chat_openai(self), prompt, "DeepSeekAdapter")
+
+
 class OpenAIAdapter(BaseLLMAdapter):
     """
     适配官方/OpenAI兼容接口（使用 langchain.ChatOpenAI）
@@ -107,6 +226,13 @@ class OpenAIAdapter(BaseLLMAdapter):
             return str(content)
         return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from _stream_langchain_chat(self._client, prompt)
+
+    async def ainvoke(self, prompt: str) -> str:
+        return await _ainvoke_langchain_chat(_async_chat_openai(self), prompt, "OpenAIAdapter")
+
+
 class GeminiAdapter(BaseLLMAdapter):
     """
     适配 Google Gemini (Google Generative AI) 接口
@@ -142,6 +268,37 @@ class GeminiAdapter(BaseLLMAdapter):
             logging.error(f"Gemini API (google-genai) 调用失败: {e}")
             return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                max_output_tokens=self.max_tokens,
+                temperature=self.temperature,
+            )
+        ):
+            if chunk and chunk.text:
+                yield chunk.text
+
+    async def ainvoke(self, prompt: str) -> str:
+        try:
+            response = await self._client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    max_output_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                )
+            )
+            if response and response.text:
+                return response.text
+            logging.warning("No text response from Gemini API.")
+            return ""
+        except Exception as e:
+            logging.error(f"Gemini API (google-genai) 异步调用失败: {e}")
+            return ""
+
+
 class AzureOpenAIAdapter(BaseLLMAdapter):
     """
     适配 Azure OpenAI 接口（使用 langchain.ChatOpenAI）
@@ -186,6 +343,22 @@ class AzureOpenAIAdapter(BaseLLMAdapter):
             return str(content)
         return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from _stream_langchain_chat(self._client, prompt)
+
+    async def ainvoke(self, prompt: str) -> str:
+        client = self._loop_resource("chat", lambda: AzureChatOpenAI(
+            azure_endpoint=self.azure_endpoint,
+            azure_deployment=self.azure_deployment,
+            api_version=self.api_version,
+            api_key=SecretStr(self.api_key),
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            timeout=self.timeout,
+            http_async_client=get_async_http_client(f"azure:{self.azure_endpoint}", self.timeout)
+        ))
+        return await _ainvoke_langchain_chat(client, prompt, "AzureOpenAIAdapter")
+
 
 class OllamaAdapter(BaseLLMAdapter):
     """
@@ -225,6 +398,12 @@ class OllamaAdapter(BaseLLMAdapter):
             return str(content)
         return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from _stream_langchain_chat(self._client, prompt)
+
+    async def ainvoke(self, prompt: str) -> str:
+        return await _ainvoke_langchain_chat(_async_chat_openai(self), prompt, "OllamaAdapter")
+
 
 class MLStudioAdapter(BaseLLMAdapter):
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
@@ -262,6 +441,16 @@ class MLStudioAdapter(BaseLLMAdapter):
             logging.error(f"ML Studio API 调用超时或失败: {e}")
             return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from _stream_langchain_chat(self._client, prompt)
+
+    async def ainvoke(self, prompt: str) -> str:
+        try:
+            return await _ainvoke_langchain_chat(_async_chat_openai(self), prompt, "MLStudioAdapter")
+        except Exception as e:
+            logging.error(f"ML Studio API 调用超时或失败: {e}")
+            return ""
+
 
 class AzureAIAdapter(BaseLLMAdapter):
     """
@@ -313,6 +502,24 @@ class AzureAIAdapter(BaseLLMAdapter):
             logging.error(f"Azure AI Inference API 调用失败: {e}")
             return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        response = self._client.complete(
+            stream=True,
+            messages=[
+                SystemMessage("You are a helpful assistant."),
+                UserMessage(prompt)
+            ]
+        )
+        try:
+            for update in response:
+                if update.choices and update.choices[0].delta:
+                    text = update.choices[0].delta.content
+                    if text:
+                        yield text
+        finally:
+            response.close()
+
+
 # 火山引擎实现
 class VolcanoEngineAIAdapter(BaseLLMAdapter):
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
@@ -348,6 +555,16 @@ class VolcanoEngineAIAdapter(BaseLLMAdapter):
             logging.error(f"火山引擎API调用超时或失败: {e}")
             return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from _stream_openai_chat(self._client, self.model_name, prompt, self.timeout)
+
+    async def ainvoke(self, prompt: str) -> str:
+        try:
+            return await _ainvoke_openai_chat(_async_openai_sdk(self), self.model_name, prompt, self.timeout)
+        except Exception as e:
+            logging.error(f"火山引擎API调用超时或失败: {e}")
+            return ""
+
 
 class SiliconFlowAdapter(BaseLLMAdapter):
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
@@ -384,6 +601,60 @@ class SiliconFlowAdapter(BaseLLMAdapter):
             logging.error(f"硅基流动API调用超时或失败: {e}")
             return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield from _stream_openai_chat(self._client, self.model_name, prompt, self.timeout)
+
+    async def ainvoke(self, prompt: str) -> str:
+        try:
+            return await _ainvoke_openai_chat(_async_openai_sdk(self), self.model_name, prompt, self.timeout)
+        except Exception as e:
+            logging.error(f"硅基流动API调用超时或失败: {e}")
+            return ""
+
+
+# ---------------- 适配器注册表 ----------------
+# 按完整配置缓存适配器实例，复用底层 SDK 客户端的连接池与 TLS 会话。
+# 各 SDK 客户端本身是线程安全的，同一实例可被多个工作线程并发调用。
+_ADAPTER_REGISTRY_SIZE = 32
+_adapter_registry: "OrderedDict[tuple, BaseLLMAdapter]" = OrderedDict()
+_adapter_registry_lock = threading.Lock()
+
+
+def _llm_registry_key(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout) -> tuple:
+    # api_key 只以摘要形式参与缓存键，避免在内存结构中散落明文副本
+    key_digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    return (
+        (interface_format or "").strip().lower(),
+        (base_url or "").strip(),
+        model_name,
+        temperature,
+        max_tokens,
+        timeout,
+        key_digest,
+    )
+
+
+def invalidate_llm_adapters(interface_format: str | None = None, base_url: str | None = None, model_name: str | None = None) -> int:
+    """
+    使缓存的适配器失效。参数为 None 表示不限制该字段；全部为 None 时清空注册表。
+    返回被移除的实例数量。
+    """
+    fmt = interface_format.strip().lower() if interface_format is not None else None
+    url = base_url.strip() if base_url is not None else None
+    with _adapter_registry_lock:
+        doomed = [
+            key for key in _adapter_registry
+            if (fmt is None or key[0] == fmt)
+            and (url is None or key[1] == url)
+            and (model_name is None or key[2] == model_name)
+        ]
+        for key in doomed:
+            _adapter_registry.pop(key, None)
+    if doomed:
+        logging.info(f"[llm_adapters] Invalidated {len(doomed)} cached adapter(s).")
+    return len(doomed)
+
+
 def create_llm_adapter(
     interface_format: str,
     base_url: str,
@@ -394,7 +665,33 @@ def create_llm_adapter(
     timeout: int
 ) -> BaseLLMAdapter:
     """
-    工厂函数：根据 interface_format 返回不同的适配器实例。
+    工厂函数：根据 interface_format 返回适配器实例。
+    相同配置的调用共享同一个缓存实例（见 invalidate_llm_adapters）。
+    """
+    key = _llm_registry_key(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+    with _adapter_registry_lock:
+        adapter = _adapter_registry.get(key)
+        if adapter is not None:
+            _adapter_registry.move_to_end(key)
+            return adapter
+        adapter = _build_llm_adapter(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+        _adapter_registry[key] = adapter
+        while len(_adapter_registry) > _ADAPTER_REGISTRY_SIZE:
+            _adapter_registry.popitem(last=False)
+        return adapter
+
+
+def _build_llm_adapter(
+    interface_format: str,
+    base_url: str,
+    model_name: str,
+    api_key: str,
+    temperature: float,
+    max_tokens: int,
+    timeout: int
+) -> BaseLLMAdapter:
+    """
+    根据 interface_format 构造新的适配器实例。
     """
     fmt = interface_format.strip().lower()
     if fmt == "deepseek":
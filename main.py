@@ -1,5 +1,6 @@
 # main.py
 # -*- coding: utf-8 -*-
+import multiprocessing
 import customtkinter as ctk
 from ui import NovelGeneratorGUI
 
@@ -9,4 +10,6 @@ def main():
     app.mainloop()
 
 if __name__ == "__main__":
+    # 知识库批量导入使用进程池，打包为可执行文件后需要此调用
+    multiprocessing.freeze_support()
     main()
@@ -12,6 +12,8 @@ from .chapter import (
     refine_chapter_detail,
 )
 from .finalization import finalize_chapter, enrich_chapter_text
-from .knowledge import import_knowledge_file
+from .knowledge import import_knowledge_file, import_knowledge_files, list_knowledge_files, format_import_report
 from .vectorstore_utils import clear_vector_store
-from .qa import answer_novel_question
\ No newline at end of file
+from .vectorstore_rebuild import rebuild_vector_store
+from .qa import answer_novel_question
+from .project_state import ProjectState, get_project_state
\ No newline at end of file
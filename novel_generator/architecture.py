@@ -23,7 +23,7 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
-from utils import clear_file_content, save_string_to_txt
+from novel_generator.project_state import ARCHITECTURE, CHARACTER_STATE, get_project_state
 
 def load_partial_architecture_data(filepath: str) -> dict:
     """
@@ -139,9 +139,7 @@ def Novel_architecture_generate(
             save_partial_architecture_data(filepath, partial_data)
             return
         partial_data["character_state_result"] = character_state_init
-        character_state_file = os.path.join(filepath, "character_state.txt")
-        clear_file_content(character_state_file)
-        save_string_to_txt(character_state_init, character_state_file)
+        get_project_state(filepath).write(CHARACTER_STATE, character_state_init)
         save_partial_architecture_data(filepath, partial_data)
         logging.info("Initial character state created and saved.")
     # Step3: 世界观
@@ -197,9 +195,7 @@ def Novel_architecture_generate(
         f"{plot_arch_result}\n"
     )
 
-    arch_file = os.path.join(filepath, "Novel_architecture.txt")
-    clear_file_content(arch_file)
-    save_string_to_txt(final_content, arch_file)
+    get_project_state(filepath).write(ARCHITECTURE, final_content)
     logging.info("Novel_architecture.txt has been generated successfully.")
 
     partial_arch_file = os.path.join(filepath, "partial_architecture.json")
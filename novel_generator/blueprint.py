@@ -9,7 +9,8 @@ import logging
 from novel_generator.common import invoke_with_cleaning
 from llm_adapters import create_llm_adapter
 from prompt_definitions import chapter_blueprint_prompt, chunked_chapter_blueprint_prompt, continue_chapter_blueprint_prompt
-from utils import read_file, clear_file_content, save_string_to_txt
+from chapter_directory_parser import tail_chapters
+from novel_generator.project_state import ARCHITECTURE, DIRECTORY, get_project_state
 logging.basicConfig(
     filename='app.log',      # 日志文件名
     filemode='a',            # 追加模式（'w' 会覆盖）
@@ -37,15 +38,9 @@ def compute_chunk_size(number_of_chapters: int, max_tokens: int) -> int:
 def limit_chapter_blueprint(blueprint_text: str, limit_chapters: int = 100) -> str:
     """
     从已有章节目录中只取最近的 limit_chapters 章，以避免 prompt 超长。
+    只从文本末尾向前查找行首的“第X章”，不再对全文做正则切分。
     """
-    pattern = r"(第\s*\d+\s*章.*?)(?=第\s*\d+\s*章|$)"
-    chapters = re.findall(pattern, blueprint_text, flags=re.DOTALL)
-    if not chapters:
-        return blueprint_text
-    if len(chapters) <= limit_chapters:
-        return blueprint_text
-    selected = chapters[-limit_chapters:]
-    return "\n\n".join(selected).strip()
+    return tail_chapters(blueprint_text, limit_chapters)
 
 def Chapter_blueprint_generate(
     interface_format: str,
@@ -68,12 +63,12 @@ def Chapter_blueprint_generate(
       - 若章节数 > chunk_size，进行分块生成
     生成完成后输出至 Novel_directory.txt。
     """
-    arch_file = os.path.join(filepath, "Novel_architecture.txt")
-    if not os.path.exists(arch_file):
+    state = get_project_state(filepath)
+    if not state.exists(ARCHITECTURE):
         logging.warning("Novel_architecture.txt not found. Please generate architecture first.")
         return
 
-    architecture_text = read_file(arch_file).strip()
+    architecture_text = state.architecture.strip()
     if not architecture_text:
         logging.warning("Novel_architecture.txt is empty.")
         return
@@ -88,20 +83,20 @@ def Chapter_blueprint_generate(
         timeout=timeout
     )
 
-    filename_dir = os.path.join(filepath, "Novel_directory.txt")
-    if not os.path.exists(filename_dir):
-        open(filename_dir, "w", encoding="utf-8").close()
+    if not state.exists(DIRECTORY):
+        state.clear(DIRECTORY)
 
-    existing_blueprint = read_file(filename_dir).strip()
+    existing_blueprint = state.directory.strip()
     chunk_size = compute_chunk_size(number_of_chapters, max_tokens)
     logging.info(f"Number of chapters = {number_of_chapters}, computed chunk_size = {chunk_size}.")
 
     if existing_blueprint:
         logging.info("Detected existing blueprint content. Will resume chunked generation from that point.")
-        pattern = r"第\s*(\d+)\s*章"
-        existing_chapter_numbers = re.findall(pattern, existing_blueprint)
-        existing_chapter_numbers = [int(x) for x in existing_chapter_numbers if x.isdigit()]
-        max_existing_chap = max(existing_chapter_numbers) if existing_chapter_numbers else 0
+        max_existing_chap = state.blueprint_index().max_chapter
+        if not max_existing_chap:
+            # 标题不是“第X章 - 标题”格式时按全文中出现的章号判断
+            existing_chapter_numbers = [int(x) for x in re.findall(r"第\s*(\d+)\s*章", existing_blueprint)]
+            max_existing_chap = max(existing_chapter_numbers) if existing_chapter_numbers else 0
         logging.info(f"Existing blueprint indicates up to chapter {max_existing_chap} has been generated.")
         final_blueprint = existing_blueprint
         current_start = max_existing_chap + 1
@@ -120,12 +115,10 @@ def Chapter_blueprint_generate(
             chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
             if not chunk_result.strip():
                 logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
-                clear_file_content(filename_dir)
-                save_string_to_txt(final_blueprint.strip(), filename_dir)
+                state.write(DIRECTORY, final_blueprint.strip())
                 return
             final_blueprint += "\n\n" + chunk_result.strip()
-            clear_file_content(filename_dir)
-            save_string_to_txt(final_blueprint.strip(), filename_dir)
+            state.write(DIRECTORY, final_blueprint.strip())
             current_start = current_end + 1
 
         logging.info("All chapters blueprint have been generated (resumed chunked).")
@@ -142,8 +135,7 @@ def Chapter_blueprint_generate(
             logging.warning("Chapter blueprint generation result is empty.")
             return
 
-        clear_file_content(filename_dir)
-        save_string_to_txt(blueprint_text, filename_dir)
+        state.write(DIRECTORY, blueprint_text)
         logging.info("Novel_directory.txt (chapter blueprint) has been generated successfully (single-shot).")
         return
 
@@ -165,15 +157,13 @@ def Chapter_blueprint_generate(
         chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
         if not chunk_result.strip():
             logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
-            clear_file_content(filename_dir)
-            save_string_to_txt(final_blueprint.strip(), filename_dir)
+            state.write(DIRECTORY, final_blueprint.strip())
             return
         if final_blueprint.strip():
             final_blueprint += "\n\n" + chunk_result.strip()
         else:
             final_blueprint = chunk_result.strip()
-        clear_file_content(filename_dir)
-        save_string_to_txt(final_blueprint.strip(), filename_dir)
+        state.write(DIRECTORY, final_blueprint.strip())
         current_start = current_end + 1
 
     logging.info("Novel_directory.txt (chapter blueprint) has been generated successfully (chunked).")
@@ -196,12 +186,12 @@ def continue_chapter_blueprint(
     """
     根据现有架构和目录信息生成后续章节的目录
     """
-    arch_file = os.path.join(filepath, "Novel_architecture.txt")
-    if not os.path.exists(arch_file):
+    state = get_project_state(filepath)
+    if not state.exists(ARCHITECTURE):
         logging.warning("Novel_architecture.txt not found. Please generate architecture first.")
         return ""
 
-    architecture_text = read_file(arch_file).strip()
+    architecture_text = state.architecture.strip()
     if not architecture_text:
         logging.warning("Novel_architecture.txt is empty.")
         return ""
@@ -217,10 +207,7 @@ def continue_chapter_blueprint(
     )
 
     # 读取现有目录
-    filename_dir = os.path.join(filepath, "Novel_directory.txt")
-    existing_blueprint = ""
-    if os.path.exists(filename_dir):
-        existing_blueprint = read_file(filename_dir).strip()
+    existing_blueprint = state.directory.strip()
 
     # 限制现有目录长度，避免prompt过长
     limited_blueprint = limit_chapter_blueprint(existing_blueprint, 100)
@@ -252,8 +239,7 @@ def continue_chapter_blueprint(
         final_blueprint = result.strip()
 
     # 保存到文件
-    clear_file_content(filename_dir)
-    save_string_to_txt(final_blueprint.strip(), filename_dir)
+    state.write(DIRECTORY, final_blueprint.strip())
 
     return result.strip()
 
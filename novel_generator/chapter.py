@@ -7,6 +7,8 @@ import os
 import re
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from llm_adapters import create_llm_adapter
 from prompt_definitions import (
     first_chapter_draft_prompt, 
@@ -21,11 +23,17 @@ from prompt_definitions import (
     ACTIVE_VERIFICATION_PLANNER_PROMPT, # 新增
     ACTIVE_VERIFICATION_RULE_MAKER_PROMPT # 新增
 )
-from chapter_directory_parser import get_chapter_info_from_blueprint
-from novel_generator.common import invoke_with_cleaning
-from utils import extract_relevant_segments, read_file, clear_file_content, save_string_to_txt
+from novel_generator.project_state import DIRECTORY, get_project_state
+from novel_generator.chapter_summaries import RECENT_SUMMARY_CHAPTERS, SUMMARY_CONTEXT_TOKEN_BUDGET, get_summary_context
+from novel_generator.common import invoke_with_cleaning, stream_with_cleaning
+from novel_generator.embedding_cache import create_cached_embedding_adapter
+from novel_generator.llm_cache import peek_response_cache
+from utils import extract_relevant_segments, read_file_tail, clear_file_content, save_string_to_txt
 from novel_generator.vectorstore_utils import (
     get_relevant_context_from_vector_store,
+    hybrid_search_many,
+    join_documents,
+    mmr_pack,
     load_vector_store  # 添加导入
 )
 logging.basicConfig(
@@ -36,6 +44,19 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# build_chapter_prompt 中并发执行的上下文构建阶段数上限
+CONTEXT_STAGE_WORKERS = 3
+# 主动验证中并发制定规则的问题数上限
+VERIFICATION_WORKERS = 3
+# 知识库检索的近因加权系数（0 表示不加权）
+RETRIEVAL_RECENCY_WEIGHT = 0.3
+# 送入知识过滤的检索片段总 token 预算（MMR 去冗余后装入）
+KNOWLEDGE_CONTEXT_TOKEN_BUDGET = 2400
+# 前文摘要只使用最近几章合并后的末尾这么多字符，每章也只需读取这么长的结尾
+RECENT_CHAPTERS_MAX_CHARS = 4000
+# 上一章结尾摘录的字符数
+PREVIOUS_EXCERPT_CHARS = 800
+
 def extract_entity_lock_list(
     character_state_text: str,
     characters_involved: str,
@@ -233,19 +254,42 @@ def extract_character_relationships(character_state_text: str) -> str:
     
     return "\n".join(result_lines)
 
-def get_last_n_chapters_text(chapters_dir: str, current_chapter_num: int, n: int = 3) -> list:
+_excerpt_cache: dict = {}  # (章节文件绝对路径, 字符数) -> ((mtime_ns, size), 结尾文本)
+_excerpt_lock = threading.Lock()
+
+
+def get_chapter_tail(chap_file: str, max_chars: int) -> str:
+    """
+    章节文件去除首尾空白后的最后 max_chars 个字符。只从文件末尾读取所需部分，
+    结果按文件修改时间与大小缓存，章节被改写后自动失效。
+    """
+    try:
+        st = os.stat(chap_file)
+    except OSError:
+        return ""
+    key = (os.path.abspath(chap_file), max_chars)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _excerpt_lock:
+        cached = _excerpt_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    text = read_file_tail(chap_file, max_chars)
+    with _excerpt_lock:
+        _excerpt_cache[key] = (stamp, text)
+    return text
+
+
+def get_last_n_chapters_text(chapters_dir: str, current_chapter_num: int, n: int = 3,
+                             max_chars: int = RECENT_CHAPTERS_MAX_CHARS) -> list:
     """
     从目录 chapters_dir 中获取最近 n 章的文本内容，返回文本列表。
+    调用方只使用合并文本的末尾，因此每章只读取最后 max_chars 个字符。
     """
     texts = []
     start_chap = max(1, current_chapter_num - n)
     for c in range(start_chap, current_chapter_num):
         chap_file = os.path.join(chapters_dir, f"chapter_{c}.txt")
-        if os.path.exists(chap_file):
-            text = read_file(chap_file).strip()
-            texts.append(text)
-        else:
-            texts.append("")
+        texts.append(get_chapter_tail(chap_file, max_chars))
     return texts
 
 def summarize_recent_chapters(
@@ -264,19 +308,20 @@ def summarize_recent_chapters(
     character_relationships: str = "",  # 新增：角色关系网
     previous_chapter_excerpt: str = "", # 新增：上一章结尾内容
     user_guidance: str = "",     # 新增：用户指导
-    timeout: int = 600
+    timeout: int = 600,
+    recent_chapter_summaries: str = ""  # 最近几章的已存单章摘要
 ) -> str:  # 修改返回值类型为 str，不再是 tuple
     """
-    根据前三章内容生成当前章节的精准摘要。(支持伏笔注入)
+    根据全局摘要、近期已存的单章摘要与上一章结尾生成当前章节的精准摘要。(支持伏笔注入)
     如果解析失败，则返回空字符串。
     """
     try:
         combined_text = "\n".join(chapters_text_list).strip()
-        if not combined_text and not global_summary:
+        if not combined_text and not global_summary and not recent_chapter_summaries:
             return ""
             
         # 限制组合文本长度
-        max_combined_length = 4000
+        max_combined_length = RECENT_CHAPTERS_MAX_CHARS
         if len(combined_text) > max_combined_length:
             combined_text = combined_text[-max_combined_length:]
 
@@ -284,12 +329,10 @@ def summarize_recent_chapters(
         foreshadowing_text = "（暂无伏笔记录）"
         if filepath:
             try:
-                record_file = os.path.join(filepath, "foreshadowing_records.txt")
-                if os.path.exists(record_file):
-                    content = read_file(record_file).strip()
-                    if content:
-                        # 截取最后 3000 字符防止 Token 溢出，或者根据模型窗口决定
-                        foreshadowing_text = content[-3000:] if len(content) > 3000 else content
+                content = get_project_state(filepath).foreshadowing.strip()
+                if content:
+                    # 截取最后 3000 字符防止 Token 溢出，或者根据模型窗口决定
+                    foreshadowing_text = content[-3000:] if len(content) > 3000 else content
             except Exception as e:
                 logging.warning(f"摘要生成时读取伏笔库失败: {e}")
             
@@ -317,6 +360,7 @@ def summarize_recent_chapters(
         summarize_prompt_values = {
             "global_summary": global_summary,
             "previous_chapter_excerpt": previous_chapter_excerpt,
+            "recent_chapter_summaries": recent_chapter_summaries or "（暂无）",
             "user_guidance": user_guidance,  # 新增用户指导参数
             "novel_number": novel_number,
             "chapter_title": chapter_info.get("chapter_title", "未命名"),
@@ -364,7 +408,7 @@ def summarize_recent_chapters(
         # 这样可以防止下一章的信息泄露到 summarize_recent_chapters_prompt 中
         prompt = summarize_recent_chapters_prompt.format_map(_SafeDict(summarize_prompt_values))
         
-        response_text = invoke_with_cleaning(llm_adapter, prompt)
+        response_text = invoke_with_cleaning(llm_adapter, prompt, cache_dir=filepath, stage="recent_summary")
         
         # 如果您有 extract_summary_from_response 函数，可以使用它
         # 如果没有，直接使用 response_text 也是安全的，因为 Prompt 已经要求直接输出了
@@ -527,7 +571,7 @@ def get_filtered_knowledge_context(
             retrieved_texts=all_retrieved_text
         )
         
-        filtered_content = invoke_with_cleaning(llm_adapter, prompt)
+        filtered_content = invoke_with_cleaning(llm_adapter, prompt, cache_dir=filepath, stage="knowledge_filter")
         return filtered_content if filtered_content else "（知识内容过滤后为空）"
         
     except Exception as e:
@@ -575,17 +619,18 @@ def build_chapter_prompt(
     3. 集成提示词应用规则
     """
     # 读取基础文件
-    arch_file = os.path.join(filepath, "Novel_architecture.txt")
-    novel_architecture_text = read_file(arch_file)
-    directory_file = os.path.join(filepath, "Novel_directory.txt")
-    blueprint_text = read_file(directory_file)
-    global_summary_file = os.path.join(filepath, "global_summary.txt")
-    global_summary_text = read_file(global_summary_file)
-    character_state_file = os.path.join(filepath, "character_state.txt")
-    character_state_text = read_file(character_state_file)
+    state = get_project_state(filepath)
+    novel_architecture_text = state.architecture
+    blueprint_index = state.blueprint_index()
+    # 分层前情：梗概 + 最近分卷 + 近期章节摘要，按 token 预算组合
+    long_term_summary, recent_summaries = get_summary_context(
+        filepath, novel_number, SUMMARY_CONTEXT_TOKEN_BUDGET, RECENT_SUMMARY_CHAPTERS, state.global_summary
+    )
+    global_summary_text = "\n\n".join(part for part in (long_term_summary, recent_summaries) if part)
+    character_state_text = state.character_state
     
     # 获取章节信息
-    chapter_info = get_chapter_info_from_blueprint(blueprint_text, novel_number)
+    chapter_info = blueprint_index.chapter_info(novel_number)
     chapter_title = chapter_info["chapter_title"]
     chapter_role = chapter_info["chapter_role"]
     chapter_purpose = chapter_info["chapter_purpose"]
@@ -596,7 +641,7 @@ def build_chapter_prompt(
 
     # 获取下一章节信息
     next_chapter_number = novel_number + 1
-    next_chapter_info = get_chapter_info_from_blueprint(blueprint_text, next_chapter_number)
+    next_chapter_info = blueprint_index.chapter_info(next_chapter_number)
     next_chapter_title = next_chapter_info.get("chapter_title", "（未命名）")
     next_chapter_role = next_chapter_info.get("chapter_role", "过渡章节")
     next_chapter_purpose = next_chapter_info.get("chapter_purpose", "承上启下")
@@ -629,14 +674,11 @@ def build_chapter_prompt(
             novel_setting=novel_architecture_text
         )
 
-    # 获取前文内容和摘要
-    recent_texts = get_last_n_chapters_text(chapters_dir, novel_number, n=3)
-    
-    # 获取前一章结尾（增加长度以更好衔接上下文）
+    # 获取前一章结尾（增加长度以更好衔接上下文）；只读取章节文件末尾
     previous_excerpt = ""
-    for text in reversed(recent_texts):
-        if text.strip():
-            previous_excerpt = text[-800:] if len(text) > 800 else text
+    for c in range(novel_number - 1, max(0, novel_number - 1 - RECENT_SUMMARY_CHAPTERS), -1):
+        previous_excerpt = get_chapter_tail(os.path.join(chapters_dir, f"chapter_{c}.txt"), PREVIOUS_EXCERPT_CHARS)
+        if previous_excerpt:
             break
     
     # 提取角色关系网
@@ -651,14 +693,15 @@ def build_chapter_prompt(
             model_name=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
-            chapters_text_list=recent_texts,
+            chapters_text_list=[previous_excerpt],
             novel_number=novel_number,
             chapter_info=chapter_info,
             next_chapter_info=next_chapter_info,
             filepath=filepath,  # 【修复】添加filepath参数以支持伏笔库注入
-            global_summary=global_summary_text,
+            global_summary=long_term_summary,
             character_relationships=character_relationships_summary,  # 新增关系网参数
             previous_chapter_excerpt=previous_excerpt,  # 新增参数：上一章结尾内容
+            recent_chapter_summaries=recent_summaries,
             user_guidance=user_guidance,  # 新增参数：用户指导
             timeout=timeout
         )
@@ -667,163 +710,186 @@ def build_chapter_prompt(
         logging.error(f"Error in summarize_recent_chapters: {str(e)}")
         short_summary = "（摘要生成失败）"
 
+    # 以下三个阶段（知识库检索过滤、主动验证、人物卡）只依赖 short_summary，
+    # 彼此独立，放入有界线程池并发执行，最后统一汇合。
+
     # ================= 4. 知识库检索与过滤 =================
-    filtered_context = "（无相关知识库内容，请基于前文设定创作）"
-    try:
-        from embedding_adapters import create_embedding_adapter
-        embedding_adapter = create_embedding_adapter(
-            embedding_interface_format,
-            embedding_api_key,
-            embedding_url,
-            embedding_model_name
-        )
-        store = load_vector_store(embedding_adapter, filepath)
-        if store and store._collection.count() > 0:
-            llm_adapter = create_llm_adapter(
-                interface_format=interface_format,
-                base_url=base_url,
-                model_name=model_name,
-                api_key=api_key,
-                temperature=0.2,
-                max_tokens=max_tokens,
-                timeout=timeout
-            )
-            search_prompt = knowledge_search_prompt.format(
-                chapter_number=novel_number,
-                chapter_title=chapter_title,
-                characters_involved=characters_involved,
-                key_items=key_items,
-                scene_location=scene_location,
-                chapter_role=chapter_role,
-                chapter_purpose=chapter_purpose,
-                foreshadowing=foreshadowing,
-                short_summary=short_summary,
-                user_guidance=user_guidance or "（无）",
-                time_constraint=time_constraint or "（无）"
+    def _build_filtered_context() -> str:
+        filtered_context = "（无相关知识库内容，请基于前文设定创作）"
+        try:
+            embedding_adapter = create_cached_embedding_adapter(
+                embedding_interface_format,
+                embedding_api_key,
+                embedding_url,
+                embedding_model_name,
+                filepath
             )
-            search_response = invoke_with_cleaning(llm_adapter, search_prompt)
-            keyword_groups = parse_search_keywords(search_response)
-            all_contexts = []
-            actual_k = min(embedding_retrieval_k, max(1, store._collection.count()))
-            for group in keyword_groups[:6]:
-                raw = get_relevant_context_from_vector_store(
-                    embedding_adapter, group, filepath, k=max(2, actual_k)
-                )
-                if raw:
-                    all_contexts.append(raw)
-            if all_contexts:
-                processed = apply_content_rules(all_contexts, novel_number)
-                chapter_info_for_filter = {
-                    "chapter_number": novel_number,
-                    "chapter_title": chapter_title,
-                    "chapter_role": chapter_role,
-                    "chapter_purpose": chapter_purpose,
-                    "characters_involved": characters_involved,
-                    "key_items": key_items,
-                    "scene_location": scene_location,
-                }
-                filtered_context = get_filtered_knowledge_context(
-                    api_key=api_key,
+            store = load_vector_store(embedding_adapter, filepath)
+            if store and store.count() > 0:
+                llm_adapter = create_llm_adapter(
+                    interface_format=interface_format,
                     base_url=base_url,
                     model_name=model_name,
-                    interface_format=interface_format,
-                    filepath=filepath,
-                    chapter_info=chapter_info_for_filter,
-                    retrieved_texts=processed,
-                    author_implicit_settings=user_guidance or "",
+                    api_key=api_key,
+                    temperature=0.2,
                     max_tokens=max_tokens,
                     timeout=timeout
                 )
-    except Exception as e:
-        logging.warning(f"Knowledge retrieval/filter failed: {e}")
+                search_prompt = knowledge_search_prompt.format(
+                    chapter_number=novel_number,
+                    chapter_title=chapter_title,
+                    characters_involved=characters_involved,
+                    key_items=key_items,
+                    scene_location=scene_location,
+                    chapter_role=chapter_role,
+                    chapter_purpose=chapter_purpose,
+                    foreshadowing=foreshadowing,
+                    short_summary=short_summary,
+                    user_guidance=user_guidance or "（无）",
+                    time_constraint=time_constraint or "（无）"
+                )
+                search_response = invoke_with_cleaning(llm_adapter, search_prompt, cache_dir=filepath, stage="knowledge_search")
+                keyword_groups = parse_search_keywords(search_response)
+                actual_k = min(embedding_retrieval_k, max(1, store.count()))
+                # 全部关键词组一次批量混合检索；只检索本章之前的章节与知识文件，近章优先
+                _, union = hybrid_search_many(
+                    embedding_adapter, keyword_groups[:6], filepath, k=max(2, actual_k),
+                    before_chapter=novel_number, recency_weight=RETRIEVAL_RECENCY_WEIGHT
+                )
+                # 各组结果常大量重叠：MMR 去冗余并限制总长度，缩短知识过滤提示词
+                packed = mmr_pack(
+                    embedding_adapter, keyword_groups[:6], union, filepath,
+                    token_budget=KNOWLEDGE_CONTEXT_TOKEN_BUDGET
+                )
+                all_contexts = [doc.page_content for doc in packed]
+                if all_contexts:
+                    processed = apply_content_rules(all_contexts, novel_number)
+                    chapter_info_for_filter = {
+                        "chapter_number": novel_number,
+                        "chapter_title": chapter_title,
+                        "chapter_role": chapter_role,
+                        "chapter_purpose": chapter_purpose,
+                        "characters_involved": characters_involved,
+                        "key_items": key_items,
+                        "scene_location": scene_location,
+                    }
+                    filtered_context = get_filtered_knowledge_context(
+                        api_key=api_key,
+                        base_url=base_url,
+                        model_name=model_name,
+                        interface_format=interface_format,
+                        filepath=filepath,
+                        chapter_info=chapter_info_for_filter,
+                        retrieved_texts=processed,
+                        author_implicit_settings=user_guidance or "",
+                        max_tokens=max_tokens,
+                        timeout=timeout
+                    )
+        except Exception as e:
+            logging.warning(f"Knowledge retrieval/filter failed: {e}")
+        return filtered_context
 
     # ================= 5. 主动验证逻辑 (Active Verification) =================
-    verification_constraints = "（未启用验证）"
-    try:
-        verif_info = {
-            "chapter_title": chapter_title,
-            "chapter_role": chapter_role,
-            "short_summary": short_summary,
-            "characters_involved": characters_involved,
-            "key_items": key_items,
-            "scene_location": scene_location
-        }
-        from embedding_adapters import create_embedding_adapter
-        embedding_adapter = create_embedding_adapter(
-            embedding_interface_format,
-            embedding_api_key,
-            embedding_url,
-            embedding_model_name
-        )
-        verification_constraints = perform_active_verification(
-            api_key=api_key,
-            base_url=base_url,
-            model_name=model_name,
-            interface_format=interface_format,
-            embedding_adapter=embedding_adapter,
-            filepath=filepath,
-            chapter_info=verif_info,
-            # 传入逻辑/选角模型参数
-            cast_api_key=cast_api_key,
-            cast_base_url=cast_base_url,
-            cast_model_name=cast_model_name,
-            cast_interface_format=cast_interface_format,
-            cast_temperature=cast_temperature,
-            cast_max_tokens=cast_max_tokens,
-            cast_timeout=cast_timeout,
-            timeout=timeout
-        )
-    except Exception as e:
-        logging.error(f"Active Verification failed: {e}")
-        verification_constraints = "（验证过程异常，请忽略）"
-
-    # ================= 6. 实体锁定列表 =================
-    entity_lock_list = extract_entity_lock_list(
-        character_state_text,
-        characters_involved,
-        key_items,
-        scene_location,
-        previous_excerpt,
-        user_guidance,
-        filepath=filepath,
-        use_entity_tracker=True
-    )
+    def _build_verification_constraints() -> str:
+        try:
+            verif_info = {
+                "chapter_title": chapter_title,
+                "chapter_role": chapter_role,
+                "short_summary": short_summary,
+                "characters_involved": characters_involved,
+                "key_items": key_items,
+                "scene_location": scene_location,
+                "chapter_number": novel_number
+            }
+            embedding_adapter = create_cached_embedding_adapter(
+                embedding_interface_format,
+                embedding_api_key,
+                embedding_url,
+                embedding_model_name,
+                filepath
+            )
+            return perform_active_verification(
+                api_key=api_key,
+                base_url=base_url,
+                model_name=model_name,
+                interface_format=interface_format,
+                embedding_adapter=embedding_adapter,
+                filepath=filepath,
+                chapter_info=verif_info,
+                # 传入逻辑/选角模型参数
+                cast_api_key=cast_api_key,
+                cast_base_url=cast_base_url,
+                cast_model_name=cast_model_name,
+                cast_interface_format=cast_interface_format,
+                cast_temperature=cast_temperature,
+                cast_max_tokens=cast_max_tokens,
+                cast_timeout=cast_timeout,
+                timeout=timeout
+            )
+        except Exception as e:
+            logging.error(f"Active Verification failed: {e}")
+            return "（验证过程异常，请忽略）"
 
     # ================= 7. 本章人物卡（出场角色/关系网/特点动机）=================
-    chapter_cast = "（人物卡生成失败）"
-    try:
-        # 优先使用专门的“逻辑/选角模型”配置
-        cast_if = (cast_interface_format or interface_format)
-        cast_key = (cast_api_key or api_key)
-        cast_url = (cast_base_url or base_url)
-        cast_model = (cast_model_name or model_name)
-        cast_temp = cast_temperature if cast_temperature is not None else 0.2
-        cast_tokens = cast_max_tokens if cast_max_tokens is not None else max_tokens
-        cast_to = cast_timeout if cast_timeout is not None else timeout
-
-        llm_adapter_cast = create_llm_adapter(
-            interface_format=cast_if,
-            base_url=cast_url,
-            model_name=cast_model,
-            api_key=cast_key,
-            temperature=cast_temp,
-            max_tokens=cast_tokens,
-            timeout=cast_to,
-        )
-        chapter_cast_prompt = CHAPTER_CAST_PROMPT.format(
-            global_summary=global_summary_text,
-            previous_chapter_excerpt=previous_excerpt,
-            character_state=character_state_text,
-            short_summary=short_summary,
-            user_guidance=user_guidance or "（无）",
-            characters_involved=characters_involved or "（未指定）",
-            key_items=key_items or "（无）",
-            scene_location=scene_location or "（未知）",
+    def _build_chapter_cast() -> str:
+        try:
+            # 优先使用专门的“逻辑/选角模型”配置
+            cast_if = (cast_interface_format or interface_format)
+            cast_key = (cast_api_key or api_key)
+            cast_url = (cast_base_url or base_url)
+            cast_model = (cast_model_name or model_name)
+            cast_temp = cast_temperature if cast_temperature is not None else 0.2
+            cast_tokens = cast_max_tokens if cast_max_tokens is not None else max_tokens
+            cast_to = cast_timeout if cast_timeout is not None else timeout
+
+            llm_adapter_cast = create_llm_adapter(
+                interface_format=cast_if,
+                base_url=cast_url,
+                model_name=cast_model,
+                api_key=cast_key,
+                temperature=cast_temp,
+                max_tokens=cast_tokens,
+                timeout=cast_to,
+            )
+            chapter_cast_prompt = CHAPTER_CAST_PROMPT.format(
+                global_summary=global_summary_text,
+                previous_chapter_excerpt=previous_excerpt,
+                character_state=character_state_text,
+                short_summary=short_summary,
+                user_guidance=user_guidance or "（无）",
+                characters_involved=characters_involved or "（未指定）",
+                key_items=key_items or "（无）",
+                scene_location=scene_location or "（未知）",
+            )
+            chapter_cast = invoke_with_cleaning(
+                llm_adapter_cast, chapter_cast_prompt, max_retries=3, cache_dir=filepath, stage="chapter_cast"
+            )
+            return chapter_cast or "（人物卡生成失败）"
+        except Exception as e:
+            logging.warning(f"Chapter cast generation failed: {e}")
+            return "（人物卡生成失败，请以角色状态为准）"
+
+    with ThreadPoolExecutor(max_workers=CONTEXT_STAGE_WORKERS, thread_name_prefix="chapter-prompt") as executor:
+        filtered_context_future = executor.submit(_build_filtered_context)
+        verification_future = executor.submit(_build_verification_constraints)
+        chapter_cast_future = executor.submit(_build_chapter_cast)
+
+        # ================= 6. 实体锁定列表 =================
+        # 本地计算，在等待上述远程调用期间完成
+        entity_lock_list = extract_entity_lock_list(
+            character_state_text,
+            characters_involved,
+            key_items,
+            scene_location,
+            previous_excerpt,
+            user_guidance,
+            filepath=filepath,
+            use_entity_tracker=True
         )
-        chapter_cast = invoke_with_cleaning(llm_adapter_cast, chapter_cast_prompt, max_retries=3)
-    except Exception as e:
-        logging.warning(f"Chapter cast generation failed: {e}")
-        chapter_cast = "（人物卡生成失败，请以角色状态为准）"
+
+        filtered_context = filtered_context_future.result()
+        verification_constraints = verification_future.result()
+        chapter_cast = chapter_cast_future.result()
 
     # 根据开篇模式生成对应的规则
     opening_mode_rules = ""
@@ -852,6 +918,10 @@ def build_chapter_prompt(
         opening_mode_rules = """【开篇规则】
 开篇必须直接延续上一章的同一场景、同一时间线、同一情绪或动作。"""
 
+    response_cache = peek_response_cache(filepath)
+    if response_cache is not None:
+        logging.info(response_cache.format_stats())
+
     # 返回最终提示词
     return next_chapter_draft_prompt.format(
         user_guidance=user_guidance if user_guidance else "无特殊指导",
@@ -908,10 +978,14 @@ def generate_chapter_draft(
     interface_format: str = "openai",
     max_tokens: int = 2048,
     timeout: int = 600,
-    custom_prompt_text: str | None = None
+    custom_prompt_text: str | None = None,
+    on_chunk=None,
+    should_stop=None
 ) -> str:
     """
     生成章节草稿，支持自定义提示词
+    传入 on_chunk 时以流式方式生成，每收到一段正文即回调 on_chunk(text)；
+    should_stop 返回 True 时提前中止，保存已生成的部分。
     """
     if custom_prompt_text is None:
         prompt_text = build_chapter_prompt(
@@ -952,7 +1026,10 @@ def generate_chapter_draft(
         timeout=timeout
     )
 
-    chapter_content = invoke_with_cleaning(llm_adapter, prompt_text)
+    if on_chunk is not None:
+        chapter_content = stream_with_cleaning(llm_adapter, prompt_text, on_chunk=on_chunk, should_stop=should_stop)
+    else:
+        chapter_content = invoke_with_cleaning(llm_adapter, prompt_text)
     if not chapter_content.strip():
         logging.warning("Generated chapter draft is empty.")
     chapter_file = os.path.join(chapters_dir, f"chapter_{novel_number}.txt")
@@ -978,22 +1055,21 @@ def analyze_chapter_logic(
     调用大模型对生成的章节进行逻辑自检
     """
     try:
-        global_summary = read_file(os.path.join(filepath, "global_summary.txt"))
-        character_state = read_file(os.path.join(filepath, "character_state.txt"))
+        state = get_project_state(filepath)
+        global_summary = state.global_summary
+        character_state = state.character_state
         # 尝试读取章节大纲以获取下一章概要，若不存在则传空字符串
-        directory_file = os.path.join(filepath, "Novel_directory.txt")
         next_chapter_outline = "（无后续目录信息）"
         try:
-            if os.path.exists(directory_file):
-                blueprint_text = read_file(directory_file)
+            if state.exists(DIRECTORY):
                 # 若传入了 novel_number，则取下一章信息
                 if novel_number and novel_number > 0:
-                    next_info = get_chapter_info_from_blueprint(blueprint_text, novel_number + 1)
+                    next_info = state.blueprint_index().chapter_info(novel_number + 1)
                     if next_info:
                         next_chapter_outline = f"第{novel_number+1}章《{next_info.get('chapter_title','（未命名）')}》：定位：{next_info.get('chapter_role','')}; 简述：{next_info.get('chapter_summary','') }"
                 else:
                     # 若未传入章节号，尽量摘取前几行作为概要
-                    lines = blueprint_text.splitlines()
+                    lines = state.directory.splitlines()
                     next_chapter_outline = '\n'.join(lines[:10]) if lines else next_chapter_outline
         except Exception:
             next_chapter_outline = "（读取目录失败）"
@@ -1045,7 +1121,7 @@ def rewrite_chapter_with_feedback(
         if filepath and chapter_num:
             try:
                 chapters_dir = os.path.join(filepath, "chapters")
-                previous_texts = get_last_n_chapters_text(chapters_dir, chapter_num, n=2)
+                previous_texts = get_last_n_chapters_text(chapters_dir, chapter_num, n=2, max_chars=2000)
                 if previous_texts:
                     # 生成前文摘要（限制在500字以内）
                     combined_previous = "\n".join(previous_texts)
@@ -1124,6 +1200,17 @@ def refine_chapter_detail(
         return ""
     
 
+def _retrieve_verification_contexts(embedding_adapter, questions: list, filepath: str, k: int = 2,
+                                    before_chapter: int = None) -> list:
+    """
+    为全部验证问题检索证据：一次批量 embedding + 一次向量化检索，并融合词法检索结果。
+    before_chapter 给定时只检索该章之前的章节（以及知识文件）。
+    返回与 questions 一一对应的上下文文本（失败时为空字符串）。
+    """
+    per_query, _ = hybrid_search_many(embedding_adapter, questions, filepath, k=k, before_chapter=before_chapter)
+    return [join_documents(docs) for docs in per_query]
+
+
 # =============== [新增函数] 执行主动验证流程 ===================
 def perform_active_verification(
     api_key: str,
@@ -1142,13 +1229,14 @@ def perform_active_verification(
     cast_max_tokens: int | None = None,
     cast_timeout: int | None = None,
     max_tokens: int = 2048,
-    timeout: int = 600
+    timeout: int = 600,
+    max_parallel: int = VERIFICATION_WORKERS
 ) -> str:
     """
     执行主动验证 RAG 流程：
     1. 识别风险 (Generate Questions)
-    2. 检索证据 (Vector Search)
-    3. 制定规则 (Generate Constraints)
+    2. 检索证据 (Vector Search)：所有问题一次性批量 embedding
+    3. 制定规则 (Generate Constraints)：按 max_parallel 并发调用
     """
     logging.info("Starting Active Verification RAG process...")
     verif_if = (cast_interface_format or interface_format)
@@ -1179,7 +1267,7 @@ def perform_active_verification(
         scene_location=chapter_info.get('scene_location')
     )
     
-    questions_raw = invoke_with_cleaning(llm_adapter, planner_prompt)
+    questions_raw = invoke_with_cleaning(llm_adapter, planner_prompt, cache_dir=filepath, stage="verification_planner")
     
     # 解析列表
     questions = []
@@ -1207,27 +1295,35 @@ def perform_active_verification(
     logging.info(f"Verification Questions: {questions}")
 
     # Step 2 & 3: 检索并制定规则
-    constraints = []
-    
     # 限制最多验证前 5 个问题，避免耗时过长
-    for q in questions[:5]: 
-        # 向量检索
-        context = get_relevant_context_from_vector_store(embedding_adapter, q, filepath, k=2)
-        
-        if not context:
-            continue
+    questions = [str(q) for q in questions[:5]]
+    contexts = _retrieve_verification_contexts(
+        embedding_adapter, questions, filepath, k=2,
+        before_chapter=chapter_info.get("chapter_number")
+    )
 
+    def _make_rule(q: str, context: str) -> str:
+        if not context:
+            return ""
         # 制定规则
         rule_prompt = ACTIVE_VERIFICATION_RULE_MAKER_PROMPT.format(
             question=q,
             retrieved_context=context
         )
-        
-        rule = invoke_with_cleaning(llm_adapter, rule_prompt)
-        
+        try:
+            rule = invoke_with_cleaning(llm_adapter, rule_prompt, cache_dir=filepath, stage="verification_rule")
+        except Exception as e:
+            logging.warning(f"Verification rule generation failed for '{q}': {e}")
+            return ""
         # 过滤掉无效回答
         if "无特定约束" not in rule and "No specific constraint" not in rule and len(rule) > 5:
-            constraints.append(f"● [Query: {q}]\n  {rule}")
+            return f"● [Query: {q}]\n  {rule}"
+        return ""
+
+    workers = max(1, min(max_parallel, len(questions)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verification") as executor:
+        # map 保持问题原有顺序
+        constraints = [c for c in executor.map(_make_rule, questions, contexts) if c]
 
     if not constraints:
         return "（检索完成，未发现显著的设定冲突，请自由发挥）"
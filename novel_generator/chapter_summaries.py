@@ -0,0 +1,381 @@
+#novel_generator/chapter_summaries.py
+# -*- coding: utf-8 -*-
+"""
+分层剧情摘要存储（summaries 目录）：
+- chapter_N.json：单章摘要，章节定稿时生成一次；记录章节文件的修改时间、大小与内容哈希，
+  章节被改写后对应摘要视为过期
+- arc_K.json：每 ARC_SIZE 章汇总一次的分卷摘要，记录所依据的各章摘要哈希，成员变化时才需重算
+- book.json：篇幅有上限的全书梗概，随分卷摘要增量更新
+- 提示词构建时按 token 预算组合“梗概 + 最近分卷 + 最近若干章摘要”
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from novel_generator.text_splitter import estimate_tokens
+from novel_generator.project_state import GLOBAL_SUMMARY, get_project_state
+
+SUMMARIES_DIR = "summaries"
+# 每卷（arc）包含的章节数
+ARC_SIZE = 10
+BOOK_FILE = "book.json"
+# global_summary.txt 组合文本中的分节标题
+SYNOPSIS_HEADER = "【全书梗概】"
+RECENT_HEADER = "【近期章节】"
+# 梗概之后的第一个分节：分卷摘要标题、近期章节标题，或空行后的单章摘要行
+_SECTION_BOUNDARY = re.compile(
+    r"^(?:【第\d+-\d+章 分卷摘要】|【近期章节】)$|\n\s*\n(?=第\d+章(?:《[^》\n]*》)?：)", re.MULTILINE
+)
+# 组合前情时默认的 token 预算与最近章节数
+SUMMARY_CONTEXT_TOKEN_BUDGET = 2000
+RECENT_SUMMARY_CHAPTERS = 3
+
+
+def get_summary_path(filepath: str, chapter_number: int) -> str:
+    return os.path.join(filepath, SUMMARIES_DIR, f"chapter_{chapter_number}.json")
+
+
+def _chapter_file(filepath: str, chapter_number: int) -> str:
+    return os.path.join(filepath, "chapters", f"chapter_{chapter_number}.txt")
+
+
+def _write_json(path: str, data: dict) -> bool:
+    """先写临时文件再替换，中途失败不会留下残缺的 JSON"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return True
+    except OSError as e:
+        logging.error(f"Failed to write {path}: {e}")
+        return False
+
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable summary {path}: {e}")
+        return None
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+
+
+def _source_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def save_chapter_summary(filepath: str, chapter_number: int, summary: str,
+                         chapter_text: str, chapter_title: str = "") -> bool:
+    """写入单章摘要"""
+    record = {
+        "chapter": chapter_number,
+        "title": chapter_title,
+        "summary": summary.strip(),
+        "source_hash": _text_hash(chapter_text),
+        "source_stamp": _source_stamp(_chapter_file(filepath, chapter_number)),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    return _write_json(get_summary_path(filepath, chapter_number), record)
+
+
+def load_chapter_summary(filepath: str, chapter_number: int):
+    """
+    读取单章摘要，返回记录 dict；不存在、损坏或章节已被改写时返回 None。
+    章节文件的修改时间与大小未变时不读取正文，否则按内容哈希确认。
+    """
+    record = _read_json(get_summary_path(filepath, chapter_number))
+    if not record or not record.get("summary"):
+        return None
+    chapter_file = _chapter_file(filepath, chapter_number)
+    stamp = _source_stamp(chapter_file)
+    if stamp is None or stamp == record.get("source_stamp"):
+        return record
+    try:
+        with open(chapter_file, "r", encoding="utf-8") as f:
+            current_hash = _text_hash(f.read())
+    except OSError:
+        return record
+    if current_hash != record.get("source_hash"):
+        logging.info(f"Summary of chapter {chapter_number} is stale (chapter was edited).")
+        return None
+    return record
+
+
+_CHAPTER_TEXT_NAME = re.compile(r"^chapter_(\d+)\.txt$")
+_CHAPTER_SUMMARY_NAME = re.compile(r"^chapter_(\d+)\.json$")
+
+
+def latest_chapter_number(filepath: str) -> int:
+    """已有章节文件或单章摘要中最大的章节号；都没有时返回 0"""
+    latest = 0
+    for folder, pattern in (("chapters", _CHAPTER_TEXT_NAME), (SUMMARIES_DIR, _CHAPTER_SUMMARY_NAME)):
+        try:
+            names = os.listdir(os.path.join(filepath, folder))
+        except OSError:
+            continue
+        for name in names:
+            match = pattern.match(name)
+            if match:
+                latest = max(latest, int(match.group(1)))
+    return latest
+
+
+def summary_hash(text: str) -> str:
+    return _text_hash(text or "")
+
+
+# ============ 分卷摘要 ============
+def arc_index(chapter_number: int) -> int:
+    return (chapter_number - 1) // ARC_SIZE
+
+
+def arc_range(arc: int):
+    """分卷包含的首末章节号"""
+    return arc * ARC_SIZE + 1, (arc + 1) * ARC_SIZE
+
+
+def get_arc_path(filepath: str, arc: int) -> str:
+    return os.path.join(filepath, SUMMARIES_DIR, f"arc_{arc}.json")
+
+
+def load_arc_summary(filepath: str, arc: int):
+    record = _read_json(get_arc_path(filepath, arc))
+    if not record or not record.get("summary"):
+        return None
+    return record
+
+
+def save_arc_summary(filepath: str, arc: int, summary: str, members: dict) -> bool:
+    start, end = arc_range(arc)
+    return _write_json(get_arc_path(filepath, arc), {
+        "arc": arc,
+        "start": start,
+        "end": end,
+        "summary": summary.strip(),
+        "members": members,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+
+def arc_member_summaries(filepath: str, arc: int):
+    """
+    分卷内各章的有效摘要，返回 [(章节号, 记录)]；有任一章缺少有效摘要时返回 None。
+    """
+    start, end = arc_range(arc)
+    records = []
+    for c in range(start, end + 1):
+        record = load_chapter_summary(filepath, c)
+        if record is None:
+            return None
+        records.append((c, record))
+    return records
+
+
+def arc_members_hash(records: list) -> dict:
+    return {str(c): summary_hash(record["summary"]) for c, record in records}
+
+
+# ============ 全书梗概 ============
+def load_book_synopsis(filepath: str) -> dict:
+    """
+    全书梗概记录：synopsis 为梗概正文，arcs 为已并入梗概的分卷摘要哈希，
+    composed_hash 为最近一次写入 global_summary.txt 的组合文本哈希。
+    """
+    record = _read_json(os.path.join(filepath, SUMMARIES_DIR, BOOK_FILE)) or {}
+    record.setdefault("synopsis", "")
+    record.setdefault("arcs", {})
+    record.setdefault("composed_hash", None)
+    return record
+
+
+def save_book_synopsis(filepath: str, record: dict) -> bool:
+    record["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return _write_json(os.path.join(filepath, SUMMARIES_DIR, BOOK_FILE), record)
+
+
+def extract_synopsis_section(text: str) -> str:
+    """从 global_summary.txt 的组合文本中取出梗概部分（分卷摘要、各章摘要之前的内容）"""
+    body = (text or "").strip()
+    if body.startswith(SYNOPSIS_HEADER):
+        body = body[len(SYNOPSIS_HEADER):]
+    match = _SECTION_BOUNDARY.search(body)
+    if match:
+        body = body[:match.start()]
+    return body.strip()
+
+
+def adopt_global_summary(book: dict, global_summary_text: str) -> bool:
+    """
+    global_summary.txt 与上次写入的组合文本不一致时，采用其中的梗概，使手动修改不会丢失：
+    - 从未写入过组合文本（composed_hash 为空）时，文件是旧项目的整体摘要，整体作为梗概
+    - 否则文件仍是组合格式，只采用其中的梗概部分；分卷与各章摘要以 summaries 目录中的记录为准
+    返回 book 是否有变化（需要保存）。
+    """
+    text = (global_summary_text or "").strip()
+    if not text or summary_hash(text) == book.get("composed_hash"):
+        return False
+    if book.get("composed_hash") is None:
+        book["synopsis"] = text
+    else:
+        book["synopsis"] = extract_synopsis_section(text)
+    book["composed_hash"] = summary_hash(text)
+    return True
+
+
+# ============ 按预算组合前情 ============
+def _fit(text: str, budget: float) -> str:
+    """文本超出预算时保留末尾（时间上更近的）部分；只用于提示词，结果不能写回任何文件"""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    keep = int(len(text) * budget / tokens)
+    return text[-keep:] if keep > 0 else ""
+
+
+def _chapter_line(c: int, record: dict) -> str:
+    title = record.get("title") or ""
+    header = f"第{c}章《{title}》" if title else f"第{c}章"
+    return f"{header}：{record['summary']}"
+
+
+def get_summary_context(filepath: str, current_chapter_num: int,
+                        token_budget: int = SUMMARY_CONTEXT_TOKEN_BUDGET,
+                        recent_chapters: int = RECENT_SUMMARY_CHAPTERS,
+                        global_summary_text: str = None, trim_synopsis: bool = True):
+    """
+    为第 current_chapter_num 章组合前情，返回 (长期前情, 近期章节摘要) 两段文本：
+    - 长期前情：全书梗概 + 最近一个已完成分卷的摘要 + 该分卷之后、近期窗口之前各章的摘要
+    - 近期章节摘要：最近 recent_chapters 章的单章摘要
+    按“最近一章 → 更早的近期章节 → 最近分卷 → 梗概 → 其余章节”的优先级装入 token 预算，
+    输出按时间顺序排列。尚无分层摘要时以 global_summary_text（默认读取 global_summary.txt）作为梗概。
+    trim_synopsis 为 False 时梗概始终完整保留（写入 global_summary.txt 时使用，否则被截掉的开头
+    会在下次采用该文件时永久丢失）。
+    """
+    book = load_book_synopsis(filepath)
+    if global_summary_text is None:
+        global_summary_text = get_project_state(filepath).global_summary
+    adopt_global_summary(book, global_summary_text)
+    synopsis = book["synopsis"].strip()
+
+    # 当前章所在分卷之前、最近一个已汇总的分卷
+    last_arc = None
+    for arc in range(arc_index(current_chapter_num) - 1, -1, -1):
+        last_arc = load_arc_summary(filepath, arc)
+        if last_arc is not None:
+            break
+    arc_end = last_arc["end"] if last_arc else 0
+
+    recent_start = max(1, current_chapter_num - recent_chapters)
+    recent = []
+    for c in range(current_chapter_num - 1, recent_start - 1, -1):
+        record = load_chapter_summary(filepath, c)
+        if record is not None:
+            recent.append((c, _chapter_line(c, record)))
+    gap = []
+    for c in range(recent_start - 1, arc_end, -1):
+        record = load_chapter_summary(filepath, c)
+        if record is not None:
+            gap.append((c, _chapter_line(c, record)))
+
+    remaining = float(token_budget)
+    kept_recent = []
+    for c, line in recent:
+        cost = estimate_tokens(line)
+        if cost > remaining and kept_recent:
+            break
+        kept_recent.append((c, line))
+        remaining -= cost
+    arc_text = ""
+    if last_arc is not None:
+        arc_text = f"【第{last_arc['start']}-{last_arc['end']}章 分卷摘要】\n{last_arc['summary']}"
+        cost = estimate_tokens(arc_text)
+        if cost <= remaining:
+            remaining -= cost
+        else:
+            arc_text = ""
+    if synopsis:
+        if trim_synopsis:
+            synopsis = _fit(synopsis, remaining)
+        remaining -= estimate_tokens(synopsis)
+    kept_gap = []
+    for c, line in gap:
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        kept_gap.append((c, line))
+        remaining -= cost
+
+    long_term_parts = []
+    if synopsis:
+        long_term_parts.append(f"{SYNOPSIS_HEADER}\n{synopsis}")
+    if arc_text:
+        long_term_parts.append(arc_text)
+    if kept_gap:
+        long_term_parts.append("\n".join(line for _, line in reversed(kept_gap)))
+    recent_text = "\n".join(line for _, line in reversed(kept_recent))
+    return "\n\n".join(long_term_parts), recent_text
+
+
+def compose_global_summary(filepath: str, upto_chapter: int, token_budget: int = SUMMARY_CONTEXT_TOKEN_BUDGET,
+                           global_summary_text: str = None) -> str:
+    """
+    截至第 upto_chapter 章（含）的完整前情文本，用于写入 global_summary.txt。
+    梗概不按预算截断，其余部分仍按预算取舍（它们在 summaries 目录中另有记录）。
+    """
+    long_term, recent = get_summary_context(
+        filepath, upto_chapter + 1, token_budget, RECENT_SUMMARY_CHAPTERS, global_summary_text,
+        trim_synopsis=False
+    )
+    parts = [long_term] if long_term else []
+    if recent:
+        parts.append(f"{RECENT_HEADER}\n{recent}")
+    return "\n\n".join(parts)
+
+
+def refresh_global_summary(filepath: str, upto_chapter: int = 0) -> str:
+    """
+    按分层摘要重写 global_summary.txt 并记录其哈希。组合到已有的最新章节（至少到 upto_chapter），
+    重新定稿较早的章节时不会回退。返回写入的文本（无内容可写时返回空字符串）。
+    """
+    state = get_project_state(filepath)
+    latest = max(upto_chapter, latest_chapter_number(filepath))
+    composed = compose_global_summary(filepath, latest, global_summary_text=state.global_summary)
+    if composed:
+        state.write(GLOBAL_SUMMARY, composed)
+        book = load_book_synopsis(filepath)
+        book["composed_hash"] = summary_hash(composed)
+        save_book_synopsis(filepath, book)
+    return composed
+
+
+def save_global_summary_edit(filepath: str, text: str) -> str:
+    """
+    保存在摘要标签页中编辑过的 global_summary.txt。
+    已启用分层摘要时只把梗概部分写入 book.json，再按分层摘要重新组合文件；
+    尚未启用时原样保存。返回最终写入的文本。
+    """
+    state = get_project_state(filepath)
+    book = load_book_synopsis(filepath)
+    if book["composed_hash"] is None:
+        state.write(GLOBAL_SUMMARY, text)
+        return text
+    if adopt_global_summary(book, text):
+        save_book_synopsis(filepath, book)
+    state.write(GLOBAL_SUMMARY, text)
+    return refresh_global_summary(filepath) or text
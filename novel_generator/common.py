@@ -7,6 +7,7 @@ import logging
 import re
 import time
 import traceback
+from novel_generator.llm_cache import get_response_cache, should_use_cache
 logging.basicConfig(
     filename='app.log',      # 日志文件名
     filemode='a',            # 追加模式（'w' 会覆盖）
@@ -72,8 +73,34 @@ def _is_connection_error(exc: Exception) -> bool:
     )
 
 
-def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3) -> str:
-    """调用 LLM 并清理返回结果，对网络/SSL 错误进行指数退避重试"""
+def invoke_with_cleaning(
+    llm_adapter,
+    prompt: str,
+    max_retries: int = 3,
+    cache_dir: str | None = None,
+    stage: str | None = None,
+    use_cache: bool | None = None
+) -> str:
+    """
+    调用 LLM 并清理返回结果，对网络/SSL 错误进行指数退避重试
+    :param cache_dir: 项目目录；传入时启用响应缓存（见 novel_generator.llm_cache）
+    :param stage: 阶段名，用于按阶段设置缓存过期时间和统计命中率
+    :param use_cache: 是否使用缓存；None 表示仅对低温度（确定性）调用启用
+    """
+    cache = None
+    cache_key = None
+    if cache_dir and should_use_cache(llm_adapter, use_cache):
+        try:
+            cache = get_response_cache(cache_dir)
+            cache_key = cache.make_key(llm_adapter, prompt)
+            cached = cache.get(cache_key, stage)
+            if cached is not None:
+                logging.info(f"[invoke_with_cleaning] Cache hit for stage '{stage}'.")
+                return cached
+        except Exception as e:
+            logging.warning(f"[invoke_with_cleaning] LLM cache unavailable: {e}")
+            cache = None
+
     print("\n" + "="*50)
     print("发送到 LLM 的提示词:")
     print("-"*50)
@@ -96,6 +123,11 @@ def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3) -> str:
 
             result = result.replace("```", "").strip()
             if result:
+                if cache is not None:
+                    try:
+                        cache.put(cache_key, result, stage)
+                    except Exception as e:
+                        logging.warning(f"[invoke_with_cleaning] Failed to write LLM cache: {e}")
                 return result
             retry_count += 1
         except Exception as e:
@@ -121,3 +153,131 @@ def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3) -> str:
 
     return result
 
+
+class ThinkTagStripper:
+    """
+    流式场景下增量移除 <think>...</think> 内容。
+    标签可能被切分在相邻的两个增量中，因此对可能是标签前缀的尾部做暂存。
+    """
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_think = False
+
+    @staticmethod
+    def _partial_tag_len(text: str, tag: str) -> int:
+        """返回 text 末尾与 tag 前缀重合的最大长度"""
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def feed(self, chunk: str) -> str:
+        """输入一段增量，返回其中可以立即展示的文本"""
+        self._buffer += chunk
+        visible = []
+        while self._buffer:
+            if self._in_think:
+                idx = self._buffer.find(self.CLOSE_TAG)
+                if idx == -1:
+                    keep = self._partial_tag_len(self._buffer, self.CLOSE_TAG)
+                    self._buffer = self._buffer[len(self._buffer) - keep:] if keep else ""
+                    break
+                self._buffer = self._buffer[idx + len(self.CLOSE_TAG):]
+                self._in_think = False
+            else:
+                idx = self._buffer.find(self.OPEN_TAG)
+                if idx == -1:
+                    keep = self._partial_tag_len(self._buffer, self.OPEN_TAG)
+                    cut = len(self._buffer) - keep
+                    visible.append(self._buffer[:cut])
+                    self._buffer = self._buffer[cut:]
+                    break
+                visible.append(self._buffer[:idx])
+                self._buffer = self._buffer[idx + len(self.OPEN_TAG):]
+                self._in_think = True
+        return "".join(visible)
+
+    def flush(self) -> str:
+        """流结束时输出暂存的残余文本（未闭合的 think 内容直接丢弃）"""
+        rest = "" if self._in_think else self._buffer
+        self._buffer = ""
+        return rest
+
+
+def stream_with_cleaning(llm_adapter, prompt: str, on_chunk=None, should_stop=None, max_retries: int = 3) -> str:
+    """
+    invoke_with_cleaning 的流式版本：逐段读取模型输出，增量剔除 <think> 内容，
+    并通过 on_chunk 回调实时推送可见文本。
+    :param on_chunk: 每收到一段可见文本时调用 on_chunk(text)
+    :param should_stop: 返回 True 时提前终止生成（用于中止不满意的草稿）
+    :return: 清理后的完整文本（中止时为已生成的部分）
+    """
+    print("\n" + "="*50)
+    print("发送到 LLM 的提示词（流式）:")
+    print("-"*50)
+    print(prompt)
+    print("="*50 + "\n")
+
+    retry_count = 0
+    effective_retries = max_retries
+
+    while retry_count < effective_retries:
+        stripper = ThinkTagStripper()
+        parts = []
+        try:
+            for delta in llm_adapter.stream(prompt):
+                visible = stripper.feed(delta)
+                if visible:
+                    parts.append(visible)
+                    if on_chunk:
+                        on_chunk(visible)
+                if should_stop and should_stop():
+                    logging.info("[stream_with_cleaning] 生成已被用户中止。")
+                    break
+            tail = stripper.flush()
+            if tail:
+                parts.append(tail)
+                if on_chunk:
+                    on_chunk(tail)
+
+            result = "".join(parts)
+            print("\n" + "="*50)
+            print("LLM 流式返回的内容:")
+            print("-"*50)
+            print(result)
+            print("="*50 + "\n")
+
+            result = result.replace("```", "").strip()
+            if result or (should_stop and should_stop()):
+                return result
+            retry_count += 1
+        except Exception as e:
+            # 已经向界面推送过内容时不再重试，避免输出重复拼接
+            if parts:
+                logging.error(f"[stream_with_cleaning] 流式输出中断: {e}")
+                return "".join(parts).replace("```", "").strip()
+
+            is_conn = _is_connection_error(e)
+            if is_conn:
+                effective_retries = max(5, max_retries + 2)
+                wait = min(60, 3 * (2 ** retry_count))
+                print(f"网络/SSL 连接失败 ({retry_count + 1}/{effective_retries})，{wait} 秒后重试...")
+                if retry_count + 1 < effective_retries:
+                    time.sleep(wait)
+            else:
+                print(f"调用失败 ({retry_count + 1}/{effective_retries}): {str(e)}")
+
+            retry_count += 1
+            if retry_count >= effective_retries:
+                if is_conn:
+                    raise ConnectionError(
+                        f"多次连接失败: {e}\n\n"
+                        "可能原因：代理/防火墙、SSL 证书、网络不稳定。\n"
+                        "建议：检查代理设置、关闭 VPN 后重试，或稍后再试。"
+                    ) from e
+                raise e
+
+    return ""
@@ -0,0 +1,261 @@
+#novel_generator/embedding_cache.py
+# -*- coding: utf-8 -*-
+"""
+Embedding 向量持久化缓存：以 (接口格式, 模型名, sha256(文本)) 为键，
+SQLite 只保存索引，向量按维度存放在 float32 矩阵文件中并通过内存映射读取。
+CachedEmbeddingAdapter 包装任意 embedding 适配器，仅将未命中的文本发送给服务商。
+"""
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import List
+import numpy as np
+from embedding_adapters import BaseEmbeddingAdapter, create_embedding_adapter
+from novel_generator.llm_cache import get_cache_dir
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class EmbeddingCache:
+    """
+    向量缓存存储。同一实例可在多个线程间共享。
+    超出 max_bytes 时按最近访问时间淘汰，被淘汰的矩阵行会被后续写入复用。
+    """
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memmaps = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "embeddings.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " row INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_access ON vectors(last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS free_rows (dim INTEGER NOT NULL, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS matrices (dim INTEGER PRIMARY KEY, rows INTEGER NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(interface_format: str, model_name: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{(interface_format or '').strip().lower()}|{model_name}|{digest}"
+
+    def _matrix_path(self, dim: int) -> str:
+        return os.path.join(self.cache_dir, f"embeddings_{dim}.f32")
+
+    def _get_memmap(self, dim: int, min_rows: int):
+        mm = self._memmaps.get(dim)
+        if mm is None or mm.shape[0] < min_rows:
+            path = self._matrix_path(dim)
+            rows = os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+            if rows < min_rows:
+                return None
+            mm = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+            self._memmaps[dim] = mm
+        return mm
+
+    def get_many(self, keys: List[str]) -> dict:
+        """批量查询，返回 {key: vector}，未命中的键不出现在结果中"""
+        if not keys:
+            return {}
+        found = {}
+        now = time.time()
+        with self._lock:
+            rows = []
+            unique_keys = list(dict.fromkeys(keys))
+            # SQLite 单条语句的参数个数有限，分段查询
+            for start in range(0, len(unique_keys), 500):
+                part = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows.extend(self._conn.execute(
+                    f"SELECT key, dim, row FROM vectors WHERE key IN ({placeholders})", part
+                ).fetchall())
+            for key, dim, row in rows:
+                mm = self._get_memmap(dim, row + 1)
+                if mm is None:
+                    continue
+                found[key] = mm[row].tolist()
+            if found:
+                self._conn.executemany(
+                    "UPDATE vectors SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _allocate_row(self, dim: int) -> int:
+        free = self._conn.execute("SELECT rowid, row FROM free_rows WHERE dim = ? LIMIT 1", (dim,)).fetchone()
+        if free is not None:
+            self._conn.execute("DELETE FROM free_rows WHERE rowid = ?", (free[0],))
+            return free[1]
+        current = self._conn.execute("SELECT rows FROM matrices WHERE dim = ?", (dim,)).fetchone()
+        row = current[0] if current else 0
+        self._conn.execute("INSERT OR REPLACE INTO matrices (dim, rows) VALUES (?, ?)", (dim, row + 1))
+        return row
+
+    def put_many(self, items: dict):
+        """批量写入 {key: vector}"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            handles = {}
+            try:
+                for key, vector in items.items():
+                    vec = np.asarray(vector, dtype=np.float32)
+                    dim = int(vec.shape[0])
+                    if dim == 0:
+                        continue
+                    existing = self._conn.execute(
+                        "SELECT dim, row FROM vectors WHERE key = ?", (key,)
+                    ).fetchone()
+                    if existing is not None and existing[0] == dim:
+                        row = existing[1]
+                    else:
+                        if existing is not None:
+                            self._conn.execute("INSERT INTO free_rows (dim, row) VALUES (?, ?)", existing)
+                        row = self._allocate_row(dim)
+                    handle = handles.get(dim)
+                    if handle is None:
+                        path = self._matrix_path(dim)
+                        handle = open(path, "r+b" if os.path.exists(path) else "w+b")
+                        handles[dim] = handle
+                    handle.seek(row * dim * 4)
+                    handle.write(vec.tobytes())
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO vectors (key, dim, row, last_access) VALUES (?, ?, ?, ?)",
+                        (key, dim, row, now)
+                    )
+            finally:
+                for handle in handles.values():
+                    handle.close()
+            # 矩阵文件可能已增长，丢弃旧的映射
+            for dim in handles:
+                self._memmaps.pop(dim, None)
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(dim), 0) FROM vectors").fetchone()[0] * 4
+        if total <= self.max_bytes:
+            return
+        # 淘汰到容量的 90%，避免每次写入都触发淘汰
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, dim, row in self._conn.execute(
+            "SELECT key, dim, row FROM vectors ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM vectors WHERE key = ?", (key,))
+            self._conn.execute("INSERT INTO free_rows (dim, row) VALUES (?, ?)", (dim, row))
+            total -= dim * 4
+            evicted += 1
+        logging.info(f"[embedding_cache] Evicted {evicted} cached vector(s).")
+
+    def clear(self):
+        with self._lock:
+            self._memmaps.clear()
+            for (dim,) in self._conn.execute("SELECT dim FROM matrices").fetchall():
+                try:
+                    os.remove(self._matrix_path(dim))
+                except OSError:
+                    pass
+            self._conn.execute("DELETE FROM vectors")
+            self._conn.execute("DELETE FROM free_rows")
+            self._conn.execute("DELETE FROM matrices")
+            self._conn.commit()
+
+
+class CachedEmbeddingAdapter(BaseEmbeddingAdapter):
+    """
+    带持久化缓存的 embedding 适配器包装，仅将未命中的文本交给内部适配器。
+    """
+    def __init__(self, inner: BaseEmbeddingAdapter, interface_format: str, model_name: str, cache: EmbeddingCache):
+        self.inner = inner
+        self.interface_format = interface_format
+        self.model_name = model_name
+        self.cache = cache
+
+    def _split(self, texts: List[str]):
+        keys = [EmbeddingCache.make_key(self.interface_format, self.model_name, t) for t in texts]
+        try:
+            found = self.cache.get_many(keys)
+        except Exception as e:
+            logging.warning(f"[embedding_cache] Lookup failed: {e}")
+            found = {}
+        # 同一批次内的重复文本只请求一次
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def _merge(self, keys, found, missing, vectors) -> List[List[float]]:
+        fresh = dict(zip(missing.keys(), vectors))
+        try:
+            self.cache.put_many(fresh)
+        except Exception as e:
+            logging.warning(f"[embedding_cache] Store failed: {e}")
+        if missing:
+            logging.info(f"[embedding_cache] {len(keys) - len(missing)}/{len(keys)} vector(s) served from cache.")
+        found.update(fresh)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split(texts)
+        vectors = self.inner.embed_documents(list(missing.values())) if missing else []
+        return self._merge(keys, found, missing, vectors)
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embed_documents([query])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split(texts)
+        vectors = await self.inner.aembed_documents(list(missing.values())) if missing else []
+        return self._merge(keys, found, missing, vectors)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return (await self.aembed_documents([query]))[0]
+
+
+_caches: dict = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(filepath: str) -> EmbeddingCache:
+    """获取项目目录对应的向量缓存（进程内单例）"""
+    cache_dir = os.path.abspath(get_cache_dir(filepath))
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = EmbeddingCache(cache_dir)
+            _caches[cache_dir] = cache
+        return cache
+
+
+def create_cached_embedding_adapter(
+    interface_format: str,
+    api_key: str,
+    base_url: str,
+    model_name: str,
+    filepath: str
+) -> BaseEmbeddingAdapter:
+    """
+    创建 embedding 适配器并包装项目级向量缓存；缓存无法打开时返回原始适配器。
+    """
+    adapter = create_embedding_adapter(interface_format, api_key, base_url, model_name)
+    try:
+        return CachedEmbeddingAdapter(adapter, interface_format, model_name, get_embedding_cache(filepath))
+    except Exception as e:
+        logging.warning(f"[embedding_cache] Cache unavailable, using uncached adapter: {e}")
+        return adapter
@@ -8,17 +8,35 @@ import os
 import logging
 import re
 from llm_adapters import create_llm_adapter
-from embedding_adapters import create_embedding_adapter
+from novel_generator.embedding_cache import create_cached_embedding_adapter
 from prompt_definitions import (
-    summary_prompt,
+    chapter_record_summary_prompt,
+    arc_summary_prompt,
+    book_synopsis_prompt,
     update_character_state_prompt,
     FORESHADOWING_ANALYSIS_PROMPT,
     DETECT_CHANGES_PROMPT,
     UPDATE_PROFILE_PROMPT,
 )
 from novel_generator.common import invoke_with_cleaning
-from utils import read_file, clear_file_content, save_string_to_txt, append_text_to_file
+from utils import read_file, save_string_to_txt
 from novel_generator.vectorstore_utils import update_vector_store
+from novel_generator.project_state import CHARACTER_STATE, FORESHADOWING, get_project_state
+from novel_generator.chapter_summaries import (
+    adopt_global_summary,
+    arc_index,
+    arc_member_summaries,
+    arc_members_hash,
+    arc_range,
+    load_arc_summary,
+    load_book_synopsis,
+    load_chapter_summary,
+    refresh_global_summary,
+    save_arc_summary,
+    save_book_synopsis,
+    save_chapter_summary,
+    summary_hash
+)
 
 
 def _ensure_role_library_dirs(filepath: str) -> str:
@@ -115,49 +133,129 @@ def sync_role_library_from_chapter(
             logging.error(f"更新角色档案失败({char_name}): {e}")
 
 # -----------------------------------------------------------------------------
-# 1. 独立功能：更新全局摘要
+# 1. 独立功能：生成单章摘要（存入 summaries/chapter_N.json，供后续章节组合前情）
 # -----------------------------------------------------------------------------
-def update_global_summary(
+def update_chapter_summary(
     novel_number: int,
     filepath: str,
     api_key: str,
     base_url: str,
     model_name: str,
     interface_format: str,
-    temperature: float = 0.5,
+    temperature: float = 0.3,
     max_tokens: int = 4096,
     timeout: int = 600
 ):
-    logging.info(f"开始单独更新摘要: 第 {novel_number} 章")
-    
     chapters_dir = os.path.join(filepath, "chapters")
     chapter_file = os.path.join(chapters_dir, f"chapter_{novel_number}.txt")
-    
     if not os.path.exists(chapter_file):
-        logging.error(f"找不到章节文件: {chapter_file}")
         return
 
-    chapter_text = read_file(chapter_file)
-    global_summary_file = os.path.join(filepath, "global_summary.txt")
-    old_summary = read_file(global_summary_file)
+    # 章节内容未变时沿用已有摘要，不再重复调用模型
+    if load_chapter_summary(filepath, novel_number) is not None:
+        logging.info(f"第 {novel_number} 章摘要已存在且章节未改动，跳过。")
+        return
 
-    summary_word_count = len(old_summary.strip())
+    logging.info(f"开始生成单章摘要: 第 {novel_number} 章")
+    chapter_text = read_file(chapter_file)
+    chapter_info = get_project_state(filepath).blueprint_index().get(novel_number)
+    chapter_title = chapter_info["chapter_title"] if chapter_info else ""
 
     llm_adapter = create_llm_adapter(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
-    
-    prompt = summary_prompt.format(
-        global_summary=old_summary,
-        chapter_text=chapter_text,
-        summary_word_count=summary_word_count  # 添加字数参数
+
+    prompt = chapter_record_summary_prompt.format(
+        novel_number=novel_number,
+        chapter_title=chapter_title,
+        chapter_text=chapter_text
     )
 
     try:
-        new_summary = invoke_with_cleaning(llm_adapter, prompt)
-        if new_summary:
-            save_string_to_txt(new_summary, global_summary_file)
-            logging.info("全局摘要更新完成。")
+        chapter_summary = invoke_with_cleaning(llm_adapter, prompt)
+        if chapter_summary:
+            save_chapter_summary(filepath, novel_number, chapter_summary, chapter_text, chapter_title)
+            logging.info("单章摘要已保存。")
     except Exception as e:
-        logging.error(f"摘要更新失败: {e}")
+        logging.error(f"单章摘要生成失败: {e}")
+
+
+# -----------------------------------------------------------------------------
+# 1.5 分层摘要：单章 -> 分卷 -> 全书梗概，只重算受影响的层级
+# -----------------------------------------------------------------------------
+def update_summary_hierarchy(
+    novel_number: int,
+    filepath: str,
+    api_key: str,
+    base_url: str,
+    model_name: str,
+    interface_format: str,
+    temperature: float = 0.3,
+    max_tokens: int = 4096,
+    timeout: int = 600
+):
+    """
+    定稿（或改写后重新定稿）某章时更新分层摘要：
+    1. 生成本章摘要（章节未改动时沿用）
+    2. 本章所在分卷的末章已存在时，补齐卷内缺失的单章摘要；卷内摘要有变化才重新汇总分卷
+    3. 梗概尚未包含本卷当前的分卷摘要时（按 book["arcs"] 中的哈希判断）增量更新全书梗概
+    4. 按最新进度（而非本章）以“梗概 + 最近分卷 + 近期章节”重写 global_summary.txt
+    global_summary.txt 被手动修改过（或是旧项目的整体摘要）时，先将其内容作为梗概保留。
+    """
+    state = get_project_state(filepath)
+    book = load_book_synopsis(filepath)
+    if adopt_global_summary(book, state.global_summary):
+        logging.info("global_summary.txt 已在外部修改，作为全书梗概保留。")
+        save_book_synopsis(filepath, book)
+
+    update_chapter_summary(novel_number, filepath, api_key, base_url, model_name, interface_format,
+                           temperature, max_tokens, timeout)
+
+    arc = arc_index(novel_number)
+    start, end = arc_range(arc)
+    if os.path.exists(os.path.join(filepath, "chapters", f"chapter_{end}.txt")):
+        for c in range(start, end + 1):
+            if load_chapter_summary(filepath, c) is None:
+                update_chapter_summary(c, filepath, api_key, base_url, model_name, interface_format,
+                                       temperature, max_tokens, timeout)
+        records = arc_member_summaries(filepath, arc)
+        arc_record = load_arc_summary(filepath, arc)
+        llm_adapter = None
+        if records is not None and (arc_record is None or arc_record.get("members") != arc_members_hash(records)):
+            llm_adapter = create_llm_adapter(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+            try:
+                logging.info(f"开始汇总分卷摘要: 第 {start}-{end} 章")
+                arc_summary = invoke_with_cleaning(llm_adapter, arc_summary_prompt.format(
+                    start_chapter=start,
+                    end_chapter=end,
+                    chapter_summaries="\n".join(f"第{c}章：{r['summary']}" for c, r in records)
+                ))
+                if arc_summary:
+                    save_arc_summary(filepath, arc, arc_summary, arc_members_hash(records))
+                    arc_record = load_arc_summary(filepath, arc)
+            except Exception as e:
+                logging.error(f"分卷摘要汇总失败: {e}")
+
+        # 梗概是否已包含当前分卷摘要由 book["arcs"] 记录的哈希判断，
+        # 上次汇总分卷后梗概更新失败的情况也会在这里补上
+        if arc_record is not None and book["arcs"].get(str(arc)) != summary_hash(arc_record["summary"]):
+            llm_adapter = llm_adapter or create_llm_adapter(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+            try:
+                synopsis = invoke_with_cleaning(llm_adapter, book_synopsis_prompt.format(
+                    old_synopsis=book["synopsis"] or "（暂无）",
+                    start_chapter=start,
+                    end_chapter=end,
+                    arc_summary=arc_record["summary"]
+                ))
+                if synopsis:
+                    book["synopsis"] = synopsis.strip()
+                    book["arcs"][str(arc)] = summary_hash(arc_record["summary"])
+                    save_book_synopsis(filepath, book)
+                    logging.info("全书梗概已更新。")
+            except Exception as e:
+                logging.error(f"全书梗概更新失败: {e}")
+
+    # 重新定稿较早的章节时，也要按最新进度组合，不能回退到该章
+    if refresh_global_summary(filepath, novel_number):
+        logging.info("全局摘要已按分层摘要重新组合。")
 
 
 # -----------------------------------------------------------------------------
@@ -182,8 +280,8 @@ def update_character_state(
         return
 
     chapter_text = read_file(chapter_file)
-    char_state_file = os.path.join(filepath, "character_state.txt")
-    old_state = read_file(char_state_file)
+    state = get_project_state(filepath)
+    old_state = state.character_state
 
     llm_adapter = create_llm_adapter(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
 
@@ -195,7 +293,7 @@ def update_character_state(
     try:
         new_state = invoke_with_cleaning(llm_adapter, prompt)
         if new_state:
-            save_string_to_txt(new_state, char_state_file)
+            state.write(CHARACTER_STATE, new_state)
             logging.info("角色状态表更新完成。")
     except Exception as e:
         logging.error(f"角色状态更新失败: {e}")
@@ -211,7 +309,7 @@ def save_structured_foreshadowing(filepath, novel_number, short_text, long_text)
     - 短线伏笔在解决后会被删除
     - 长线伏笔会按剧情发展更新
     """
-    record_file = os.path.join(filepath, "foreshadowing_records.txt")
+    state = get_project_state(filepath)
     
     # 1. 准备新内容 (如果为空则不写入该章节头)
     new_short_block = ""
@@ -227,10 +325,7 @@ def save_structured_foreshadowing(filepath, novel_number, short_text, long_text)
         return
 
     # 2. 读取现有文件内容
-    if os.path.exists(record_file):
-        content = read_file(record_file)
-    else:
-        content = ""
+    content = state.foreshadowing
 
     header_long = "=== 【长线伏笔】 ==="
     header_short = "=== 【短线伏笔】 ==="
@@ -345,24 +440,24 @@ def save_structured_foreshadowing(filepath, novel_number, short_text, long_text)
         # 重新组合内容
         final_content = f"{long_section_raw}\n\n\n{short_section_raw}\n"
         
-        save_string_to_txt(final_content, record_file)
+        state.write(FORESHADOWING, final_content)
         logging.info(f"伏笔库已更新 (动态管理) - 第{novel_number}章")
 
     except Exception as e:
         logging.error(f"伏笔文件解析写入错误: {e}")
         # 降级：如果解析坏了，直接追加到末尾防止丢数据
-        append_text_to_file(f"\n\n【第{novel_number}章补录】\n{long_text}\n{short_text}", record_file)
+        state.append(FORESHADOWING, f"\n\n【第{novel_number}章补录】\n{long_text}\n{short_text}")
 
 
 def cleanup_foreshadowing_records(filepath):
     """
     清理伏笔记录文件，删除已解决的短线伏笔和不必要的标记
     """
-    record_file = os.path.join(filepath, "foreshadowing_records.txt")
-    if not os.path.exists(record_file):
+    state = get_project_state(filepath)
+    if not state.exists(FORESHADOWING):
         return
 
-    content = read_file(record_file)
+    content = state.foreshadowing
     
     header_long = "=== 【长线伏笔】 ==="
     header_short = "=== 【短线伏笔】 ==="
@@ -390,7 +485,7 @@ def cleanup_foreshadowing_records(filepath):
         # 重新组合内容
         final_content = f"{cleaned_long}\n\n\n{cleaned_short}\n"
         
-        save_string_to_txt(final_content, record_file)
+        state.write(FORESHADOWING, final_content)
         logging.info("伏笔库已清理完成。")
         
     except Exception as e:
@@ -418,10 +513,10 @@ def update_foreshadowing_records(
     chapter_text = read_file(chapter_file)
     
     # 获取已有伏笔记录
-    record_file = os.path.join(filepath, "foreshadowing_records.txt")
+    state = get_project_state(filepath)
     existing_foreshadowing_records = ""
-    if os.path.exists(record_file):
-        existing_foreshadowing_records = read_file(record_file)
+    if state.exists(FORESHADOWING):
+        existing_foreshadowing_records = state.foreshadowing
     else:
         existing_foreshadowing_records = "（暂无已有伏笔记录）"
     
@@ -485,10 +580,11 @@ def finalize_chapter(
     timeout: int = 600
 ):
     """
-    分步定稿：摘要 -> 角色 -> 伏笔 -> 向量库
+    分步定稿：分层摘要 -> 角色 -> 伏笔 -> 向量库
     """
-    # 1. 更新摘要
-    update_global_summary(novel_number, filepath, api_key, base_url, model_name, interface_format, temperature, max_tokens, timeout)
+    # 1. 更新分层摘要（单章 -> 分卷 -> 梗概），并重新组合 global_summary.txt
+    update_summary_hierarchy(novel_number, filepath, api_key, base_url, model_name, interface_format,
+                             temperature, max_tokens, timeout)
     
     # 2. 更新角色
     update_character_state(novel_number, filepath, api_key, base_url, model_name, interface_format, temperature, max_tokens, timeout)
@@ -533,8 +629,8 @@ def ingest_chapter_to_vector_store(novel_number, filepath, api_key, base_url, in
         
         logging.info(f"正在将第 {novel_number} 章存入向量库...")
         
-        emb_adapter = create_embedding_adapter(interface_format, api_key, base_url, model_name)
-        update_vector_store(emb_adapter, chapter_text, filepath)
+        emb_adapter = create_cached_embedding_adapter(interface_format, api_key, base_url, model_name, filepath)
+        update_vector_store(emb_adapter, chapter_text, filepath, chapter_number=int(novel_number))
         
         logging.info("向量库更新完成。")
     except Exception as e:
@@ -1,17 +1,31 @@
 #novel_generator/knowledge.py
 # -*- coding: utf-8 -*-
 """
-知识文件导入至向量库（advanced_split_content、import_knowledge_file）
+知识文件流式导入至向量库（advanced_split_content、import_knowledge_file、import_knowledge_files）
 """
 import os
+import json
+import time
+import threading
+import codecs
+import hashlib
 import logging
 import re
 import traceback
-import nltk
 import warnings
-from utils import read_file
-from novel_generator.vectorstore_utils import load_vector_store, init_vector_store
-from langchain.docstore.document import Document
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from novel_generator.llm_cache import get_cache_dir
+from novel_generator.vectorstore_utils import (
+    add_new_chunks,
+    ensure_vectorstore_dir,
+    load_vector_store,
+    make_chunk_id,
+    make_chunk_metadata,
+    refresh_vector_store_fingerprint,
+    remove_stale_chunks,
+    vector_store_write_lock
+)
+from novel_generator.text_splitter import DEFAULT_CHUNK_TOKENS, iter_chunks, split_text
 
 # 禁用特定的Torch警告
 warnings.filterwarnings('ignore', message='.*Torch was not compiled with flash attention.*')
@@ -23,33 +37,126 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
-def advanced_split_content(content: str, similarity_threshold: float = 0.7, max_length: int = 500) -> list:
-    """使用基本分段策略"""
-    # nltk.download('punkt', quiet=True)
-    # nltk.download('punkt_tab', quiet=True)
-    sentences = nltk.sent_tokenize(content)
-    if not sentences:
-        return []
+def advanced_split_content(content: str, similarity_threshold: float = 0.7, max_length: int = DEFAULT_CHUNK_TOKENS) -> list:
+    """使用基本分段策略：中英文分句后按 token 上限组块"""
+    segments, _ = split_text(content, max_tokens=max_length)
+    return segments
+
+# 每批 embedding 并写入向量库的分块数
+IMPORT_BATCH_SIZE = 64
+# 每次从文件读取的字节数
+READ_BLOCK_BYTES = 64 * 1024
+# 依次尝试的编码；gb18030 兼容 gbk / gb2312
+CANDIDATE_ENCODINGS = ("utf-8", "gb18030", "big5")
+# 批量导入：切分文件的进程数、所有文件共享的并发 embedding 请求数
+IMPORT_CHUNK_PROCESSES = max(1, min(4, (os.cpu_count() or 2) - 1))
+IMPORT_EMBED_WORKERS = 4
+# 目录导入时收集的文件类型
+KNOWLEDGE_FILE_EXTENSIONS = (".txt", ".md")
+# 参与跨文件去重的段落最少字符数（不含空白）
+MIN_DEDUPE_CHARS = 20
+
+
+def detect_encoding(sample: bytes) -> str:
+    """根据文件开头的样本判断编码（样本末尾被截断的多字节字符不视为错误）"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def iter_file_text(file_path: str, progress: dict = None, block_bytes: int = READ_BLOCK_BYTES):
+    """
+    按块读取并增量解码文本文件，逐段产出字符串；progress["bytes"] 记录已读取的字节数，
+    progress["encoding"] 记录判定的编码，progress["replaced"] 记录解码产生的替换字符数。
+    编码按文件开头的样本判定；后文某块出现非法字节时：
+    - 此前内容都是 ASCII（各候选编码下解码结果相同）：从该块重新判定编码并切换；
+    - 否则以替换字符继续，不中断导入，替换字符数计入统计并记录警告。
+    """
+    with open(file_path, "rb") as f:
+        first = f.read(block_bytes)
+        encoding = detect_encoding(first)
+        logging.info(f"知识库文件编码: {encoding}")
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        stats = progress if progress is not None else {}
+        stats["encoding"] = encoding
+        stats["replaced"] = 0
+        position = 0
+        ascii_so_far = True
+        block = first
+        while block:
+            stats["bytes"] = stats.get("bytes", 0) + len(block)
+            text = decoder.decode(block)
+            if "\ufffd" in text and ascii_so_far:
+                detected = detect_encoding(block)
+                retry = codecs.getincrementaldecoder(detected)(errors="replace")
+                retry_text = retry.decode(block)
+                if retry_text.count("\ufffd") < text.count("\ufffd"):
+                    logging.info(f"知识库文件自第 {position} 字节起改用编码: {detected}")
+                    encoding, decoder, text = detected, retry, retry_text
+                    stats["encoding"] = encoding
+            ascii_so_far = ascii_so_far and block.isascii()
+            position += len(block)
+            stats["replaced"] += text.count("\ufffd")
+            if text:
+                yield text
+            block = f.read(block_bytes)
+        tail = decoder.decode(b"", final=True)
+        stats["replaced"] += tail.count("\ufffd")
+        if tail:
+            yield tail
+        if stats["replaced"]:
+            logging.warning(
+                f"知识库文件 {file_path} 按 {encoding} 解码时有 {stats['replaced']} 个字符无法识别，已替换为 U+FFFD。"
+            )
+
+
+def _checkpoint_path(filepath: str, doc: str) -> str:
+    digest = hashlib.sha1(doc.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(get_cache_dir(filepath), "import_checkpoints", f"{digest}.json")
+
+
+def _load_checkpoint(path: str, file_stat) -> int:
+    """返回可跳过的分块数；源文件已变化或无断点时返回 0"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("size") == file_stat.st_size and data.get("mtime") == file_stat.st_mtime:
+            return int(data.get("chunks_done", 0))
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _save_checkpoint(path: str, doc: str, file_stat, chunks_done: int):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"doc": doc, "size": file_stat.st_size, "mtime": file_stat.st_mtime,
+                   "chunks_done": chunks_done}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _open_import_store(embedding_api_key, embedding_url, embedding_interface_format, embedding_model_name, filepath):
+    """创建带缓存的 embedding 适配器并打开（必要时新建）项目向量库"""
+    from novel_generator.embedding_cache import create_cached_embedding_adapter
+    embedding_adapter = create_cached_embedding_adapter(
+        embedding_interface_format,
+        embedding_api_key,
+        embedding_url if embedding_url else "http://localhost:11434/api",
+        embedding_model_name,
+        filepath
+    )
+    ensure_vectorstore_dir(filepath)
+    return load_vector_store(embedding_adapter, filepath)
 
-    final_segments = []
-    current_segment = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence_length = len(sentence)
-        if current_length + sentence_length > max_length:
-            if current_segment:
-                final_segments.append(" ".join(current_segment))
-            current_segment = [sentence]
-            current_length = sentence_length
-        else:
-            current_segment.append(sentence)
-            current_length += sentence_length
-    
-    if current_segment:
-        final_segments.append(" ".join(current_segment))
-    
-    return final_segments
 
 def import_knowledge_file(
     embedding_api_key: str,
@@ -57,37 +164,314 @@ def import_knowledge_file(
     embedding_interface_format: str,
     embedding_model_name: str,
     file_path: str,
-    filepath: str
+    filepath: str,
+    source_name: str = None,
+    progress_callback=None,
+    batch_size: int = IMPORT_BATCH_SIZE
 ):
+    """
+    流式导入知识文件：按块读取并增量解码 -> 分句组块 -> 按批 embedding 并写入向量库。
+    内存占用与文件大小无关；每批写入后记录断点，中断后再次导入同一文件会从断点继续。
+    source_name 为该文件在库中的标识（默认取文件名），重复导入同名文件时替换其旧分块，
+    内容未变的分块不会重复 embedding。
+    progress_callback(chunks_done, bytes_read, total_bytes, chunks_per_sec) 在每批写入后调用。
+    返回导入统计 dict；失败时其中 completed 为 False。
+    """
     logging.info(f"开始导入知识库文件: {file_path}, 接口格式: {embedding_interface_format}, 模型: {embedding_model_name}")
     if not os.path.exists(file_path):
         logging.warning(f"知识库文件不存在: {file_path}")
-        return
-    content = read_file(file_path)
-    if not content.strip():
+        return None
+    file_stat = os.stat(file_path)
+    if file_stat.st_size == 0:
         logging.warning("知识库文件内容为空。")
-        return
-    paragraphs = advanced_split_content(content)
-    from embedding_adapters import create_embedding_adapter
-    embedding_adapter = create_embedding_adapter(
-        embedding_interface_format,
-        embedding_api_key,
-        embedding_url if embedding_url else "http://localhost:11434/api",
-        embedding_model_name
-    )
-    store = load_vector_store(embedding_adapter, filepath)
-    if not store:
-        logging.info("Vector store does not exist or load failed. Initializing a new one for knowledge import...")
-        store = init_vector_store(embedding_adapter, paragraphs, filepath)
-        if store:
-            logging.info("知识库文件已成功导入至向量库(新初始化)。")
-        else:
-            logging.warning("知识库导入失败，跳过。")
-    else:
+        return None
+
+    # 重建向量库期间等待其完成，导入的分块写入重建后的新库
+    with vector_store_write_lock(filepath):
+        store = _open_import_store(
+            embedding_api_key, embedding_url, embedding_interface_format, embedding_model_name, filepath
+        )
+        if not store:
+            logging.warning("知识库导入失败：无法打开向量库。")
+            return None
+
+        doc = source_name or os.path.basename(file_path)
+        checkpoint = _checkpoint_path(filepath, doc)
+        resume_from = _load_checkpoint(checkpoint, file_stat)
+        if resume_from:
+            logging.info(f"从断点继续导入 {doc}：跳过前 {resume_from} 个已写入的分块。")
+
+        stats = {"doc": doc, "chunks": 0, "embedded": 0, "replaced": 0, "completed": False, "seconds": 0.0}
+        progress = {"bytes": 0}
+        seen_ids = set()
+        batch = []
+        started = time.time()
+
+        def _flush():
+            ids = [make_chunk_id("knowledge", 0, i, t, doc) for i, _, t in batch]
+            metas = [make_chunk_metadata("knowledge", 0, o, doc) for _, o, t in batch]
+            stats["embedded"] += add_new_chunks(store, filepath, ids, [t for _, _, t in batch], metas)
+            refresh_vector_store_fingerprint(filepath)
+            _save_checkpoint(checkpoint, doc, file_stat, batch[-1][0] + 1)
+            batch.clear()
+            if progress_callback:
+                elapsed = max(time.time() - started, 1e-6)
+                progress_callback(stats["chunks"], progress["bytes"], file_stat.st_size, stats["chunks"] / elapsed)
+
         try:
-            docs = [Document(page_content=str(p)) for p in paragraphs]
-            store.add_documents(docs)
-            logging.info("知识库文件已成功导入至向量库(追加模式)。")
+            for index, (offset, text) in enumerate(iter_chunks(iter_file_text(file_path, progress))):
+                stats["chunks"] += 1
+                seen_ids.add(make_chunk_id("knowledge", 0, index, text, doc))
+                if index < resume_from:
+                    continue
+                batch.append((index, offset, text))
+                if len(batch) >= batch_size:
+                    _flush()
+            if batch:
+                _flush()
+            remove_stale_chunks(store, filepath, "knowledge", 0, doc, keep_ids=seen_ids)
+            refresh_vector_store_fingerprint(filepath)
+            stats["completed"] = True
+            try:
+                os.remove(checkpoint)
+            except OSError:
+                pass
         except Exception as e:
-            logging.warning(f"知识库导入失败: {e}")
+            logging.warning(f"知识库导入中断（已写入部分会保留，重新导入可继续）: {e}")
             traceback.print_exc()
+            stats["error"] = str(e)
+        stats["replaced"] = progress.get("replaced", 0)
+        stats["seconds"] = time.time() - started
+        logging.info(f"知识库文件导入结束: {stats}")
+        return stats
+
+
+def list_knowledge_files(directory: str, extensions=KNOWLEDGE_FILE_EXTENSIONS) -> list:
+    """递归收集目录下的知识文件，按路径排序以保证导入与去重结果稳定"""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.lower().endswith(tuple(extensions)):
+                found.append(os.path.join(root, name))
+    return found
+
+
+def _iter_paragraphs(pieces):
+    """将逐段产出的文本按换行重新切为段落（保留换行符），段落首尾相接覆盖原文"""
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if buffer:
+        yield buffer
+
+
+def _paragraph_key(text: str):
+    """去除空白后的内容摘要，用于跨文件识别相同段落；过短的段落（如标题）不参与去重"""
+    compact = re.sub(r"\s+", "", text)
+    if len(compact) < MIN_DEDUPE_CHARS:
+        return None
+    return hashlib.sha1(compact.encode("utf-8")).digest()
+
+
+def _hash_knowledge_file(file_path: str) -> list:
+    """子进程中计算文件各段落的摘要（需为模块级函数以便跨进程调用）"""
+    try:
+        return [_paragraph_key(p) for p in _iter_paragraphs(iter_file_text(file_path))]
+    except Exception:
+        return []
+
+
+def _chunk_knowledge_file(file_path: str, skip_paragraphs=frozenset()) -> dict:
+    """
+    子进程中读取并切分单个文件。skip_paragraphs 中的段落替换为等长空白后再切分，
+    既不会被写入，也不影响其余分块在原文中的位置。
+    """
+    started = time.time()
+    progress = {"bytes": 0}
+
+    def _pieces():
+        for index, paragraph in enumerate(_iter_paragraphs(iter_file_text(file_path, progress))):
+            yield " " * len(paragraph) if index in skip_paragraphs else paragraph
+
+    try:
+        chunks = list(iter_chunks(_pieces()))
+        return {"file": file_path, "encoding": progress.get("encoding", ""), "chunks": chunks,
+                "replaced": progress.get("replaced", 0), "seconds": time.time() - started, "error": None}
+    except Exception as e:
+        return {"file": file_path, "encoding": progress.get("encoding", ""), "chunks": [],
+                "replaced": progress.get("replaced", 0), "seconds": time.time() - started, "error": str(e)}
+
+
+def _map_in_processes(func, processes: int, *iterables):
+    """按输入顺序产出 func 的结果；进程池不可用时其余部分退回当前进程内执行"""
+    args = list(zip(*iterables))
+    yielded = 0
+    if processes > 1 and len(args) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                for result in executor.map(func, *zip(*args), chunksize=4):
+                    yielded += 1
+                    yield result
+            return
+        except Exception as e:
+            logging.warning(f"进程池不可用，改为单进程处理: {e}")
+    for item in args[yielded:]:
+        yield func(*item)
+
+
+def import_knowledge_files(
+    embedding_api_key: str,
+    embedding_url: str,
+    embedding_interface_format: str,
+    embedding_model_name: str,
+    file_paths: list,
+    filepath: str,
+    progress_callback=None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    processes: int = IMPORT_CHUNK_PROCESSES,
+    embed_workers: int = IMPORT_EMBED_WORKERS
+) -> list:
+    """
+    批量导入多个知识文件：
+    - 文件的读取、解码与切分在进程池中进行，结果按输入顺序依次处理；
+    - 所有文件的分块按批提交到同一个有界线程池做 embedding 与写入，并发请求数不超过 embed_workers；
+    - 内容相同（忽略空白）的段落在 embedding 前跨文件去重，只保留首次出现的一份；
+    - 每个文件以其相对公共目录的路径为标识（同一目录下即文件名，与单文件导入一致），
+      重复导入时替换其旧分块，库中已有的分块不会重复 embedding，中断后重新导入即可续传。
+    progress_callback(files_done, total_files, chunks_written, chunks_per_sec) 在每批写入后调用。
+    返回每个文件的导入报告（dict）列表，顺序与 file_paths 一致；无法打开向量库时返回 None。
+    """
+    file_paths = list(dict.fromkeys(os.path.abspath(p) for p in file_paths))
+    if not file_paths:
+        return []
+    logging.info(f"开始批量导入 {len(file_paths)} 个知识库文件, 接口格式: {embedding_interface_format}, 模型: {embedding_model_name}")
+    # 重建向量库期间等待其完成，导入的分块写入重建后的新库
+    with vector_store_write_lock(filepath):
+        store = _open_import_store(
+            embedding_api_key, embedding_url, embedding_interface_format, embedding_model_name, filepath
+        )
+        if not store:
+            logging.warning("知识库批量导入失败：无法打开向量库。")
+            return None
+
+        # 同名文件以相对公共目录的路径区分，单个目录下则就是文件名
+        common = os.path.commonpath(file_paths) if len(file_paths) > 1 else os.path.dirname(file_paths[0])
+        if os.path.isfile(common):
+            common = os.path.dirname(common)
+        reports = []
+        report_by_doc = {}
+        owned_ids = {}   # doc -> 该文件本次导入的分块 ID
+        pending = {}     # doc -> 尚未完成的批次数
+        lock = threading.Lock()
+        in_flight = threading.BoundedSemaphore(max(1, embed_workers) * 2)
+        counters = {"written": 0, "files_done": 0}
+        started = time.time()
+
+        def _finish_file(report):
+            report["status"] = "failed" if report["error"] else "ok"
+            counters["files_done"] += 1
+
+        def _report_progress():
+            if progress_callback:
+                elapsed = max(time.time() - started, 1e-6)
+                progress_callback(counters["files_done"], len(file_paths), counters["written"],
+                                  counters["written"] / elapsed)
+
+        def _write_batch(doc, batch):
+            try:
+                ids = [make_chunk_id("knowledge", 0, i, t, doc) for i, _, t in batch]
+                metas = [make_chunk_metadata("knowledge", 0, o, doc) for _, o, _ in batch]
+                embedded = add_new_chunks(store, filepath, ids, [t for _, _, t in batch], metas)
+                error = None
+            except Exception as e:
+                logging.warning(f"知识库文件 {doc} 的一批分块写入失败: {e}")
+                embedded, error = 0, str(e)
+            finally:
+                in_flight.release()
+            with lock:
+                report = report_by_doc[doc]
+                report["embedded"] += embedded
+                counters["written"] += len(batch)
+                if error and not report["error"]:
+                    report["error"] = error
+                pending[doc] -= 1
+                if pending[doc] == 0:
+                    report["seconds"] += time.time() - report.pop("_submitted")
+                    _finish_file(report)
+                _report_progress()
+
+        # 第一轮：各文件段落摘要；按文件顺序确定每个段落的首次出现者，其余文件中的相同段落跳过
+        owners = {}
+        skips = []
+        for path, keys in zip(file_paths, _map_in_processes(_hash_knowledge_file, processes, file_paths)):
+            skip = set()
+            for index, key in enumerate(keys):
+                if key is not None and owners.setdefault(key, path) != path:
+                    skip.add(index)
+            skips.append(frozenset(skip))
+
+        # 第二轮：切分与写入并行，切分结果按顺序提交到共享的 embedding 线程池
+        with ThreadPoolExecutor(max_workers=max(1, embed_workers)) as pool:
+            chunked = _map_in_processes(_chunk_knowledge_file, processes, file_paths, skips)
+            for result, skip in zip(chunked, skips):
+                doc = os.path.relpath(result["file"], common)
+                report = {
+                    "file": result["file"], "doc": doc, "encoding": result["encoding"],
+                    "chunks": len(result["chunks"]), "duplicates": len(skip), "embedded": 0,
+                    "replaced": result["replaced"], "seconds": result["seconds"], "status": "", "error": result["error"]
+                }
+                reports.append(report)
+                chunks = [(index, offset, text) for index, (offset, text) in enumerate(result["chunks"])]
+                batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), max(1, batch_size))]
+                with lock:
+                    report_by_doc[doc] = report
+                    owned_ids[doc] = {make_chunk_id("knowledge", 0, i, t, doc) for i, _, t in chunks}
+                    pending[doc] = len(batches)
+                    report["_submitted"] = time.time()
+                    if not batches:
+                        report.pop("_submitted")
+                        _finish_file(report)
+                        _report_progress()
+                for batch in batches:
+                    in_flight.acquire()
+                    pool.submit(_write_batch, doc, batch)
+
+        # 所有批次完成后，清理成功导入的文件在库中的过期分块
+        for report in reports:
+            if report["status"] == "ok":
+                try:
+                    remove_stale_chunks(store, filepath, "knowledge", 0, report["doc"], keep_ids=owned_ids[report["doc"]])
+                except Exception as e:
+                    logging.warning(f"清理 {report['doc']} 的过期分块失败: {e}")
+        refresh_vector_store_fingerprint(filepath)
+        logging.info(
+            f"知识库批量导入结束: {len(reports)} 个文件, "
+            f"{sum(r['embedded'] for r in reports)} 个分块新写入, 用时 {time.time() - started:.1f} 秒"
+        )
+        return reports
+
+
+def format_import_report(reports: list) -> str:
+    """将 import_knowledge_files 的结果整理为可读的文本报告"""
+    lines = [
+        f"知识库导入报告（{time.strftime('%Y-%m-%d %H:%M:%S')}）",
+        f"文件数: {len(reports)}，成功: {sum(1 for r in reports if r['status'] == 'ok')}，"
+        f"失败: {sum(1 for r in reports if r['status'] != 'ok')}",
+        f"分块总数: {sum(r['chunks'] for r in reports)}，跨文件重复段落: {sum(r['duplicates'] for r in reports)}，"
+        f"新写入: {sum(r['embedded'] for r in reports)}",
+        ""
+    ]
+    for r in reports:
+        line = (f"[{'成功' if r['status'] == 'ok' else '失败'}] {r['doc']}  编码: {r['encoding'] or '-'}  "
+                f"分块: {r['chunks']}  重复: {r['duplicates']}  新写入: {r['embedded']}  用时: {r['seconds']:.1f}s")
+        if r.get("replaced"):
+            line += f"  无法识别的字符: {r['replaced']}"
+        if r["error"]:
+            line += f"  错误: {r['error']}"
+        lines.append(line)
+    return "\n".join(lines)
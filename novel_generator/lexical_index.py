@@ -0,0 +1,228 @@
+#novel_generator/lexical_index.py
+# -*- coding: utf-8 -*-
+"""
+进程内词法倒排索引（BM25）：
+- 中文按字二元组（bigram）切分，英文/数字按词切分，不依赖分词库
+- 持久化在项目 .cache 目录下的 SQLite 文件中，与向量库分块一一对应
+- 检索不发起任何网络请求，可作为 embedding 服务不可用时的降级检索
+"""
+import os
+import re
+import math
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from novel_generator.llm_cache import get_cache_dir
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 单次查询最多使用的词项数，避免超长查询拖慢检索
+MAX_QUERY_TERMS = 64
+
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9]+")
+_CJK_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+def tokenize(text: str) -> list:
+    """中文连续片段切为字二元组（单字片段保留单字），英文/数字转小写整词"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text or ""):
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+class LexicalIndex:
+    """
+    基于 SQLite 的 BM25 倒排索引。同一实例可在多个线程间共享。
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # 本进程内是否已按分块 ID 与向量库核对过；写入失败后置为 False，下次检索时重新核对
+        self.synced = False
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " id TEXT PRIMARY KEY,"
+            " text TEXT NOT NULL,"
+            " source TEXT,"
+            " chapter INTEGER,"
+            " doc TEXT,"
+            " length INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_term ON postings(term)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_id ON postings(id)")
+        self._conn.commit()
+
+    def add(self, ids: list, texts: list, metadatas: list = None):
+        """写入（或覆盖）分块"""
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            self._delete_locked(ids)
+            for chunk_id, text, meta in zip(ids, texts, metadatas):
+                meta = meta or {}
+                counts = Counter(tokenize(text))
+                self._conn.execute(
+                    "INSERT INTO docs (id, text, source, chapter, doc, length) VALUES (?, ?, ?, ?, ?, ?)",
+                    (chunk_id, text, meta.get("source"), meta.get("chapter"), meta.get("doc"), sum(counts.values()))
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in counts.items()]
+                )
+            self._conn.commit()
+
+    def _delete_locked(self, ids: list):
+        for start in range(0, len(ids), 500):
+            part = list(ids[start:start + 500])
+            placeholders = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", part)
+            self._conn.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", part)
+
+    def delete(self, ids: list):
+        if not ids:
+            return
+        with self._lock:
+            self._delete_locked(ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM docs")}
+
+    def _filter_sql(self, source: str = None, before_chapter: int = None, min_chapter: int = None):
+        """与 vectorstore_utils.build_where 语义一致的过滤条件；旧数据没有元数据（source 为空），不受过滤"""
+        chapter_sql = ["d.source = 'chapter'"]
+        params = []
+        if before_chapter is not None:
+            chapter_sql.append("d.chapter < ?")
+            params.append(int(before_chapter))
+        if min_chapter is not None:
+            chapter_sql.append("d.chapter >= ?")
+            params.append(int(min_chapter))
+        chapter_clause = "(" + " AND ".join(chapter_sql) + ")"
+        if source == "knowledge":
+            return " AND (d.source IS NULL OR d.source = 'knowledge')", []
+        if source == "chapter":
+            return f" AND (d.source IS NULL OR {chapter_clause})", params
+        if not params:
+            return "", []
+        return f" AND (d.source IS NULL OR d.source = 'knowledge' OR {chapter_clause})", params
+
+    def search(self, query: str, k: int = 5, source: str = None,
+               before_chapter: int = None, min_chapter: int = None) -> list:
+        """
+        BM25 检索，返回按得分降序的 [(id, score, text, metadata), ...]
+        """
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        with self._lock:
+            total, avg_len = self._conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not total:
+                return []
+            avg_len = avg_len or 1.0
+            filter_sql, filter_params = self._filter_sql(source, before_chapter, min_chapter)
+            scores = Counter()
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.id"
+                    f" WHERE p.term = ?{filter_sql}",
+                    [term] + filter_params
+                ).fetchall()
+                if not rows:
+                    continue
+                df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            top = scores.most_common(k)
+            results = []
+            for chunk_id, score in top:
+                text, src, chapter, doc = self._conn.execute(
+                    "SELECT text, source, chapter, doc FROM docs WHERE id = ?", (chunk_id,)
+                ).fetchone()
+                meta = {key: value for key, value in (("source", src), ("chapter", chapter), ("doc", doc)) if value is not None}
+                results.append((chunk_id, score, text, meta))
+            return results
+
+
+_indexes: dict = {}
+_indexes_lock = threading.Lock()
+
+
+def get_lexical_index_path(filepath: str) -> str:
+    return os.path.abspath(os.path.join(get_cache_dir(filepath), "lexical_index.sqlite3"))
+
+
+def get_lexical_index(filepath: str) -> LexicalIndex:
+    """获取项目目录对应的词法索引（进程内单例）"""
+    db_path = get_lexical_index_path(filepath)
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            index = LexicalIndex(db_path)
+            _indexes[db_path] = index
+        return index
+
+
+def sync_lexical_index(store, filepath: str, page_size: int = 1000) -> LexicalIndex:
+    """
+    与向量库对齐：按分块 ID 补齐缺失的分块并移除向量库中已不存在的分块。
+    每个进程首次使用时、以及索引写入失败（synced 被置为 False）后完整核对一次；
+    之后分块数一致即视为已同步（分块数变化说明库被外部修改，同样重新核对）。
+    """
+    index = get_lexical_index(filepath)
+    with _indexes_lock:
+        collection_count = store.count()
+        if index.synced and index.count() == collection_count:
+            return index
+        known = index.ids()
+        seen = set()
+        offset = 0
+        while offset < collection_count:
+            page = store.get(limit=page_size, offset=offset)
+            page_ids = page.get("ids") or []
+            if not page_ids:
+                break
+            seen.update(page_ids)
+            missing = [i for i, chunk_id in enumerate(page_ids) if chunk_id not in known]
+            if missing:
+                documents = page.get("documents") or []
+                metadatas = page.get("metadatas") or []
+                index.add(
+                    [page_ids[i] for i in missing],
+                    [documents[i] or "" for i in missing],
+                    [metadatas[i] if i < len(metadatas) else {} for i in missing]
+                )
+            offset += len(page_ids)
+        stale = list(known - seen)
+        if stale:
+            index.delete(stale)
+        if len(known) != len(seen) or stale:
+            logging.info(f"[lexical_index] Synced with vector store ({len(known)} -> {len(seen)} chunks).")
+        index.synced = True
+        return index
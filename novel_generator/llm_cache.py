@@ -0,0 +1,181 @@
+#novel_generator/llm_cache.py
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存：以 (适配器类型, 模型, 温度, max_tokens, 提示词) 的哈希为键，
+将响应存入项目目录下的 SQLite 文件，按总大小做 LRU 淘汰，并支持按阶段设置过期时间。
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+# 温度不高于该值的调用视为确定性阶段，默认启用缓存
+DETERMINISTIC_TEMPERATURE = 0.2
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# 各阶段的过期时间（秒）；未列出的阶段使用 DEFAULT_TTL_SECONDS
+STAGE_TTLS = {
+    "recent_summary": 24 * 3600,
+    "knowledge_search": 7 * 24 * 3600,
+    "knowledge_filter": 7 * 24 * 3600,
+    "chapter_cast": 3 * 24 * 3600,
+    "verification_planner": 3 * 24 * 3600,
+    "verification_rule": 7 * 24 * 3600,
+}
+
+
+def get_cache_dir(filepath: str) -> str:
+    """获取项目缓存目录"""
+    return os.path.join(filepath, ".cache")
+
+
+class LLMResponseCache:
+    """
+    基于 SQLite 的内容寻址响应缓存。
+    同一实例可在多个线程间共享。
+    """
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES, stage_ttls: dict | None = None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.stage_ttls = dict(STAGE_TTLS)
+        if stage_ttls:
+            self.stage_ttls.update(stage_ttls)
+        self._lock = threading.Lock()
+        self._stats = {}
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " stage TEXT,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(llm_adapter, prompt: str) -> str:
+        """根据适配器配置和提示词计算缓存键"""
+        payload = json.dumps([
+            type(llm_adapter).__name__,
+            getattr(llm_adapter, "model_name", ""),
+            getattr(llm_adapter, "temperature", None),
+            getattr(llm_adapter, "max_tokens", None),
+            prompt,
+        ], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _record(self, stage: str | None, field: str):
+        stage_stats = self._stats.setdefault(stage or "default", {"hits": 0, "misses": 0})
+        stage_stats[field] += 1
+
+    def get(self, key: str, stage: str | None = None) -> str | None:
+        """查询缓存，过期或不存在时返回 None"""
+        ttl = self.stage_ttls.get(stage, DEFAULT_TTL_SECONDS)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (ttl is not None and now - row[1] > ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self._record(stage, "misses")
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._record(stage, "hits")
+            return row[0]
+
+    def put(self, key: str, response: str, stage: str | None = None):
+        """写入缓存，并在超出容量时按最近访问时间淘汰"""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, stage, response, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, response, size, now, now)
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 淘汰到容量的 90%，避免每次写入都触发淘汰
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logging.info(f"[llm_cache] Evicted {evicted} cached response(s).")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """返回命中统计：{stage: {"hits": n, "misses": m}, "total": {...}}"""
+        with self._lock:
+            result = {stage: dict(values) for stage, values in self._stats.items()}
+        result["total"] = {
+            "hits": sum(v["hits"] for v in result.values()),
+            "misses": sum(v["misses"] for v in result.values()),
+        }
+        return result
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        total = stats.pop("total")
+        lookups = total["hits"] + total["misses"]
+        rate = (total["hits"] / lookups * 100) if lookups else 0.0
+        parts = [f"{stage}: {v['hits']}/{v['hits'] + v['misses']}" for stage, v in sorted(stats.items())]
+        return f"LLM 缓存命中 {total['hits']}/{lookups} ({rate:.0f}%)" + (f" [{', '.join(parts)}]" if parts else "")
+
+
+_caches: dict = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(filepath: str) -> LLMResponseCache:
+    """获取项目目录对应的响应缓存（进程内单例）"""
+    db_path = os.path.abspath(os.path.join(get_cache_dir(filepath), "llm_responses.sqlite3"))
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            cache = LLMResponseCache(db_path)
+            _caches[db_path] = cache
+        return cache
+
+
+def peek_response_cache(filepath: str) -> LLMResponseCache | None:
+    """若该项目的缓存已在本进程中打开则返回它，否则返回 None"""
+    db_path = os.path.abspath(os.path.join(get_cache_dir(filepath), "llm_responses.sqlite3"))
+    with _caches_lock:
+        return _caches.get(db_path)
+
+
+def should_use_cache(llm_adapter, use_cache: bool | None = None) -> bool:
+    """未显式指定时，仅对确定性阶段（低温度）启用缓存"""
+    if use_cache is not None:
+        return use_cache
+    temperature = getattr(llm_adapter, "temperature", None)
+    return temperature is not None and temperature <= DETERMINISTIC_TEMPERATURE
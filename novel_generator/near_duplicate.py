@@ -0,0 +1,354 @@
+#novel_generator/near_duplicate.py
+# -*- coding: utf-8 -*-
+"""
+入库前的近重复分块检测（MinHash + LSH）：
+- 以去除空白后的字符 3-gram 为特征，中英文通用，不依赖分词库
+- 64 个哈希函数的 MinHash 签名估计 Jaccard 相似度；签名按 16 段 x 4 行做 LSH 分桶，
+  相似度达到阈值的分块几乎必然落入同一桶，候选再用签名逐一确认
+- 签名与分桶持久化在项目 .cache 目录下的 SQLite 文件中，与向量库分块一一对应
+- 被跳过的分块连同文本与其重复的原分块一起记录，原分块被删除时由调用方重新入库；
+  重复内容保留书中最早的一份（知识文件在前，章节按章节号），较晚的一份让位
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+import numpy as np
+from novel_generator.llm_cache import get_cache_dir
+
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+# 估计的 Jaccard 相似度不低于该值视为近重复
+NEAR_DUP_THRESHOLD = 0.75
+# 去除空白后短于该长度的分块（标题、单句对白等）不做近重复判断
+MIN_SKETCH_CHARS = 40
+
+_WHITESPACE = re.compile(r"\s+")
+_SEEDS = np.array(
+    [int.from_bytes(hashlib.blake2b(f"minhash-{i}".encode(), digest_size=8).digest(), "big")
+     for i in range(NUM_PERMUTATIONS)],
+    dtype=np.uint64
+)
+
+
+def _mix64(x):
+    """splitmix64 终结函数，作为一族近似独立的排列（uint64 乘法按 2^64 取模）"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash_signature(text: str):
+    """计算 MinHash 签名（uint64 数组）；文本过短时返回 None"""
+    compact = _WHITESPACE.sub("", text or "").lower()
+    if len(compact) < MIN_SKETCH_CHARS:
+        return None
+    shingles = {compact[i:i + SHINGLE_SIZE] for i in range(len(compact) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    with np.errstate(over="ignore"):
+        return _mix64(hashes[None, :] ^ _SEEDS[:, None]).min(axis=1)
+
+
+def estimate_similarity(a, b) -> float:
+    """由两个签名估计 Jaccard 相似度"""
+    return float(np.count_nonzero(a == b)) / NUM_PERMUTATIONS
+
+
+def _band_keys(signature) -> list:
+    """每段签名压缩为一个有符号 64 位整数（SQLite INTEGER）"""
+    rows = signature.reshape(LSH_BANDS, LSH_ROWS)
+    return [
+        int.from_bytes(hashlib.blake2b(row.tobytes(), digest_size=8).digest(), "big", signed=True)
+        for row in rows
+    ]
+
+
+def chunk_scope(meta: dict) -> str:
+    """分块所属范围（同一章节或同一知识文件），与 vectorstore_utils 的分块 ID 规则对应"""
+    meta = meta or {}
+    return f"{meta.get('source', '')}:{meta.get('chapter', 0)}:{meta.get('doc', '')}"
+
+
+def scope_order(scope: str) -> tuple:
+    """范围在书中的先后：非章节来源（知识文件等）在前，章节按章节号"""
+    source, chapter = (scope.split(":", 2) + ["", ""])[:2]
+    if source != "chapter":
+        return (0, 0)
+    try:
+        return (1, int(chapter))
+    except ValueError:
+        return (1, 0)
+
+
+class SketchIndex:
+    """
+    基于 SQLite 的 MinHash 签名索引。同一实例可在多个线程间共享。
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.synced = False
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sketches (id TEXT PRIMARY KEY, signature BLOB NOT NULL, scope TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, key INTEGER NOT NULL, id TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_key ON buckets(band, key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_id ON buckets(id)")
+        # 因近重复未入库的分块 -> 与之重复的原分块（original 为空表示原分块已不在库中、等待重新入库）
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS skipped ("
+            " id TEXT PRIMARY KEY, original TEXT NOT NULL, scope TEXT, text TEXT NOT NULL, meta TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_skipped_original ON skipped(original)")
+        self._conn.commit()
+
+    def _insert_locked(self, chunk_id: str, signature, scope: str):
+        self._delete_locked([chunk_id])
+        self._conn.execute(
+            "INSERT INTO sketches (id, signature, scope) VALUES (?, ?, ?)",
+            (chunk_id, signature.tobytes(), scope)
+        )
+        self._conn.executemany(
+            "INSERT INTO buckets (band, key, id) VALUES (?, ?, ?)",
+            [(band, key, chunk_id) for band, key in enumerate(_band_keys(signature))]
+        )
+
+    def _delete_locked(self, ids: list):
+        for start in range(0, len(ids), 500):
+            part = list(ids[start:start + 500])
+            placeholders = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM buckets WHERE id IN ({placeholders})", part)
+            self._conn.execute(f"DELETE FROM sketches WHERE id IN ({placeholders})", part)
+
+    def _find_locked(self, signature, scope: str, current_ids: set, threshold: float):
+        """
+        返回 (与签名近重复的已有分块 ID, 其范围)。同范围（同一章节/知识文件）的已有分块可能是即将被替换的旧版本，
+        只有属于本批（current_ids）的才参与比较。
+        """
+        candidates = set()
+        for band, key in enumerate(_band_keys(signature)):
+            candidates.update(
+                row[0] for row in self._conn.execute("SELECT id FROM buckets WHERE band = ? AND key = ?", (band, key))
+            )
+        best_id, best_scope, best_score = None, None, threshold
+        for chunk_id in candidates:
+            row = self._conn.execute("SELECT signature, scope FROM sketches WHERE id = ?", (chunk_id,)).fetchone()
+            if not row or (row[1] == scope and chunk_id not in current_ids):
+                continue
+            score = estimate_similarity(signature, np.frombuffer(row[0], dtype=np.uint64))
+            if score >= best_score:
+                best_id, best_scope, best_score = chunk_id, row[1], score
+        return best_id, best_scope
+
+    def _record_skipped_locked(self, chunk_id: str, original: str, scope: str, text: str, meta: dict):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO skipped (id, original, scope, text, meta) VALUES (?, ?, ?, ?, ?)",
+            (chunk_id, original, scope, text, json.dumps(meta or {}, ensure_ascii=False))
+        )
+
+    def claim(self, ids: list, texts: list, metadatas: list = None, current_ids: set = None,
+              threshold: float = NEAR_DUP_THRESHOLD):
+        """
+        逐个检查分块是否与库中（或本批中更早的）分块近重复，并在同一把锁内登记非重复分块的签名，
+        以保证并发写入时同一段内容只有一份被接受。
+        current_ids 为本批全部分块 ID（含库中已存在、无需写入的），它们是同范围内的现行版本。
+        返回 (duplicates, displaced)：
+        - duplicates {重复分块 ID: 被其重复的分块 ID}，这些分块不入库，已记录在 skipped 中；
+        - displaced {库中较晚的分块 ID: 取代它的本批分块 ID}，本批分块在书中更早而照常入库，
+          调用方入库成功后应以 displace 移除较晚的一份。
+        写入向量库失败时应调用 delete 撤销登记。
+        """
+        metadatas = metadatas or [{} for _ in ids]
+        duplicates = {}
+        displaced = {}
+        with self._lock:
+            claimed = set(current_ids or ())
+            for chunk_id, text, meta in zip(ids, texts, metadatas):
+                signature = minhash_signature(text)
+                if signature is None:
+                    continue
+                scope = chunk_scope(meta)
+                match, match_scope = self._find_locked(signature, scope, claimed, threshold)
+                if match is not None and match != chunk_id:
+                    if scope_order(scope) >= scope_order(match_scope) or match in displaced:
+                        duplicates[chunk_id] = match
+                        self._record_skipped_locked(chunk_id, match, scope, text, meta)
+                        continue
+                    displaced[match] = chunk_id
+                self._insert_locked(chunk_id, signature, scope)
+                claimed.add(chunk_id)
+            self._conn.commit()
+        return duplicates, displaced
+
+    def displace(self, entries: list):
+        """
+        较晚的分块让位于书中更早的近重复分块：entries 为 [(分块 ID, 取代它的分块 ID, 文本, 元数据)]。
+        移除其签名并记为被跳过；原本指向它的被跳过分块改为指向取代者。
+        """
+        with self._lock:
+            for chunk_id, original, text, meta in entries:
+                self._delete_locked([chunk_id])
+                self._conn.execute("UPDATE skipped SET original = ? WHERE original = ?", (original, chunk_id))
+                self._record_skipped_locked(chunk_id, original, chunk_scope(meta), text, meta)
+            self._conn.commit()
+
+    def release_skipped(self, original_ids: list) -> list:
+        """
+        原分块已从库中删除：取出因它们而被跳过的分块（连同此前未能重新入库的），
+        返回 [(分块 ID, 文本, 元数据)] 供调用方重新入库，同时将记录标记为等待重新入库。
+        重新入库时仍重复的分块会在 claim 中重新登记，成功入库的应以 drop_skipped 移除记录。
+        """
+        if not original_ids:
+            return []
+        with self._lock:
+            for start in range(0, len(original_ids), 500):
+                part = list(original_ids[start:start + 500])
+                self._conn.execute(
+                    f"UPDATE skipped SET original = '' WHERE original IN ({','.join('?' * len(part))})", part
+                )
+            self._conn.commit()
+            rows = self._conn.execute("SELECT id, text, meta FROM skipped WHERE original = ''").fetchall()
+        return [(r[0], r[1], json.loads(r[2]) if r[2] else {}) for r in rows]
+
+    def drop_skipped(self, ids: list):
+        """分块已入库，移除其被跳过记录"""
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                part = list(ids[start:start + 500])
+                self._conn.execute(f"DELETE FROM skipped WHERE id IN ({','.join('?' * len(part))})", part)
+            self._conn.commit()
+
+    def forget_skipped(self, scope: str, keep_ids: set):
+        """范围（章节/知识文件）重新写入后，丢弃该范围内已不再出现的被跳过分块"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM skipped WHERE scope = ?", (scope,)).fetchall()
+            stale = [r[0] for r in rows if r[0] not in keep_ids]
+            for start in range(0, len(stale), 500):
+                part = stale[start:start + 500]
+                self._conn.execute(f"DELETE FROM skipped WHERE id IN ({','.join('?' * len(part))})", part)
+            self._conn.commit()
+
+    def skipped_chunks(self, scope: str = None) -> list:
+        """被跳过的分块 [(分块 ID, 文本, 元数据)]，可按范围筛选"""
+        with self._lock:
+            if scope is None:
+                rows = self._conn.execute("SELECT id, text, meta FROM skipped").fetchall()
+            else:
+                rows = self._conn.execute("SELECT id, text, meta FROM skipped WHERE scope = ?", (scope,)).fetchall()
+        return [(r[0], r[1], json.loads(r[2]) if r[2] else {}) for r in rows]
+
+    def add(self, ids: list, texts: list, metadatas: list = None):
+        """直接登记（或覆盖）分块签名，不做重复判断"""
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            for chunk_id, text, meta in zip(ids, texts, metadatas):
+                signature = minhash_signature(text)
+                if signature is not None:
+                    self._insert_locked(chunk_id, signature, chunk_scope(meta))
+            self._conn.commit()
+
+    def delete(self, ids: list):
+        if not ids:
+            return
+        with self._lock:
+            self._delete_locked(ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets")
+            self._conn.execute("DELETE FROM sketches")
+            self._conn.execute("DELETE FROM skipped")
+            self._conn.commit()
+
+    def ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM sketches")}
+
+    def replace_with(self, other: "SketchIndex"):
+        """以另一个索引（重建向量库时为新库构建的索引）的全部内容替换本索引"""
+        with self._lock, other._lock:
+            other._conn.commit()
+            self._conn.commit()
+            self._conn.execute("ATTACH DATABASE ? AS src", (other.db_path,))
+            try:
+                for table in ("sketches", "buckets", "skipped"):
+                    self._conn.execute(f"DELETE FROM {table}")
+                    self._conn.execute(f"INSERT INTO {table} SELECT * FROM src.{table}")
+                self._conn.commit()
+            finally:
+                self._conn.execute("DETACH DATABASE src")
+
+    def close(self):
+        """关闭连接；仅用于不经 get_sketch_index 共享的实例"""
+        with self._lock:
+            self._conn.close()
+
+
+_indexes: dict = {}
+_indexes_lock = threading.Lock()
+
+
+def get_sketch_index(filepath: str) -> SketchIndex:
+    """获取项目目录对应的近重复签名索引（进程内单例）"""
+    db_path = os.path.abspath(os.path.join(get_cache_dir(filepath), "near_duplicates.sqlite3"))
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            index = SketchIndex(db_path)
+            _indexes[db_path] = index
+        return index
+
+
+def sync_sketch_index(store, filepath: str, page_size: int = 1000) -> SketchIndex:
+    """
+    与向量库对齐（每个进程首次使用时执行一次）：
+    为已有但未登记的分块补算签名，并移除向量库中已不存在的分块。
+    """
+    index = get_sketch_index(filepath)
+    with _indexes_lock:
+        if index.synced:
+            return index
+        known = index.ids()
+        seen = set()
+        offset = 0
+        total = store.count()
+        while offset < total:
+            page = store.get(limit=page_size, offset=offset)
+            page_ids = page.get("ids") or []
+            if not page_ids:
+                break
+            seen.update(page_ids)
+            missing = [i for i, chunk_id in enumerate(page_ids) if chunk_id not in known]
+            if missing:
+                documents = page.get("documents") or []
+                metadatas = page.get("metadatas") or []
+                index.add(
+                    [page_ids[i] for i in missing],
+                    [documents[i] or "" for i in missing],
+                    [metadatas[i] if i < len(metadatas) else {} for i in missing]
+                )
+            offset += len(page_ids)
+        stale = list(known - seen)
+        if stale:
+            index.delete(stale)
+            # 原分块已不在库中：被跳过的分块改为等待重新入库
+            index.release_skipped(stale)
+        logging.info(f"[near_duplicate] Sketch index synced ({len(seen)} chunks).")
+        index.synced = True
+        return index
@@ -0,0 +1,144 @@
+#novel_generator/project_state.py
+# -*- coding: utf-8 -*-
+"""
+项目核心文本文件（架构、目录、全局摘要、角色状态、伏笔记录）的共享读写缓存：
+- 每个项目目录一个 ProjectState 实例，生成流程与界面各标签页共用
+- 读取时只做一次 os.stat，按 (inode, mtime, size) 判断缓存是否仍然有效；
+  外部编辑器修改文件后下一次读取自动重新加载
+- 写入经由同一实例完成并同步更新缓存；章节目录的解析索引同样按文件变化失效
+"""
+import os
+import logging
+import threading
+from chapter_directory_parser import get_blueprint_index
+
+ARCHITECTURE = "Novel_architecture.txt"
+DIRECTORY = "Novel_directory.txt"
+GLOBAL_SUMMARY = "global_summary.txt"
+CHARACTER_STATE = "character_state.txt"
+FORESHADOWING = "foreshadowing_records.txt"
+STATE_FILES = (ARCHITECTURE, DIRECTORY, GLOBAL_SUMMARY, CHARACTER_STATE, FORESHADOWING)
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class ProjectState:
+    """
+    项目目录的文本文件缓存。同一实例可在多个线程间共享。
+    文件名参数使用 STATE_FILES 中的常量，也接受项目目录下的其他相对路径。
+    """
+    def __init__(self, filepath: str):
+        self.filepath = os.path.abspath(filepath)
+        self._lock = threading.Lock()
+        self._texts = {}  # 文件名 -> (stamp, 内容)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.filepath, name)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def read(self, name: str) -> str:
+        """读取文件内容（与 utils.read_file 相同：不存在或出错时返回空字符串）"""
+        path = self.path(name)
+        stamp = _stamp(path)
+        if stamp is None:
+            with self._lock:
+                self._texts.pop(name, None)
+            return ""
+        with self._lock:
+            cached = self._texts.get(name)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except Exception as e:
+            logging.warning(f"[ProjectState] Failed to read {path}: {e}")
+            return ""
+        # 读取期间文件若被改写，缓存的时间戳与内容可能不一致，此时不缓存
+        if _stamp(path) == stamp:
+            with self._lock:
+                self._texts[name] = (stamp, content)
+        return content
+
+    def write(self, name: str, content: str) -> bool:
+        """覆盖写入并更新缓存"""
+        path = self.path(name)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        except Exception as e:
+            logging.error(f"[ProjectState] Failed to write {path}: {e}")
+            self.invalidate(name)
+            return False
+        stamp = _stamp(path)
+        with self._lock:
+            if stamp is None:
+                self._texts.pop(name, None)
+            else:
+                self._texts[name] = (stamp, content)
+        return True
+
+    def append(self, name: str, text: str) -> bool:
+        """在文件末尾追加文本（与 utils.append_text_to_file 相同，自动补换行）"""
+        if text and not text.startswith("\n"):
+            text = "\n" + text
+        return self.write(name, self.read(name) + text)
+
+    def clear(self, name: str) -> bool:
+        return self.write(name, "")
+
+    def invalidate(self, name: str = None):
+        """丢弃缓存（name 为空时丢弃全部），下次读取时重新加载"""
+        with self._lock:
+            if name is None:
+                self._texts.clear()
+            else:
+                self._texts.pop(name, None)
+
+    def blueprint_index(self):
+        """章节目录的解析索引（由 chapter_directory_parser 按文件缓存）"""
+        return get_blueprint_index(self.path(DIRECTORY))
+
+    @property
+    def architecture(self) -> str:
+        return self.read(ARCHITECTURE)
+
+    @property
+    def directory(self) -> str:
+        return self.read(DIRECTORY)
+
+    @property
+    def global_summary(self) -> str:
+        return self.read(GLOBAL_SUMMARY)
+
+    @property
+    def character_state(self) -> str:
+        return self.read(CHARACTER_STATE)
+
+    @property
+    def foreshadowing(self) -> str:
+        return self.read(FORESHADOWING)
+
+
+_states: dict = {}
+_states_lock = threading.Lock()
+
+
+def get_project_state(filepath: str) -> ProjectState:
+    """获取项目目录对应的 ProjectState（进程内单例）"""
+    key = os.path.abspath(filepath or ".")
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = ProjectState(key)
+            _states[key] = state
+        return state
@@ -6,7 +6,7 @@ import requests
 from llm_adapters import create_llm_adapter
 from embedding_adapters import create_embedding_adapter
 from novel_generator.common import invoke_with_cleaning
-from novel_generator.vectorstore_utils import load_vector_store
+from novel_generator.vectorstore_utils import load_vector_store, hybrid_search_many
 
 # 问答专用提示词
 QA_PROMPT_TEMPLATE = """\
@@ -56,8 +56,9 @@ def answer_novel_question(
 
     # 2. 检索相关内容 (Search)
     try:
-        # 搜索最相关的 K 个片段
-        docs = vector_store.similarity_search(question, k=top_k)
+        # 搜索最相关的 K 个片段（向量 + 词法混合检索，人名地名等专有名词更易命中）
+        per_query, _ = hybrid_search_many(embedding_adapter, [question], filepath, k=top_k)
+        docs = per_query[0]
         if not docs:
             return "未在知识库中检索到相关内容。"
             
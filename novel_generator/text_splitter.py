@@ -0,0 +1,159 @@
+#novel_generator/text_splitter.py
+# -*- coding: utf-8 -*-
+"""
+中英文混排文本的流式分句与分块：
+- 按中文/西文句末标点、引号括号与换行切句，不依赖 nltk 及其数据包
+- 按估算的 token 数组块，支持块间重叠
+- 输入可以是字符串，也可以是逐段产出字符串的迭代器（如按块读取的大文件），内存占用有界
+- 产出的每个分块都带有其在原文中的起始字符位置
+"""
+import re
+
+DEFAULT_CHUNK_TOKENS = 500
+DEFAULT_OVERLAP_TOKENS = 50
+# 流式输入中连续这么多字符都没有句子边界时，强制作为一句产出，保证缓冲区有界
+MAX_SENTENCE_CHARS = 4000
+
+# 句末标点（含省略号）或换行，其后紧跟的右引号/右括号与空白归入本句
+_BOUNDARY = re.compile(
+    r"(?:[。！？!?；;…]+|\.(?=[\s\"'”’」』）)】》]|$)|\n)[\"'”’」』）)】》]*\s*"
+)
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> float:
+    """
+    粗略估算 token 数：中日韩文字与全角标点每字约 1 个，
+    英文字母/数字约 4 个字符 1 个，空白不计，其余符号按半个计。
+    """
+    total = 0.0
+    for ch in text:
+        if _CJK.match(ch):
+            total += 1
+        elif ch.isascii() and ch.isalnum():
+            total += 0.25
+        elif not ch.isspace():
+            total += 0.5
+    return total
+
+
+def _as_pieces(source):
+    if isinstance(source, str):
+        yield source
+    else:
+        for piece in source:
+            if piece:
+                yield piece
+
+
+def iter_sentences(source):
+    """
+    逐句产出 (起始位置, 句子)。相邻句子首尾相接、完整覆盖原文（含空白），
+    因此原文任意区间都可由连续的句子拼出。
+    """
+    buffer = ""
+    base = 0
+    for piece in _as_pieces(source):
+        buffer += piece
+        start = 0
+        for match in _BOUNDARY.finditer(buffer):
+            # 位于缓冲区末尾的边界可能还会被下一段的引号/空白延长，留待下一轮
+            if match.end() >= len(buffer):
+                break
+            if match.end() > start:
+                yield base + start, buffer[start:match.end()]
+                start = match.end()
+        buffer = buffer[start:]
+        base += start
+        if len(buffer) > MAX_SENTENCE_CHARS:
+            yield base, buffer
+            base += len(buffer)
+            buffer = ""
+    if buffer:
+        start = 0
+        for match in _BOUNDARY.finditer(buffer):
+            if match.end() > start:
+                yield base + start, buffer[start:match.end()]
+                start = match.end()
+        if start < len(buffer):
+            yield base + start, buffer[start:]
+
+
+def _hard_split(offset: int, sentence: str, max_tokens: int):
+    """超长句按 token 上限硬切"""
+    start = 0
+    used = 0.0
+    for i, ch in enumerate(sentence):
+        cost = estimate_tokens(ch)
+        if used + cost > max_tokens and i > start:
+            yield offset + start, sentence[start:i]
+            start, used = i, 0.0
+        used += cost
+    if start < len(sentence):
+        yield offset + start, sentence[start:]
+
+
+def iter_chunks(source, max_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """
+    将句子累积为不超过 max_tokens 的分块，逐块产出 (起始位置, 分块文本)。
+    相邻分块之间保留不超过 overlap_tokens 的末尾整句作为重叠。
+    分块文本去除首尾空白，起始位置相应调整。
+    """
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+    window = []  # [(offset, sentence, tokens)]
+    window_tokens = 0.0
+    fresh = False  # 窗口中是否有尚未输出过的句子
+
+    def _emit():
+        text = "".join(s for _, s, _ in window)
+        stripped = text.lstrip()
+        lead = len(text) - len(stripped)
+        stripped = stripped.rstrip()
+        if stripped:
+            return window[0][0] + lead, stripped
+        return None
+
+    def _sentences():
+        for offset, sentence in iter_sentences(source):
+            if estimate_tokens(sentence) > max_tokens:
+                yield from _hard_split(offset, sentence, max_tokens)
+            else:
+                yield offset, sentence
+
+    for offset, sentence in _sentences():
+        tokens = estimate_tokens(sentence)
+        if window and fresh and window_tokens + tokens > max_tokens:
+            chunk = _emit()
+            if chunk:
+                yield chunk
+            # 保留末尾若干整句作为下一块的开头
+            kept = []
+            kept_tokens = 0.0
+            for item in reversed(window):
+                if kept_tokens + item[2] > overlap_tokens:
+                    break
+                kept.insert(0, item)
+                kept_tokens += item[2]
+            window, window_tokens = kept, kept_tokens
+            fresh = False
+        # 重叠部分加上新句仍超限时，丢弃重叠
+        while window and window_tokens + tokens > max_tokens:
+            window_tokens -= window.pop(0)[2]
+        window.append((offset, sentence, tokens))
+        window_tokens += tokens
+        if tokens > 0 or sentence.strip():
+            fresh = True
+    if window and fresh:
+        chunk = _emit()
+        if chunk:
+            yield chunk
+
+
+def split_text(text: str, max_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """一次性切分字符串，返回 (分块列表, 起始位置列表)"""
+    segments = []
+    offsets = []
+    for offset, chunk in iter_chunks(text, max_tokens, overlap_tokens):
+        segments.append(chunk)
+        offsets.append(offset)
+    return segments, offsets
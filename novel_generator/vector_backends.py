@@ -0,0 +1,476 @@
+#novel_generator/vector_backends.py
+# -*- coding: utf-8 -*-
+"""
+向量库存储后端：
+- ChromaBackend：持久化 Chroma 集合（默认，兼容旧项目）
+- NumpyBackend：归一化向量存放在内存映射的 .npy 文件中，文本与元数据存放在 SQLite 旁路文件中，
+  检索为一次矩阵-向量乘法的精确 top-k；打开时不启动任何后台线程
+向量库目录中的 backend.json 记录该目录使用的后端类型，embedding.json 记录生成向量所用的
+embedding 配置与维度。
+"""
+import os
+import json
+import logging
+import sqlite3
+import threading
+import numpy as np
+from langchain.docstore.document import Document
+
+BACKEND_MARKER = "backend.json"
+EMBEDDING_INFO_FILE = "embedding.json"
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+_default_backend = "chroma"
+
+
+def set_default_vector_backend(name: str):
+    """设置新建向量库使用的后端（已有向量库始终沿用其创建时的后端）"""
+    global _default_backend
+    name = (name or "chroma").strip().lower()
+    if name not in VECTOR_BACKENDS:
+        logging.warning(f"Unknown vector backend '{name}', falling back to chroma.")
+        name = "chroma"
+    _default_backend = name
+
+
+def get_default_vector_backend() -> str:
+    return _default_backend
+
+
+def detect_vector_backend(store_dir: str) -> str | None:
+    """根据 backend.json 或已有文件判断目录使用的后端；空目录返回 None"""
+    marker = os.path.join(store_dir, BACKEND_MARKER)
+    if os.path.exists(marker):
+        try:
+            with open(marker, "r", encoding="utf-8") as f:
+                name = json.load(f).get("backend")
+            if name in VECTOR_BACKENDS:
+                return name
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to read vector backend marker: {e}")
+    if os.path.exists(os.path.join(store_dir, ChromaBackend.FINGERPRINT_FILE)):
+        return "chroma"
+    if os.path.exists(os.path.join(store_dir, NumpyBackend.FINGERPRINT_FILE)):
+        return "numpy"
+    return None
+
+
+def _write_backend_marker(store_dir: str, name: str):
+    with open(os.path.join(store_dir, BACKEND_MARKER), "w", encoding="utf-8") as f:
+        json.dump({"backend": name}, f)
+
+
+class EmbeddingDimensionMismatchError(ValueError):
+    """当前 embedding 模型的向量维度与向量库中已存储的不一致"""
+
+
+def read_embedding_info(store_dir: str) -> dict:
+    """读取向量库记录的 embedding 配置 {"adapter", "model", "dim"}；没有记录时返回空 dict"""
+    try:
+        with open(os.path.join(store_dir, EMBEDDING_INFO_FILE), "r", encoding="utf-8") as f:
+            return json.load(f) or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def write_embedding_info(store_dir: str, info: dict):
+    with open(os.path.join(store_dir, EMBEDDING_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False)
+
+
+class VectorBackend:
+    """
+    向量库后端统一接口。get/query 的返回格式与 chromadb 集合一致：
+      get   -> {"ids": [...], "documents": [...], "metadatas": [...]}
+      query -> {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+    """
+    name = ""
+    FINGERPRINT_FILE = ""
+
+    def __init__(self, store_dir: str, embeddings):
+        self.store_dir = store_dir
+        self.embeddings = embeddings
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def dimension(self):
+        """已存储向量的维度；空库返回 None"""
+        raise NotImplementedError
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include_documents: bool = True) -> dict:
+        raise NotImplementedError
+
+    def get_vectors(self, ids: list) -> dict:
+        """读取已存储的向量，返回 {id: np.ndarray}；不存在的 ID 不出现在结果中"""
+        raise NotImplementedError
+
+    def delete(self, ids: list):
+        raise NotImplementedError
+
+    def add(self, ids: list, texts: list, metadatas: list):
+        raise NotImplementedError
+
+    def query(self, vectors: list, n_results: int, where=None) -> dict:
+        raise NotImplementedError
+
+    def close(self):
+        """释放文件句柄。只能由句柄的唯一持有者调用；进程内缓存共享的句柄不关闭，随最后一个引用释放而回收"""
+        pass
+
+    def similarity_search(self, query: str, k: int = 4) -> list:
+        """兼容 LangChain VectorStore 的常用检索接口"""
+        n_results = min(k, self.count())
+        if n_results <= 0:
+            return []
+        result = self.query([self.embeddings.embed_query(query)], n_results)
+        return [
+            Document(page_content=text, metadata=meta or {})
+            for text, meta in zip(result["documents"][0], result["metadatas"][0])
+            if text
+        ]
+
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+    FINGERPRINT_FILE = "chroma.sqlite3"
+
+    def __init__(self, store_dir: str, embeddings):
+        super().__init__(store_dir, embeddings)
+        # Chroma 导入开销较大，仅在实际使用该后端时导入
+        from langchain_chroma import Chroma
+        from chromadb.config import Settings
+        self.store = Chroma(
+            persist_directory=store_dir,
+            embedding_function=embeddings,
+            client_settings=Settings(anonymized_telemetry=False),
+            collection_name="novel_collection"
+        )
+        self._collection = self.store._collection
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def dimension(self):
+        result = self._collection.get(limit=1, include=["embeddings"])
+        embeddings = result.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        return len(embeddings[0])
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include_documents: bool = True) -> dict:
+        result = self._collection.get(
+            ids=ids, where=where, limit=limit, offset=offset,
+            include=["documents", "metadatas"] if include_documents else []
+        )
+        return {
+            "ids": result.get("ids") or [],
+            "documents": result.get("documents") or [],
+            "metadatas": result.get("metadatas") or [],
+        }
+
+    def get_vectors(self, ids: list) -> dict:
+        if not ids:
+            return {}
+        result = self._collection.get(ids=list(ids), include=["embeddings"])
+        embeddings = result.get("embeddings")
+        if embeddings is None:
+            return {}
+        return {
+            chunk_id: np.asarray(vec, dtype=np.float32)
+            for chunk_id, vec in zip(result.get("ids") or [], embeddings)
+            if vec is not None
+        }
+
+    def delete(self, ids: list):
+        if ids:
+            self._collection.delete(ids=ids)
+
+    def add(self, ids: list, texts: list, metadatas: list):
+        self.store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+
+    def query(self, vectors: list, n_results: int, where=None) -> dict:
+        query_kwargs = {"query_embeddings": vectors, "n_results": n_results,
+                        "include": ["documents", "metadatas", "distances"]}
+        if where is not None:
+            query_kwargs["where"] = where
+        return self._collection.query(**query_kwargs)
+
+
+_WHERE_COLUMNS = {"source", "chapter", "doc", "offset"}
+_WHERE_OPS = {"$eq": "=", "$ne": "!=", "$lt": "<", "$lte": "<=", "$gt": ">", "$gte": ">="}
+
+
+def _where_to_sql(where: dict):
+    """将 Chroma 风格的 where 条件翻译为 SQL 片段与参数（支持 NumpyBackend 用到的子集）"""
+    clauses = []
+    params = []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_to_sql(sub) for sub in value]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, sub_params in parts:
+                params.extend(sub_params)
+            continue
+        if key not in _WHERE_COLUMNS:
+            raise ValueError(f"Unsupported where field: {key}")
+        column = f'"{key}"'
+        if not isinstance(value, dict):
+            value = {"$eq": value}
+        for op, operand in value.items():
+            if op in ("$in", "$nin"):
+                placeholders = ",".join("?" * len(operand)) or "NULL"
+                clauses.append(f"{column} {'IN' if op == '$in' else 'NOT IN'} ({placeholders})")
+                params.extend(operand)
+            elif op in _WHERE_OPS:
+                clauses.append(f"{column} {_WHERE_OPS[op]} ?")
+                params.append(operand)
+            else:
+                raise ValueError(f"Unsupported where operator: {op}")
+    return "(" + " AND ".join(clauses) + ")" if clauses else "1", params
+
+
+class NumpyBackend(VectorBackend):
+    """
+    轻量向量库：vectors.npy 保存 (容量, 维度) 的归一化向量矩阵（内存映射读写），
+    chunks.sqlite3 保存每行对应的 ID、文本与元数据。删除的行会被后续写入复用。
+    """
+    name = "numpy"
+    FINGERPRINT_FILE = "chunks.sqlite3"
+    MATRIX_FILE = "vectors.npy"
+    MIN_CAPACITY = 1024
+
+    def __init__(self, store_dir: str, embeddings, dtype: str = "float32"):
+        super().__init__(store_dir, embeddings)
+        self._lock = threading.RLock()
+        self._mm = None
+        self._conn = sqlite3.connect(os.path.join(store_dir, self.FINGERPRINT_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY,"
+            " id TEXT UNIQUE NOT NULL,"
+            " text TEXT NOT NULL,"
+            " source TEXT,"
+            " chapter INTEGER,"
+            " doc TEXT,"
+            ' "offset" INTEGER,'
+            " meta TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        # 已删除分块腾出的矩阵行，写入时优先复用
+        self._conn.execute("CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)")
+        self._conn.commit()
+        stored_dtype = self._get_meta("dtype")
+        self.dtype = np.dtype(stored_dtype or dtype)
+        if stored_dtype is None:
+            self._set_meta("dtype", self.dtype.name)
+            self._conn.commit()
+        if self._get_meta("free_rows_tracked") is None:
+            # 没有空闲行记录的库：按已用行与现存分块的差集补建一次
+            taken = {r[0] for r in self._conn.execute("SELECT row FROM chunks")}
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO free_rows (row) VALUES (?)",
+                ((r,) for r in range(self._used_rows()) if r not in taken)
+            )
+            self._set_meta("free_rows_tracked", 1)
+            self._conn.commit()
+
+    # ---------- 元信息 ----------
+    def _get_meta(self, key: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _used_rows(self) -> int:
+        return int(self._get_meta("used_rows") or 0)
+
+    # ---------- 矩阵文件 ----------
+    def _matrix_path(self) -> str:
+        return os.path.join(self.store_dir, self.MATRIX_FILE)
+
+    def _matrix(self):
+        if self._mm is None and os.path.exists(self._matrix_path()):
+            self._mm = np.load(self._matrix_path(), mmap_mode="r+")
+        return self._mm
+
+    def _ensure_capacity(self, rows_needed: int, dim: int):
+        mm = self._matrix()
+        if mm is not None:
+            if mm.shape[1] != dim:
+                raise ValueError(f"Embedding dimension mismatch: store has {mm.shape[1]}, got {dim}")
+            if mm.shape[0] >= rows_needed:
+                return
+        old_rows = mm.shape[0] if mm is not None else 0
+        capacity = max(rows_needed, old_rows * 2, self.MIN_CAPACITY)
+        tmp_path = self._matrix_path() + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(capacity, dim))
+        used = self._used_rows()
+        if mm is not None and used:
+            grown[:used] = mm[:used]
+        grown.flush()
+        del grown
+        # 替换前释放旧映射（Windows 下被映射的文件无法覆盖）
+        self._mm = None
+        del mm
+        os.replace(tmp_path, self._matrix_path())
+        logging.info(f"[numpy_backend] Vector matrix grown to {capacity} rows (dim={dim}).")
+
+    # ---------- 接口实现 ----------
+    def close(self):
+        with self._lock:
+            self._mm = None
+            self._conn.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def dimension(self):
+        with self._lock:
+            mm = self._matrix()
+            if mm is None or not self._used_rows():
+                return None
+            return int(mm.shape[1])
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include_documents: bool = True) -> dict:
+        sql = "SELECT id, text, meta FROM chunks WHERE 1"
+        params = []
+        if ids is not None:
+            if not ids:
+                return {"ids": [], "documents": [], "metadatas": []}
+            sql += f" AND id IN ({','.join('?' * len(ids))})"
+            params.extend(ids)
+        if where:
+            where_sql, where_params = _where_to_sql(where)
+            sql += " AND " + where_sql
+            params.extend(where_params)
+        sql += " ORDER BY row"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([int(limit), int(offset or 0)])
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return {
+            "ids": [r[0] for r in rows],
+            "documents": [r[1] for r in rows] if include_documents else [],
+            "metadatas": [json.loads(r[2]) if r[2] else {} for r in rows] if include_documents else [],
+        }
+
+    def get_vectors(self, ids: list) -> dict:
+        if not ids:
+            return {}
+        with self._lock:
+            mm = self._matrix()
+            if mm is None:
+                return {}
+            found = {}
+            for start in range(0, len(ids), 500):
+                part = list(ids[start:start + 500])
+                for chunk_id, row in self._conn.execute(
+                    f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(part))})", part
+                ):
+                    found[chunk_id] = np.array(mm[row], dtype=np.float32)
+            return found
+
+    def delete(self, ids: list):
+        if not ids:
+            return
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                part = list(ids[start:start + 500])
+                placeholders = ",".join("?" * len(part))
+                self._conn.execute(
+                    f"INSERT OR IGNORE INTO free_rows (row) SELECT row FROM chunks WHERE id IN ({placeholders})", part
+                )
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", part)
+            self._conn.commit()
+
+    def add(self, ids: list, texts: list, metadatas: list):
+        if not ids:
+            return
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError(f"Embedding failed for {len(texts)} documents")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        with self._lock:
+            # 覆盖写入同 ID 的分块
+            self.delete(ids)
+            used = self._used_rows()
+            free_rows = [r[0] for r in self._conn.execute(
+                "SELECT row FROM free_rows ORDER BY row LIMIT ?", (len(ids),)
+            )]
+            new_rows = list(range(used, used + len(ids) - len(free_rows)))
+            rows = free_rows + new_rows
+            self._ensure_capacity(used + len(new_rows), vectors.shape[1])
+            mm = self._matrix()
+            for row, vec in zip(rows, vectors):
+                mm[row] = vec.astype(self.dtype)
+            mm.flush()
+            if free_rows:
+                # 取的是最小的若干空闲行，按上界整体删除即可
+                self._conn.execute("DELETE FROM free_rows WHERE row <= ?", (free_rows[-1],))
+            for row, chunk_id, text, meta in zip(rows, ids, texts, metadatas):
+                meta = meta or {}
+                self._conn.execute(
+                    'INSERT INTO chunks (row, id, text, source, chapter, doc, "offset", meta)'
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row, chunk_id, text, meta.get("source"), meta.get("chapter"), meta.get("doc"),
+                     meta.get("offset"), json.dumps(meta, ensure_ascii=False))
+                )
+            self._set_meta("used_rows", used + len(new_rows))
+            self._conn.commit()
+
+    def query(self, vectors: list, n_results: int, where=None) -> dict:
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        empty = {"ids": [[] for _ in vectors], "documents": [[] for _ in vectors],
+                 "metadatas": [[] for _ in vectors], "distances": [[] for _ in vectors]}
+        with self._lock:
+            sql = "SELECT row FROM chunks"
+            params = []
+            if where:
+                where_sql, params = _where_to_sql(where)
+                sql += " WHERE " + where_sql
+            rows = np.fromiter((r[0] for r in self._conn.execute(sql, params)), dtype=np.int64)
+            mm = self._matrix()
+            if mm is None or rows.size == 0:
+                return empty
+            used = self._used_rows()
+            # 一次矩阵乘法得到全部查询与全部向量的余弦相似度
+            sims = np.asarray(mm[:used] @ queries.T, dtype=np.float32)[rows]
+            k = min(n_results, rows.size)
+            result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            for qi in range(queries.shape[0]):
+                scores = sims[:, qi]
+                top = np.argpartition(-scores, k - 1)[:k] if k < rows.size else np.arange(rows.size)
+                top = top[np.argsort(-scores[top])]
+                hit_rows = [int(r) for r in rows[top]]
+                placeholders = ",".join("?" * len(hit_rows))
+                by_row = {
+                    r[0]: r[1:] for r in self._conn.execute(
+                        f"SELECT row, id, text, meta FROM chunks WHERE row IN ({placeholders})", hit_rows
+                    )
+                }
+                result["ids"].append([by_row[r][0] for r in hit_rows])
+                result["documents"].append([by_row[r][1] for r in hit_rows])
+                result["metadatas"].append([json.loads(by_row[r][2]) if by_row[r][2] else {} for r in hit_rows])
+                result["distances"].append([float(1.0 - scores[i]) for i in top])
+            return result
+
+
+def open_vector_backend(store_dir: str, embeddings, backend: str = None) -> VectorBackend:
+    """
+    打开（或在空目录中新建）向量库。已有向量库沿用其后端；
+    新建时使用 backend 参数，未指定则使用默认设置。
+    """
+    name = detect_vector_backend(store_dir) or backend or _default_backend
+    backend = NumpyBackend(store_dir, embeddings) if name == "numpy" else ChromaBackend(store_dir, embeddings)
+    if not os.path.exists(os.path.join(store_dir, BACKEND_MARKER)):
+        _write_backend_marker(store_dir, name)
+    return backend
@@ -0,0 +1,395 @@
+#novel_generator/vectorstore_rebuild.py
+# -*- coding: utf-8 -*-
+"""
+向量库重建（更换 embedding 模型后使用）：
+- 重新切分 chapters/chapter_*.txt，并沿用旧库中已导入的知识库分块（文本与元数据不变）；
+  旧版本写入的无来源分块归为知识库分块（doc="legacy"）一并沿用
+- 以当前 embedding 配置按批、有界并发地重新生成向量，写入与 vectorstore 同级的构建目录
+- 构建目录中已写入的分块在重新运行时跳过，中断后可继续
+- 全部写入后整体替换旧向量库，替换前旧库保持可用；重建只在读取快照与替换时占用写入锁，
+  其间定稿入库、知识库导入照常写入旧库并记入重建日志，替换前按范围补写到新库
+- 新库同样剔除近重复分块（按书中先后保留最早的一份），所用签名索引在替换时接替项目的近重复索引；
+  旧库中因近重复被跳过的知识库分块也一并沿用
+"""
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from novel_generator.llm_cache import get_cache_dir
+from novel_generator.near_duplicate import SketchIndex, chunk_scope, get_sketch_index, scope_order
+from novel_generator.text_splitter import split_text
+from novel_generator.vector_backends import detect_vector_backend, open_vector_backend, write_embedding_info
+from novel_generator.vectorstore_utils import (
+    LCEmbeddingWrapper,
+    REBUILD_DIR_SUFFIX,
+    chunk_scope_where,
+    embedding_info_for,
+    get_vectorstore_dir,
+    make_chunk_id,
+    make_chunk_metadata,
+    recover_vector_store_swap,
+    start_rebuild_journal,
+    stop_rebuild_journal,
+    swap_in_vector_store,
+    take_rebuild_journal,
+    vector_store_write_lock
+)
+
+REBUILD_BATCH_SIZE = 64
+REBUILD_WORKERS = 4
+# 构建目录中记录本次重建所用 embedding 配置的文件；配置变化时丢弃已构建的部分
+REBUILD_STATE_FILE = "rebuild.json"
+# 沿用旧库分块的来源（章节分块从章节文件重新切分）
+CARRIED_SOURCES = ("knowledge", "text")
+# 无来源的旧分块沿用时归入的知识库文件名
+LEGACY_DOC = "legacy"
+# 新库的近重复签名索引（位于项目 .cache 目录，随构建目录一起续建）
+REBUILD_SKETCH_DB = "near_duplicates.rebuild.sqlite3"
+
+_CHAPTER_FILE = re.compile(r"^chapter_(\d+)\.txt$")
+
+
+def _split_chapter(chapter: int, path: str) -> list:
+    """重新切分一个章节文件，返回 [(id, text, metadata)]"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        segments, offsets = split_text(f.read())
+    return [
+        (make_chunk_id("chapter", chapter, index, text), text, make_chunk_metadata("chapter", chapter, offset))
+        for index, (text, offset) in enumerate(zip(segments, offsets))
+    ]
+
+
+def _chapter_chunks(filepath: str) -> list:
+    """重新切分全部已定稿章节，返回 [(id, text, metadata)]"""
+    chapters_dir = os.path.join(filepath, "chapters")
+    if not os.path.isdir(chapters_dir):
+        return []
+    numbered = []
+    for name in os.listdir(chapters_dir):
+        match = _CHAPTER_FILE.match(name)
+        if match:
+            numbered.append((int(match.group(1)), os.path.join(chapters_dir, name)))
+    items = []
+    for chapter, path in sorted(numbered):
+        items.extend(_split_chapter(chapter, path))
+    return items
+
+
+def _carried_chunks(store_dir: str, page_size: int = 1000):
+    """
+    读取旧库中的知识库分块（不需要 embedding，维度不兼容的旧库也能读取）。
+    没有来源元数据的旧分块无法判断出处，标记为 source=knowledge、doc=LEGACY_DOC 后沿用。
+    返回 ([(id, text, metadata)], 其中无来源旧分块的数量)。
+    """
+    if not os.path.exists(store_dir):
+        return [], 0
+    old = open_vector_backend(store_dir, None)
+    items = []
+    legacy = 0
+    try:
+        total = old.count()
+        offset = 0
+        while offset < total:
+            page = old.get(limit=page_size, offset=offset)
+            page_ids = page.get("ids") or []
+            if not page_ids:
+                break
+            documents = page.get("documents") or []
+            metadatas = page.get("metadatas") or []
+            for i, chunk_id in enumerate(page_ids):
+                meta = metadatas[i] if i < len(metadatas) and metadatas[i] else {}
+                text = documents[i] if i < len(documents) else ""
+                if not text:
+                    continue
+                if meta.get("source") in CARRIED_SOURCES:
+                    items.append((chunk_id, text, meta))
+                elif not meta.get("source"):
+                    items.append((chunk_id, text, {
+                        **meta, **make_chunk_metadata("knowledge", 0, meta.get("offset", -1), LEGACY_DOC)
+                    }))
+                    legacy += 1
+            offset += len(page_ids)
+    finally:
+        old.close()
+    return items, legacy
+
+
+def _skipped_chunks(filepath: str, scope: str = None) -> list:
+    """旧库中因近重复被跳过的知识库分块（章节分块从章节文件重新切分，无需沿用）"""
+    try:
+        skipped = get_sketch_index(filepath).skipped_chunks(scope)
+    except Exception as e:
+        logging.warning(f"Failed to read skipped near-duplicate chunks: {e}")
+        return []
+    return [item for item in skipped if item[2].get("source") in CARRIED_SOURCES]
+
+
+def _open_build_sketch_index(filepath: str, resumed: bool) -> SketchIndex:
+    """打开新库的近重复签名索引；不是续建时从空索引开始"""
+    db_path = os.path.abspath(os.path.join(get_cache_dir(filepath), REBUILD_SKETCH_DB))
+    if not resumed:
+        _remove_build_sketch_db(db_path)
+    return SketchIndex(db_path)
+
+
+def _remove_build_sketch_db(db_path: str):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(db_path + suffix)
+        except OSError:
+            pass
+
+
+def _evict_displaced(new_store, sketch_index: SketchIndex, displaced: dict):
+    """从新库移除被书中更早的近重复分块取代的分块"""
+    found = new_store.get(ids=list(displaced))
+    evicted = found.get("ids") or []
+    if not evicted:
+        return
+    documents = found.get("documents") or []
+    metadatas = found.get("metadatas") or []
+    sketch_index.displace([
+        (chunk_id, displaced[chunk_id], documents[i] or "", metadatas[i] if i < len(metadatas) else {})
+        for i, chunk_id in enumerate(evicted)
+    ])
+    new_store.delete(evicted)
+
+
+def _add_to_build(new_store, sketch_index: SketchIndex, items: list, current_ids: set) -> int:
+    """剔除近重复后写入新库，返回写入的分块数"""
+    if not items:
+        return 0
+    duplicates, displaced = sketch_index.claim(
+        [item[0] for item in items], [item[1] for item in items], [item[2] for item in items],
+        current_ids=current_ids
+    )
+    fresh = [item for item in items if item[0] not in duplicates]
+    if fresh:
+        try:
+            new_store.add(
+                ids=[chunk_id for chunk_id, _, _ in fresh],
+                texts=[text for _, text, _ in fresh],
+                metadatas=[meta for _, _, meta in fresh]
+            )
+        except Exception:
+            sketch_index.delete([item[0] for item in fresh])
+            raise
+        sketch_index.drop_skipped([item[0] for item in fresh])
+    if displaced:
+        _evict_displaced(new_store, sketch_index, displaced)
+    return len(fresh)
+
+
+def _replay_journal(filepath: str, store_dir: str, new_store, sketch_index: SketchIndex, scopes: set) -> int:
+    """
+    把重建期间写入过的分块范围补写到新库：章节从章节文件重新切分，其他来源从旧库读取（含被跳过的近重复分块）；
+    先写入缺少的分块，再删除该范围多余的分块并重新写入因它们而被跳过的分块。返回补写的分块数。
+    """
+    if not scopes:
+        return 0
+    old = None
+    written = 0
+    try:
+        # 按书中先后补写，近重复时保留更早的一份
+        ordered = sorted(scopes, key=lambda s: (scope_order(chunk_scope(make_chunk_metadata(s[0], s[1], -1, s[2]))), s))
+        for source, chapter, doc in ordered:
+            where = chunk_scope_where(source, chapter, doc)
+            scope = chunk_scope(make_chunk_metadata(source, chapter, -1, doc))
+            if source == "chapter":
+                path = os.path.join(filepath, "chapters", f"chapter_{chapter}.txt")
+                items = _split_chapter(chapter, path) if os.path.exists(path) else []
+            else:
+                if old is None and os.path.exists(store_dir):
+                    old = open_vector_backend(store_dir, None)
+                page = old.get(where=where) if old is not None else {}
+                metadatas = page.get("metadatas") or []
+                items = [
+                    (chunk_id, text, metadatas[i] if i < len(metadatas) else {})
+                    for i, (chunk_id, text) in enumerate(zip(page.get("ids") or [], page.get("documents") or []))
+                    if text
+                ]
+                items.extend(_skipped_chunks(filepath, scope))
+            keep = {item[0] for item in items}
+            sketch_index.forget_skipped(scope, keep)
+            current = set(new_store.get(where=where, include_documents=False)["ids"])
+            written += _add_to_build(new_store, sketch_index, [item for item in items if item[0] not in current], keep)
+            stale = list(current - keep)
+            if stale:
+                new_store.delete(stale)
+                sketch_index.delete(stale)
+                released = sketch_index.release_skipped(stale)
+                written += _add_to_build(new_store, sketch_index, released, {item[0] for item in released})
+    finally:
+        if old is not None:
+            old.close()
+    if written:
+        logging.info(f"Carried {written} chunk(s) written during the rebuild into the new vector store.")
+    return written
+
+
+def _prepare_build_dir(build_dir: str, state: dict) -> bool:
+    """准备构建目录；返回是否沿用了上次中断的构建"""
+    state_path = os.path.join(build_dir, REBUILD_STATE_FILE)
+    if os.path.exists(build_dir):
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        if previous and previous.get("identity") == state["identity"]:
+            return True
+        logging.info("Discarding previous rebuild built with a different embedding configuration.")
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    return False
+
+
+def rebuild_vector_store(
+    embedding_api_key: str,
+    embedding_url: str,
+    embedding_interface_format: str,
+    embedding_model_name: str,
+    filepath: str,
+    progress_callback=None,
+    batch_size: int = REBUILD_BATCH_SIZE,
+    workers: int = REBUILD_WORKERS
+) -> dict:
+    """
+    以当前 embedding 配置重建向量库。
+    progress_callback(done, total, chunks_per_sec) 在每批写入后调用。
+    返回统计 dict（chunks、embedded、resumed、legacy_carried、seconds、completed，失败时含 error）。
+    中断或失败时旧向量库保持不变，重新运行会跳过已写入构建目录的分块。
+    """
+    from novel_generator.embedding_cache import create_cached_embedding_adapter
+    embedding_adapter = create_cached_embedding_adapter(
+        embedding_interface_format,
+        embedding_api_key,
+        embedding_url if embedding_url else "http://localhost:11434/api",
+        embedding_model_name,
+        filepath
+    )
+    store_dir = get_vectorstore_dir(filepath)
+    build_dir = store_dir + REBUILD_DIR_SUFFIX
+    started = time.time()
+    stats = {"chunks": 0, "embedded": 0, "resumed": False, "legacy_carried": 0,
+             "seconds": 0.0, "completed": False}
+    try:
+        # 读取分块快照时阻止其他写入，之后的写入记入重建日志
+        with vector_store_write_lock(filepath):
+            recover_vector_store_swap(store_dir)
+            backend = detect_vector_backend(store_dir) if os.path.exists(store_dir) else None
+            items = _chapter_chunks(filepath)
+            carried, stats["legacy_carried"] = _carried_chunks(store_dir)
+            carried.extend(_skipped_chunks(filepath))
+            start_rebuild_journal(filepath)
+        items.extend(carried)
+        # 同一 ID 只保留一份；按书中先后排列，近重复时保留更早的一份
+        items = list({chunk_id: (chunk_id, text, meta) for chunk_id, text, meta in items}.values())
+        items.sort(key=lambda item: scope_order(chunk_scope(item[2])))
+        stats["chunks"] = len(items)
+        if stats["legacy_carried"]:
+            logging.info(
+                f"Carrying {stats['legacy_carried']} legacy chunk(s) without metadata over "
+                f"as knowledge chunks (doc='{LEGACY_DOC}')."
+            )
+        if not items:
+            logging.info("Nothing to rebuild: no chapters or knowledge chunks found.")
+            stats["completed"] = True
+            return stats
+
+        identity = embedding_info_for(embedding_adapter, 0)
+        stats["resumed"] = _prepare_build_dir(build_dir, {
+            "identity": [identity["adapter"], identity["model"]],
+            "backend": backend,
+            "started": time.strftime("%Y-%m-%d %H:%M:%S")
+        })
+        sketch_index = _open_build_sketch_index(filepath, stats["resumed"])
+        new_store = open_vector_backend(build_dir, LCEmbeddingWrapper(embedding_adapter), backend=backend)
+        try:
+            existing = set()
+            ids = [item[0] for item in items]
+            for start in range(0, len(ids), 500):
+                existing.update(new_store.get(ids=ids[start:start + 500], include_documents=False)["ids"])
+            pending = [item for item in items if item[0] not in existing]
+            if existing:
+                logging.info(f"Resuming rebuild: {len(existing)} chunk(s) already embedded.")
+                known = sketch_index.ids()
+                unsketched = [item for item in items if item[0] in existing and item[0] not in known]
+                if unsketched:
+                    sketch_index.add(*map(list, zip(*unsketched)))
+            # embedding 之前剔除近重复分块
+            duplicates, displaced = sketch_index.claim(
+                [item[0] for item in pending], [item[1] for item in pending], [item[2] for item in pending],
+                current_ids=set(ids)
+            )
+            if duplicates:
+                logging.info(f"Skipping {len(duplicates)} near-duplicate chunk(s) in the rebuilt store.")
+                pending = [item for item in pending if item[0] not in duplicates]
+            stats["chunks"] -= len(duplicates)
+            batches = [pending[i:i + batch_size] for i in range(0, len(pending), max(1, batch_size))]
+            lock = threading.Lock()
+            done = [len(existing)]
+
+            def _embed_batch(batch):
+                new_store.add(
+                    ids=[chunk_id for chunk_id, _, _ in batch],
+                    texts=[text for _, text, _ in batch],
+                    metadatas=[meta for _, _, meta in batch]
+                )
+                with lock:
+                    done[0] += len(batch)
+                    stats["embedded"] += len(batch)
+                    if progress_callback:
+                        elapsed = max(time.time() - started, 1e-6)
+                        progress_callback(done[0], stats["chunks"], stats["embedded"] / elapsed)
+
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                # list() 使任一批次的异常在此处抛出
+                list(pool.map(_embed_batch, batches))
+            if displaced:
+                _evict_displaced(new_store, sketch_index, displaced)
+
+            # 先在锁外补写重建期间的写入，再在锁内补写剩余部分并替换，缩短其他写入的等待
+            scopes, cleared = take_rebuild_journal(filepath)
+            if not cleared:
+                stats["embedded"] += _replay_journal(filepath, store_dir, new_store, sketch_index, scopes)
+            with vector_store_write_lock(filepath):
+                scopes, cleared_now = take_rebuild_journal(filepath)
+                cleared = cleared or cleared_now
+                if not cleared:
+                    stats["embedded"] += _replay_journal(filepath, store_dir, new_store, sketch_index, scopes)
+                    dim = new_store.dimension()
+                    if dim:
+                        write_embedding_info(build_dir, embedding_info_for(embedding_adapter, dim))
+                    new_store.close()
+                    swap_in_vector_store(filepath, build_dir, sketch_index=sketch_index)
+        except Exception as e:
+            logging.warning(f"Vector store rebuild interrupted (progress is kept, run again to resume): {e}")
+            stats["error"] = str(e)
+            stats["seconds"] = time.time() - started
+            return stats
+        finally:
+            new_store.close()
+            sketch_index.close()
+
+        # 新库已替换（或被放弃），其签名索引不再需要
+        _remove_build_sketch_db(sketch_index.db_path)
+        if cleared:
+            # 向量库在重建期间被清空，新库不能再替换上去
+            shutil.rmtree(build_dir, ignore_errors=True)
+            logging.warning("Vector store was cleared during the rebuild; discarded the rebuilt store.")
+            stats["error"] = "向量库在重建期间被清空，已放弃本次重建"
+            stats["seconds"] = time.time() - started
+            return stats
+        stats["completed"] = True
+        stats["seconds"] = time.time() - started
+        logging.info(f"Vector store rebuilt: {stats}")
+        return stats
+    finally:
+        stop_rebuild_journal(filepath)
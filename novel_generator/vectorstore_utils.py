@@ -4,15 +4,17 @@
 向量库相关操作（初始化、更新、检索、清空、文本切分等）
 """
 import os
+import gc
+import hashlib
 import logging
 import traceback
-import nltk
 import numpy as np
 import re
 import ssl
 import requests
+import threading
 import warnings
-from langchain_chroma import Chroma
+import weakref
 logging.basicConfig(
     filename='app.log',      # 日志文件名
     filemode='a',            # 追加模式（'w' 会覆盖）
@@ -24,15 +26,337 @@ logging.basicConfig(
 warnings.filterwarnings('ignore', message='.*Torch was not compiled with flash attention.*')
 os.environ["TOKENIZERS_PARALLELISM"] = "false"  # 禁用tokenizer并行警告
 
-from chromadb.config import Settings
 from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings as LCEmbeddings
 from sklearn.metrics.pairwise import cosine_similarity
 from .common import call_with_retry
+from .lexical_index import get_lexical_index, sync_lexical_index
+from .near_duplicate import chunk_scope, get_sketch_index, sync_sketch_index
+from .vector_backends import (
+    ChromaBackend,
+    EmbeddingDimensionMismatchError,
+    NumpyBackend,
+    open_vector_backend,
+    read_embedding_info,
+    write_embedding_info
+)
+from .text_splitter import DEFAULT_CHUNK_TOKENS, estimate_tokens, split_text
+
+class LCEmbeddingWrapper(LCEmbeddings):
+    """将项目的 embedding 适配器包装为 LangChain Embeddings，供向量库后端使用"""
+    def __init__(self, embedding_adapter):
+        self.embedding_adapter = embedding_adapter
+
+    def embed_documents(self, texts):
+        result = call_with_retry(
+            func=self.embedding_adapter.embed_documents,
+            max_retries=3,
+            fallback_return=None,
+            texts=texts
+        )
+        if result is None or not result:
+            raise ValueError(f"Embedding failed for {len(texts)} documents")
+        return result
+
+    def embed_query(self, query: str):
+        res = call_with_retry(
+            func=self.embedding_adapter.embed_query,
+            max_retries=3,
+            fallback_return=None,
+            query=query
+        )
+        if res is None or not res:
+            raise ValueError(f"Embedding failed for query: {query[:50]}...")
+        return res
+
+
+# ============ 进程内向量库句柄缓存 ============
+# (store_dir, embedding 标识) -> (fingerprint, VectorBackend)
+_store_cache: dict = {}
+_store_cache_lock = threading.Lock()
+
+
+def _embedding_identity(embedding_adapter) -> tuple:
+    """以适配器类型、模型名与接口地址标识一个 embedding 配置"""
+    # 带缓存的包装器与其内部适配器视为同一配置
+    embedding_adapter = getattr(embedding_adapter, "inner", embedding_adapter)
+    model = getattr(embedding_adapter, "model_name", None)
+    if model is None:
+        model = (getattr(embedding_adapter, "payload", None) or {}).get("model")
+    endpoint = getattr(embedding_adapter, "base_url", None) or getattr(embedding_adapter, "url", None)
+    if model is None and endpoint is None:
+        return (type(embedding_adapter).__name__, id(embedding_adapter))
+    return (type(embedding_adapter).__name__, model, endpoint)
+
+
+def _store_fingerprint(store_dir: str):
+    """目录 inode + 后端数据库文件的修改时间与大小；目录不存在时返回 None"""
+    try:
+        dir_stat = os.stat(store_dir)
+    except OSError:
+        return None
+    for name in (ChromaBackend.FINGERPRINT_FILE, NumpyBackend.FINGERPRINT_FILE):
+        try:
+            db_stat = os.stat(os.path.join(store_dir, name))
+            return (dir_stat.st_ino, db_stat.st_mtime_ns, db_stat.st_size)
+        except OSError:
+            continue
+    return (dir_stat.st_ino, None, None)
+
+
+def _reset_chroma_system_cache():
+    """丢弃 chromadb 按路径共享的客户端系统，使下次打开时重新读取磁盘"""
+    try:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    except Exception as e:
+        logging.debug(f"Failed to clear chromadb system cache: {e}")
+
+
+def _forget_store_dir(store_dir: str, reset_system: bool = False):
+    """
+    丢弃目录对应的缓存句柄。句柄可能仍被其他线程用于检索，这里不关闭它：
+    最后一个使用者释放引用后句柄被回收，sqlite 连接与内存映射随之关闭。
+    """
+    abs_dir = os.path.abspath(store_dir)
+    with _store_cache_lock:
+        stale = [key for key in _store_cache if key[0] == abs_dir]
+        for key in stale:
+            _store_cache.pop(key)
+    if stale:
+        logging.info(f"Dropped {len(stale)} cached vector store handle(s) for '{abs_dir}'.")
+        # 立即回收已无人引用的句柄，Windows 下目录才能尽快被改名或删除
+        gc.collect()
+    if reset_system:
+        _reset_chroma_system_cache()
+
+
+def _get_cached_store(embedding_adapter, store_dir: str):
+    abs_dir = os.path.abspath(store_dir)
+    key = (abs_dir, _embedding_identity(embedding_adapter))
+    current = _store_fingerprint(abs_dir)
+    with _store_cache_lock:
+        entry = _store_cache.get(key)
+        if entry is None:
+            return None
+        fingerprint, store = entry
+        if fingerprint == current:
+            # 同一配置的适配器可能已被重建，始终使用调用方传入的最新实例
+            store.embeddings.embedding_adapter = embedding_adapter
+            return store
+    # 目录被外部修改：丢弃旧句柄；目录被替换时还需重置 chromadb 的共享系统
+    replaced = current is None or fingerprint is None or fingerprint[0] != current[0]
+    logging.info(f"Vector store at '{abs_dir}' changed on disk, reopening.")
+    _forget_store_dir(abs_dir, reset_system=replaced)
+    return None
+
+
+def _put_cached_store(embedding_adapter, store_dir: str, store):
+    abs_dir = os.path.abspath(store_dir)
+    key = (abs_dir, _embedding_identity(embedding_adapter))
+    with _store_cache_lock:
+        _store_cache[key] = (_store_fingerprint(abs_dir), store)
+
+
+def refresh_vector_store_fingerprint(filepath: str):
+    """
+    本进程写入向量库后调用，更新缓存中记录的文件指纹，
+    避免把自己的写入误判为外部修改而重新打开。
+    """
+    abs_dir = os.path.abspath(get_vectorstore_dir(filepath))
+    fingerprint = _store_fingerprint(abs_dir)
+    with _store_cache_lock:
+        for key, (_, store) in list(_store_cache.items()):
+            if key[0] == abs_dir:
+                _store_cache[key] = (fingerprint, store)
+
+
+# 项目目录 -> 向量库写入锁
+_write_locks: dict = {}
+_write_locks_lock = threading.Lock()
+
+
+def vector_store_write_lock(filepath: str) -> threading.RLock:
+    """
+    项目向量库的写入锁。定稿入库、知识库导入与清空在打开向量库前获取；
+    重建只在读取分块快照与替换时持有，其间的写入记入重建日志，替换前补写到新库。
+    """
+    key = os.path.abspath(filepath or ".")
+    with _write_locks_lock:
+        lock = _write_locks.get(key)
+        if lock is None:
+            lock = threading.RLock()
+            _write_locks[key] = lock
+        return lock
+
+
+# 项目目录 -> 重建日志：重建期间写入过的分块范围 {(source, chapter, doc)} 与是否被清空
+_rebuild_journals: dict = {}
+_rebuild_journals_lock = threading.Lock()
+
+
+def start_rebuild_journal(filepath: str):
+    """重建读取快照时（持有写入锁）开始记录之后的写入"""
+    with _rebuild_journals_lock:
+        _rebuild_journals[os.path.abspath(filepath or ".")] = {"scopes": set(), "cleared": False}
+
+
+def take_rebuild_journal(filepath: str):
+    """取出并清空目前记录的写入，返回 (分块范围集合, 是否被清空)；记录继续进行"""
+    with _rebuild_journals_lock:
+        journal = _rebuild_journals.get(os.path.abspath(filepath or "."))
+        if journal is None:
+            return set(), False
+        scopes, cleared = journal["scopes"], journal["cleared"]
+        journal["scopes"], journal["cleared"] = set(), False
+        return scopes, cleared
+
+
+def stop_rebuild_journal(filepath: str):
+    with _rebuild_journals_lock:
+        _rebuild_journals.pop(os.path.abspath(filepath or "."), None)
+
+
+def _journal_scope(filepath: str, source: str, chapter: int = 0, doc: str = "", cleared: bool = False):
+    """重建进行中时记录一次写入所涉及的分块范围"""
+    with _rebuild_journals_lock:
+        journal = _rebuild_journals.get(os.path.abspath(filepath or "."))
+        if journal is None:
+            return
+        if cleared:
+            journal["cleared"] = True
+        else:
+            journal["scopes"].add((source or "", int(chapter or 0), doc or ""))
+
 
 def get_vectorstore_dir(filepath: str) -> str:
     """获取 vectorstore 路径"""
     return os.path.join(filepath, "vectorstore")
 
+# 重建向量库时新库的构建目录与替换过程中旧库的暂存目录（与 vectorstore 同级）
+REBUILD_DIR_SUFFIX = ".rebuild"
+BACKUP_DIR_SUFFIX = ".old"
+# 构建目录中标记新库已完整构建、可以替换的文件
+REBUILD_COMPLETE_MARKER = "rebuild_complete"
+
+def _dir_has_files(path: str) -> bool:
+    """目录（含子目录）中是否有文件；目录不存在或只有空目录时返回 False"""
+    for _, _, files in os.walk(path):
+        if files:
+            return True
+    return False
+
+def recover_vector_store_swap(store_dir: str):
+    """
+    替换向量库目录的过程被中断（旧库已移走、新库尚未就位）时恢复：
+    新库已完整构建则完成替换，否则放回旧库。
+    vectorstore 只是空目录（中断后被提前创建）时同样视为缺失。
+    """
+    import shutil
+    if _dir_has_files(store_dir):
+        return
+    backup_dir = store_dir + BACKUP_DIR_SUFFIX
+    rebuild_dir = store_dir + REBUILD_DIR_SUFFIX
+    rebuilt = os.path.exists(os.path.join(rebuild_dir, REBUILD_COMPLETE_MARKER))
+    if not rebuilt and not os.path.exists(backup_dir):
+        return
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+    if rebuilt:
+        os.rename(rebuild_dir, store_dir)
+        logging.info("Completed an interrupted vector store swap.")
+    else:
+        os.rename(backup_dir, store_dir)
+        logging.info("Restored the previous vector store after an interrupted swap.")
+
+def ensure_vectorstore_dir(filepath: str) -> str:
+    """
+    获取 vectorstore 路径并确保目录存在。创建目录前先恢复被中断的替换，
+    否则新建的空目录会掩盖暂存的旧库，下次重建时旧库会被当作残留删除。
+    """
+    store_dir = get_vectorstore_dir(filepath)
+    recover_vector_store_swap(store_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    return store_dir
+
+def swap_in_vector_store(filepath: str, new_dir: str, sketch_index=None):
+    """
+    用 new_dir 中构建完成的向量库替换当前向量库：先释放所有句柄，
+    再以两次目录重命名完成替换（中断后由 recover_vector_store_swap 恢复），
+    最后清空依附于旧库的词法索引，由后续检索自动重建；
+    近重复索引换成为新库构建的 sketch_index（含被跳过分块的记录），未提供时同样清空。
+    """
+    import shutil
+    store_dir = get_vectorstore_dir(filepath)
+    backup_dir = store_dir + BACKUP_DIR_SUFFIX
+    _forget_store_dir(store_dir, reset_system=True)
+    _forget_store_dir(new_dir, reset_system=True)
+    # vectorstore 缺失或为空时，暂存目录里才是真正的旧库，先放回原处
+    recover_vector_store_swap(store_dir)
+    if os.path.exists(backup_dir):
+        if not _dir_has_files(store_dir):
+            raise RuntimeError(f"向量库 '{store_dir}' 为空而暂存目录 '{backup_dir}' 仍在，已停止替换以免丢失数据。")
+        # 上次替换已完成，只是暂存的旧库没能删除
+        shutil.rmtree(backup_dir)
+    open(os.path.join(new_dir, REBUILD_COMPLETE_MARKER), "w").close()
+    if os.path.exists(store_dir):
+        os.rename(store_dir, backup_dir)
+    os.rename(new_dir, store_dir)
+    os.remove(os.path.join(store_dir, REBUILD_COMPLETE_MARKER))
+    shutil.rmtree(backup_dir, ignore_errors=True)
+    lexical = get_lexical_index(filepath)
+    lexical.clear()
+    lexical.synced = False
+    sketches = get_sketch_index(filepath)
+    adopted = False
+    if sketch_index is not None:
+        try:
+            sketches.replace_with(sketch_index)
+            adopted = True
+        except Exception as e:
+            logging.warning(f"Failed to adopt the rebuilt near-duplicate index: {e}")
+    if not adopted:
+        sketches.clear()
+    sketches.synced = False
+    logging.info(f"Vector store at '{store_dir}' replaced by rebuilt store.")
+
+# 探测当前 embedding 模型维度时使用的固定文本（结果会进入 embedding 缓存）
+DIMENSION_PROBE_TEXT = "向量维度检测"
+
+def embedding_info_for(embedding_adapter, dim: int) -> dict:
+    identity = _embedding_identity(embedding_adapter)
+    return {"adapter": identity[0], "model": identity[1] if len(identity) > 2 else None, "dim": int(dim)}
+
+def _check_embedding_compatibility(store, embedding_adapter):
+    """
+    对比向量库记录的 embedding 配置与当前配置：
+    - 配置相同或空库：直接通过；
+    - 配置不同：探测当前模型维度，与库中维度不一致时抛出 EmbeddingDimensionMismatchError，
+      一致但模型不同时仅告警（检索结果会失准，建议重建向量库）；
+    - 旧向量库没有记录：维度一致时以当前配置补记。
+    """
+    info = read_embedding_info(store.store_dir)
+    stored_dim = info.get("dim") or store.dimension()
+    if not stored_dim:
+        return
+    current = embedding_info_for(embedding_adapter, stored_dim)
+    if info and info.get("adapter") == current["adapter"] and info.get("model") == current["model"]:
+        return
+    dim = len(store.embeddings.embed_query(DIMENSION_PROBE_TEXT))
+    if dim != stored_dim:
+        raise EmbeddingDimensionMismatchError(
+            f"向量库中的向量维度为 {stored_dim}"
+            f"（模型: {info.get('model') or '未知'}），当前 embedding 模型 {current['model']} 的维度为 {dim}。"
+            f"请使用「重建向量库」以当前模型重新生成向量，或改回原来的 embedding 模型。"
+        )
+    if info:
+        logging.warning(
+            f"Vector store was built with embedding model '{info.get('model')}', "
+            f"current model is '{current['model']}'. Retrieval quality may degrade; consider rebuilding."
+        )
+    else:
+        write_embedding_info(store.store_dir, dict(current, dim=dim))
+
 def clear_vector_store(filepath: str) -> bool:
     """清空 清空向量库"""
     import shutil
@@ -40,133 +364,111 @@ def clear_vector_store(filepath: str) -> bool:
     if not os.path.exists(store_dir):
         logging.info("No vector store found to clear.")
         return False
-    try:
-        shutil.rmtree(store_dir)
-        logging.info(f"Vector store directory '{store_dir}' removed.")
-        return True
-    except Exception as e:
-        logging.error(f"无法删除向量库文件夹，请关闭程序后手动删除 {store_dir}。\n {str(e)}")
-        traceback.print_exc()
-        return False
+    with vector_store_write_lock(filepath):
+        # 先释放缓存中的句柄，否则 Windows 下文件仍被占用
+        _forget_store_dir(store_dir, reset_system=True)
+        try:
+            shutil.rmtree(store_dir)
+            logging.info(f"Vector store directory '{store_dir}' removed.")
+            _journal_scope(filepath, "", cleared=True)
+            get_lexical_index(filepath).clear()
+            get_sketch_index(filepath).clear()
+            return True
+        except Exception as e:
+            logging.error(f"无法删除向量库文件夹，请关闭程序后手动删除 {store_dir}。\n {str(e)}")
+            traceback.print_exc()
+            return False
 
 def init_vector_store(embedding_adapter, texts, filepath: str):
     """
-    在 filepath 下创建/加载一个 Chroma 向量库并插入 texts。
+    在 filepath 下创建/加载向量库并插入 texts（后端见 vector_backends）。
     如果Embedding失败，则返回 None，不中断任务。
     """
-    from langchain.embeddings.base import Embeddings as LCEmbeddings
+    with vector_store_write_lock(filepath):
+        ensure_vectorstore_dir(filepath)
+        texts = [str(t) for t in texts if t and str(t).strip()]
+        if not texts:
+            logging.warning("No valid documents to initialize vector store after filtering empty texts. Returning None.")
+            return None
 
-    store_dir = get_vectorstore_dir(filepath)
-    os.makedirs(store_dir, exist_ok=True)
-    documents = [Document(page_content=str(t)) for t in texts if t and str(t).strip()]
-    if not documents:
-        logging.warning("No valid documents to initialize vector store after filtering empty texts. Returning None.")
-        return None
-
-    try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts):
-                result = call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=None,
-                    texts=texts
-                )
-                if result is None or not result:
-                    raise ValueError(f"Embedding failed for {len(texts)} documents")
-                return result
-            
-            def embed_query(self, query: str):
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=None,
-                    query=query
-                )
-                if res is None or not res:
-                    raise ValueError(f"Embedding failed for query: {query[:50]}...")
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-        vectorstore = Chroma.from_documents(
-            documents,
-            embedding=chroma_embedding,
-            persist_directory=store_dir,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
-        return vectorstore
-    except ValueError as e:
-        logging.error(f"Embedding error while initializing vector store: {e}")
-        traceback.print_exc()
-        logging.warning("Failed to initialize vector store due to embedding failure.")
-        return None
-    except IndexError as e:
-        logging.error(f"Index error while initializing vector store (likely empty embedding): {e}")
-        traceback.print_exc()
-        logging.warning("Failed to initialize vector store due to empty embedding.")
-        return None
-    except Exception as e:
-        logging.warning(f"Init vector store failed: {e}")
-        traceback.print_exc()
-        return None
+        _journal_scope(filepath, "text")
+        store = load_vector_store(embedding_adapter, filepath)
+        if not store:
+            return None
+        try:
+            store.add(
+                ids=[make_chunk_id("text", 0, i, t) for i, t in enumerate(texts)],
+                texts=texts,
+                metadatas=[{"source": "text", "chapter": 0, "offset": -1} for _ in texts]
+            )
+            return store
+        except ValueError as e:
+            logging.error(f"Embedding error while initializing vector store: {e}")
+            traceback.print_exc()
+            logging.warning("Failed to initialize vector store due to embedding failure.")
+            return None
+        except IndexError as e:
+            logging.error(f"Index error while initializing vector store (likely empty embedding): {e}")
+            traceback.print_exc()
+            logging.warning("Failed to initialize vector store due to empty embedding.")
+            return None
+        except Exception as e:
+            logging.warning(f"Init vector store failed: {e}")
+            traceback.print_exc()
+            return None
+        finally:
+            refresh_vector_store_fingerprint(filepath)
 
 def load_vector_store(embedding_adapter, filepath: str):
     """
-    读取已存在的 Chroma 向量库。若不存在则返回 None。
+    读取已存在的向量库（Chroma 或 NumPy 后端）。若目录不存在则返回 None。
     如果加载失败（embedding 或IO问题），则返回 None。
+    已打开的向量库按 (目录, embedding 配置) 在进程内缓存复用，
+    目录被外部修改或删除后会自动重新打开。
     """
-    from langchain.embeddings.base import Embeddings as LCEmbeddings
     store_dir = get_vectorstore_dir(filepath)
-    if not os.path.exists(store_dir):
-        logging.info("Vector store not found. Will return None.")
-        return None
+    if os.path.exists(store_dir):
+        cached = _get_cached_store(embedding_adapter, store_dir)
+        if cached is not None:
+            return cached
+    # 恢复被中断的替换会重命名目录，必须与写入方（重建替换）互斥，
+    # 否则可能落在替换的两次重命名之间，把刚带上完成标记的构建目录提前移入
+    with vector_store_write_lock(filepath):
+        if os.path.exists(store_dir):
+            cached = _get_cached_store(embedding_adapter, store_dir)
+            if cached is not None:
+                return cached
+        recover_vector_store_swap(store_dir)
+        if not os.path.exists(store_dir):
+            logging.info("Vector store not found. Will return None.")
+            _forget_store_dir(store_dir)
+            return None
 
-    try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts):
-                result = call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=None,
-                    texts=texts
-                )
-                if result is None or not result:
-                    raise ValueError(f"Embedding failed for {len(texts)} documents")
-                return result
-            
-            def embed_query(self, query: str):
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=None,
-                    query=query
-                )
-                if res is None or not res:
-                    raise ValueError(f"Embedding failed for query: {query[:50]}...")
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-        return Chroma(
-            persist_directory=store_dir,
-            embedding_function=chroma_embedding,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
-    except ValueError as e:
-        logging.error(f"Embedding error while loading vector store: {e}")
-        traceback.print_exc()
-        logging.warning("Failed to load vector store due to embedding failure.")
-        return None
-    except IndexError as e:
-        logging.error(f"Index error while loading vector store (likely empty embedding): {e}")
-        traceback.print_exc()
-        logging.warning("Failed to load vector store due to empty embedding.")
-        return None
-    except Exception as e:
-        logging.warning(f"Failed to load vector store: {e}")
-        traceback.print_exc()
-        return None
+        store = None
+        try:
+            store = open_vector_backend(store_dir, LCEmbeddingWrapper(embedding_adapter))
+            _check_embedding_compatibility(store, embedding_adapter)
+            logging.info(f"Opened vector store '{store_dir}' (backend={store.name}).")
+            _put_cached_store(embedding_adapter, store_dir, store)
+            return store
+        except EmbeddingDimensionMismatchError as e:
+            logging.error(str(e))
+            store.close()
+            return None
+        except ValueError as e:
+            logging.error(f"Embedding error while loading vector store: {e}")
+            traceback.print_exc()
+            logging.warning("Failed to load vector store due to embedding failure.")
+            return None
+        except IndexError as e:
+            logging.error(f"Index error while loading vector store (likely empty embedding): {e}")
+            traceback.print_exc()
+            logging.warning("Failed to load vector store due to empty embedding.")
+            return None
+        except Exception as e:
+            logging.warning(f"Failed to load vector store: {e}")
+            traceback.print_exc()
+            return None
 
 def split_by_length(text: str, max_length: int = 500):
     """按照 max_length 切分文本"""
@@ -179,125 +481,598 @@ def split_by_length(text: str, max_length: int = 500):
         start_idx = end_idx
     return segments
 
-def split_text_for_vectorstore(chapter_text: str, max_length: int = 500, similarity_threshold: float = 0.7):
+def split_text_for_vectorstore(chapter_text: str, max_length: int = DEFAULT_CHUNK_TOKENS, similarity_threshold: float = 0.7):
     """
     对新的章节文本进行分段后,再用于存入向量库。
-    使用 embedding 进行文本相似度计算。
+    按中英文句末标点分句，再按 token 上限（max_length）组块，块间保留少量重叠。
     """
     if not chapter_text.strip():
         return []
-    
-    # --- 修改开始：自动检查并下载缺失的 NLTK 数据包 ---
+    segments, _ = split_text(chapter_text, max_tokens=max_length)
+    return segments
+
+def chunk_scope_where(source: str, chapter: int, doc: str = "") -> dict:
+    """某一章节或某个知识文件全部分块的 where 条件"""
+    if source == "knowledge":
+        return {"$and": [{"source": "knowledge"}, {"doc": doc}]}
+    return {"$and": [{"source": source}, {"chapter": int(chapter)}]}
+
+def make_chunk_id(source: str, chapter: int, index: int, text: str, doc: str = "") -> str:
+    """
+    由 (来源, 章节号, 分块序号, 内容哈希) 生成确定性的分块 ID；
+    知识文件额外以文件名区分。
+    """
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    if source == "knowledge":
+        doc_hash = hashlib.sha1(doc.encode("utf-8")).hexdigest()[:12]
+        return f"knowledge:{doc_hash}:{index:05d}:{content_hash}"
+    return f"{source}:{int(chapter)}:{index:05d}:{content_hash}"
+
+def _update_side_indexes(filepath: str, add=None, delete_ids=None):
+    """
+    同步维护词法索引与近重复签名索引；失败不影响向量库写入（词法索引在检索时自动补齐）。
+    新分块的签名已在 _claim_unique_chunks 中登记，这里只移除它们的被跳过记录并处理删除。
+    """
+    index = get_lexical_index(filepath)
     try:
-        # 检查是否已存在 punkt_tab，不存在才下载
-        nltk.data.find('tokenizers/punkt_tab')
-    except LookupError:
-        # quiet=True 防止在控制台打印大量下载进度条
-        nltk.download('punkt_tab', quiet=True)
-        
+        if delete_ids:
+            index.delete(delete_ids)
+        if add:
+            index.add(*add)
+    except Exception as e:
+        logging.warning(f"Failed to update lexical index: {e}")
+        # 分块数之后可能恰好重新一致，必须按 ID 重新核对
+        index.synced = False
     try:
-        # 保险起见，同时也检查基础的 punkt 包
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        nltk.download('punkt', quiet=True)
-    # --- 修改结束 ---
-
-    sentences = nltk.sent_tokenize(chapter_text)
-    if not sentences:
-        return []
-    
-    # 直接按长度分段,不做相似度合并
-    final_segments = []
-    current_segment = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence_length = len(sentence)
-        if current_length + sentence_length > max_length:
-            if current_segment:
-                segment = " ".join(current_segment)
-                if segment.strip():
-                    final_segments.append(segment)
-            current_segment = [sentence]
-            current_length = sentence_length
-        else:
-            current_segment.append(sentence)
-            current_length += sentence_length
-    
-    if current_segment:
-        segment = " ".join(current_segment)
-        if segment.strip():
-            final_segments.append(segment)
-    
-    return final_segments
-
-def update_vector_store(embedding_adapter, new_chapter: str, filepath: str):
-    """
-    将最新章节文本插入到向量库中。
-    若库不存在则初始化；若初始化/更新失败，则跳过。
-    """
-    from utils import read_file, clear_file_content, save_string_to_txt
-    splitted_texts = split_text_for_vectorstore(new_chapter)
-    if not splitted_texts:
-        logging.warning("No valid text to insert into vector store. Skipping.")
+        if add:
+            get_sketch_index(filepath).drop_skipped(add[0])
+        if delete_ids:
+            get_sketch_index(filepath).delete(delete_ids)
+    except Exception as e:
+        logging.warning(f"Failed to update near-duplicate index: {e}")
+
+def _claim_unique_chunks(store, filepath: str, ids: list, texts: list, metadatas: list, current_ids: set):
+    """
+    在 embedding 之前剔除与库中其他分块近重复的分块（MinHash 估计相似度达到阈值），
+    返回 ({被跳过的分块 ID: 与之重复的已有分块 ID}, {让位的已有分块 ID: 取代它的本批分块 ID})。
+    重复内容保留书中最早的一份。索引不可用时不做剔除。
+    """
+    try:
+        return sync_sketch_index(store, filepath).claim(ids, texts, metadatas, current_ids=current_ids)
+    except Exception as e:
+        logging.warning(f"Near-duplicate check skipped: {e}")
+        return {}, {}
+
+def _evict_displaced(store, filepath: str, displaced: dict):
+    """移除被书中更早的近重复分块取代的分块，并记为被跳过，以便取代者被删除时重新入库"""
+    found = store.get(ids=list(displaced))
+    evicted = found.get("ids") or []
+    if not evicted:
         return
+    documents = found.get("documents") or []
+    metadatas = found.get("metadatas") or []
+    entries = [
+        (chunk_id, displaced[chunk_id], documents[i] or "", metadatas[i] if i < len(metadatas) else {})
+        for i, chunk_id in enumerate(evicted)
+    ]
+    get_sketch_index(filepath).displace(entries)
+    for _, _, _, meta in entries:
+        _journal_scope(filepath, meta.get("source"), meta.get("chapter", 0), meta.get("doc", ""))
+    store.delete(evicted)
+    _update_side_indexes(filepath, delete_ids=evicted)
+    logging.info(f"Replaced {len(evicted)} chunk(s) with near-duplicates from earlier chapters.")
 
-    store = load_vector_store(embedding_adapter, filepath)
-    if not store:
-        logging.info("Vector store does not exist or failed to load. Initializing a new one for new chapter...")
-        store = init_vector_store(embedding_adapter, splitted_texts, filepath)
-        if not store:
-            logging.warning("Init vector store failed, skip embedding.")
-        else:
-            logging.info("New vector store created successfully.")
+def _reingest_skipped(store, filepath: str, removed_ids: list):
+    """原分块被删除后，重新写入因与之近重复而被跳过的分块（仍重复的会再次被跳过）"""
+    try:
+        index = get_sketch_index(filepath)
+        pending = index.release_skipped(removed_ids)
+    except Exception as e:
+        logging.warning(f"Failed to look up skipped near-duplicates: {e}")
+        return
+    if not pending:
         return
+    try:
+        embedded = add_new_chunks(
+            store, filepath,
+            [p[0] for p in pending], [p[1] for p in pending], [p[2] for p in pending]
+        )
+        logging.info(f"Re-ingested {embedded} chunk(s) previously skipped as near-duplicates.")
+    except Exception as e:
+        # 记录保持为等待重新入库，下次有分块被删除时重试
+        logging.warning(f"Failed to re-ingest skipped near-duplicates: {e}")
+
+def make_chunk_metadata(source: str, chapter: int, offset: int, doc: str = "") -> dict:
+    meta = {"source": source, "chapter": int(chapter), "offset": int(offset)}
+    if doc:
+        meta["doc"] = doc
+    return meta
+
+def add_new_chunks(store, filepath: str, ids: list, texts: list, metadatas: list,
+                   skip_near_duplicates: bool = True) -> int:
+    """
+    写入一批分块，库中已存在的 ID 直接跳过；skip_near_duplicates 时与其他章节/知识文件中
+    已有分块近重复的分块也不再 embedding（保留书中最早的一份，较晚的已有分块让位）。
+    返回实际 embedding 的分块数。
+    """
+    if not ids:
+        return 0
+    existing = set(store.get(ids=list(ids), include_documents=False)["ids"])
+    fresh = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+    displaced = {}
+    if fresh and skip_near_duplicates:
+        duplicates, displaced = _claim_unique_chunks(
+            store, filepath,
+            [ids[i] for i in fresh], [texts[i] for i in fresh], [metadatas[i] for i in fresh],
+            current_ids=set(ids)
+        )
+        if duplicates:
+            logging.info(f"Skipped {len(duplicates)} near-duplicate chunk(s) before embedding.")
+            fresh = [i for i in fresh if ids[i] not in duplicates]
+    if fresh:
+        for i in fresh:
+            _journal_scope(filepath, metadatas[i].get("source"), metadatas[i].get("chapter", 0), metadatas[i].get("doc", ""))
+        try:
+            store.add(
+                ids=[ids[i] for i in fresh],
+                texts=[texts[i] for i in fresh],
+                metadatas=[metadatas[i] for i in fresh]
+            )
+        except Exception:
+            # 撤销本批登记的签名，避免未入库的分块挡住后续相同内容
+            if skip_near_duplicates:
+                _update_side_indexes(filepath, delete_ids=[ids[i] for i in fresh])
+            raise
+        _update_side_indexes(
+            filepath,
+            add=([ids[i] for i in fresh], [texts[i] for i in fresh], [metadatas[i] for i in fresh])
+        )
+    if displaced:
+        try:
+            _evict_displaced(store, filepath, displaced)
+        except Exception as e:
+            # 两份都留在库中，不影响检索正确性
+            logging.warning(f"Failed to remove superseded near-duplicate chunks: {e}")
+    return len(fresh)
 
+def remove_stale_chunks(store, filepath: str, source: str, chapter: int, doc: str, keep_ids: set) -> int:
+    """
+    删除某章节（或某知识文件）范围内不在 keep_ids 中的分块，返回删除数。
+    因与被删分块近重复而被跳过的其他分块随即重新入库。
+    """
     try:
-        docs = [Document(page_content=str(t)) for t in splitted_texts if t and str(t).strip()]
-        if not docs:
-            logging.warning("No valid documents to insert into vector store after filtering empty texts. Skipping.")
-            return
-        
-        logging.info(f"Attempting to add {len(docs)} documents to vector store...")
-        store.add_documents(docs)
+        get_sketch_index(filepath).forget_skipped(
+            chunk_scope(make_chunk_metadata(source, chapter, -1, doc)), set(keep_ids)
+        )
+    except Exception as e:
+        logging.warning(f"Failed to update near-duplicate index: {e}")
+    existing = set(store.get(where=chunk_scope_where(source, chapter, doc), include_documents=False)["ids"])
+    stale = list(existing - set(keep_ids))
+    if stale:
+        _journal_scope(filepath, source, chapter, doc)
+        store.delete(stale)
+        _update_side_indexes(filepath, delete_ids=stale)
+        logging.info(f"Removed {len(stale)} stale chunk(s) for {source} {doc or chapter}.")
+        _reingest_skipped(store, filepath, stale)
+    return len(stale)
+
+def upsert_chunks(embedding_adapter, filepath: str, segments: list, source: str = "chapter",
+                  chapter: int = 0, doc: str = "", offsets: list = None) -> bool:
+    """
+    以确定性 ID 写入一个章节（或一个知识文件）的全部分块：
+    - 该范围内已有但本次不再出现的分块被删除；
+    - 仅新增或内容变化的分块会被 embedding 并写入。
+    返回是否成功。
+    """
+    with vector_store_write_lock(filepath):
+        if offsets is None:
+            offsets = [-1] * len(segments)
+        pairs = [(str(t), o) for t, o in zip(segments, offsets) if t and str(t).strip()]
+        segments = [t for t, _ in pairs]
+        offsets = [o for _, o in pairs]
+        # 旧库可能因 embedding 维度不同而打不开，重建仍需补写该范围
+        _journal_scope(filepath, source, chapter, doc)
+        ensure_vectorstore_dir(filepath)
+        store = load_vector_store(embedding_adapter, filepath)
+        if not store:
+            logging.warning("Vector store failed to open, skip embedding.")
+            return False
+
+        ids = [make_chunk_id(source, chapter, i, t, doc) for i, t in enumerate(segments)]
+        metadatas = [make_chunk_metadata(source, chapter, offset, doc) for offset in offsets]
+
+        try:
+            # 先写入新版本再删除旧版本：因旧版本而被跳过的分块重新入库时可直接与新版本比较
+            embedded = add_new_chunks(store, filepath, ids, segments, metadatas)
+            remove_stale_chunks(store, filepath, source, chapter, doc, keep_ids=set(ids))
+            if embedded:
+                logging.info(f"Embedded {embedded} new chunk(s) for {source} {doc or chapter} "
+                             f"({len(ids) - embedded} unchanged).")
+            else:
+                logging.info(f"All {len(ids)} chunk(s) for {source} {doc or chapter} are up to date.")
+            return True
+        except ValueError as e:
+            logging.error(f"Embedding error while updating vector store: {e}")
+            traceback.print_exc()
+            logging.warning("Skipping vector store update due to embedding failure.")
+        except IndexError as e:
+            logging.error(f"Index error while updating vector store (likely empty embedding): {e}")
+            traceback.print_exc()
+            logging.warning("Skipping vector store update due to empty embedding.")
+        except Exception as e:
+            logging.warning(f"Failed to update vector store: {e}")
+            traceback.print_exc()
+        finally:
+            refresh_vector_store_fingerprint(filepath)
+        return False
+
+def update_vector_store(embedding_adapter, new_chapter: str, filepath: str, chapter_number: int = 0):
+    """
+    将章节文本写入向量库（按章节号幂等）：
+    重新定稿同一章节时替换其旧分块，内容未变的分块不会重复 embedding。
+    """
+    splitted_texts, offsets = split_text(new_chapter)
+    if not splitted_texts:
+        logging.warning("No valid text to insert into vector store. Skipping.")
+        return
+
+    if upsert_chunks(
+        embedding_adapter, filepath, splitted_texts,
+        source="chapter", chapter=chapter_number, offsets=offsets
+    ):
         logging.info("Vector store updated with the new chapter splitted segments.")
-    except ValueError as e:
-        logging.error(f"Embedding error while updating vector store: {e}")
-        traceback.print_exc()
-        logging.warning("Skipping vector store update due to embedding failure.")
-    except IndexError as e:
-        logging.error(f"Index error while updating vector store (likely empty embedding): {e}")
-        traceback.print_exc()
-        logging.warning("Skipping vector store update due to empty embedding.")
+
+def join_documents(docs, max_chars: int = 2000) -> str:
+    """拼接检索片段并截断到 max_chars 字符"""
+    combined = "\n".join([d.page_content for d in docs])
+    if len(combined) > max_chars:
+        combined = combined[:max_chars]
+    return combined
+
+# 近因加权：章节差距达到该值时加权减半
+RECENCY_HALF_GAP = 20
+
+def build_where(source: str = None, before_chapter: int = None, min_chapter: int = None):
+    """
+    构造 where 条件（Chroma 语法，NumPy 后端同样支持）：
+      source: None 表示章节与知识文件都检索，"chapter"/"knowledge" 仅检索对应来源；
+      before_chapter / min_chapter: 章节窗口 [min_chapter, before_chapter)，只约束章节分块。
+    无任何约束时返回 None。
+    """
+    chapter_conds = [{"source": "chapter"}]
+    if before_chapter is not None:
+        chapter_conds.append({"chapter": {"$lt": int(before_chapter)}})
+    if min_chapter is not None:
+        chapter_conds.append({"chapter": {"$gte": int(min_chapter)}})
+    chapter_where = chapter_conds[0] if len(chapter_conds) == 1 else {"$and": chapter_conds}
+
+    if source == "knowledge":
+        return {"source": "knowledge"}
+    if source == "chapter":
+        return chapter_where
+    if len(chapter_conds) == 1:
+        return None
+    return {"$or": [{"source": "knowledge"}, chapter_where]}
+
+# 向量库句柄 -> 旧版本写入的、没有 source 元数据的分块数
+_legacy_chunk_counts = weakref.WeakKeyDictionary()
+_legacy_chunk_lock = threading.Lock()
+# 新旧分块混存时，为旧分块单独检索的候选倍数
+LEGACY_QUERY_OVERFETCH = 4
+_QUERY_KEYS = ("ids", "documents", "metadatas", "distances")
+
+def _legacy_chunk_count(store) -> int:
+    """
+    旧版本写入的分块没有 source 元数据，where 过滤会把它们全部排除。
+    每个句柄只统计一次：本进程只写入带元数据的分块，库被外部修改时句柄会重新打开。
+    统计失败时视为全部是旧分块（不过滤），且不缓存。
+    """
+    with _legacy_chunk_lock:
+        cached = _legacy_chunk_counts.get(store)
+    if cached is not None:
+        return cached
+    try:
+        tagged = store.get(where={"source": {"$in": ["chapter", "knowledge", "text"]}}, include_documents=False)["ids"]
+        legacy = max(0, store.count() - len(tagged))
     except Exception as e:
-        logging.warning(f"Failed to update vector store: {e}")
-        traceback.print_exc()
+        logging.debug(f"Failed to count legacy chunks: {e}")
+        return store.count()
+    with _legacy_chunk_lock:
+        _legacy_chunk_counts[store] = legacy
+    if legacy:
+        logging.info(f"Vector store has {legacy} legacy chunk(s) without metadata; they bypass search filters.")
+    return legacy
+
+def _result_row(result: dict, row: int) -> list:
+    """query 结果中第 row 个查询的 [(id, 文本, 元数据, 距离)]"""
+    columns = []
+    for key in _QUERY_KEYS:
+        values = result.get(key) or []
+        columns.append(values[row] if row < len(values) and values[row] else [])
+    return [
+        (chunk_id,
+         columns[1][j] if j < len(columns[1]) else None,
+         columns[2][j] if j < len(columns[2]) else None,
+         columns[3][j] if j < len(columns[3]) else float("inf"))
+        for j, chunk_id in enumerate(columns[0])
+    ]
 
-def get_relevant_context_from_vector_store(embedding_adapter, query: str, filepath: str, k: int = 2) -> str:
+def _merge_legacy_results(filtered: dict, unfiltered: dict, n_queries: int, n_results: int) -> dict:
+    """合并带过滤条件的检索结果与不过滤检索中的旧分块，按距离取前 n_results 条"""
+    merged = {key: [] for key in _QUERY_KEYS}
+    for row in range(n_queries):
+        entries = _result_row(filtered, row)
+        entries += [e for e in _result_row(unfiltered, row) if not (e[2] or {}).get("source")]
+        entries.sort(key=lambda e: e[3])
+        entries = entries[:n_results]
+        for i, key in enumerate(_QUERY_KEYS):
+            merged[key].append([e[i] for e in entries])
+    return merged
+
+def _recency_boost(meta: dict, reference_chapter: int) -> float:
+    if not meta or meta.get("source") != "chapter" or reference_chapter is None:
+        return 0.0
+    gap = max(0, int(reference_chapter) - int(meta.get("chapter", 0)))
+    return 1.0 / (1.0 + gap / RECENCY_HALF_GAP)
+
+def _query_by_vectors(store, vectors: list, k: int, where=None,
+                      recency_weight: float = 0.0, reference_chapter: int = None) -> list:
+    """
+    以一次向量化查询检索多个向量，返回与 vectors 对应的 Document 列表。
+    where 条件下推至向量库后端；启用近因加权时多取候选，按
+    相关度 × (1 + recency_weight × 近因) 重排后截取前 k 条。
+    """
+    count = store.count()
+    if count == 0 or not vectors:
+        return [[] for _ in vectors]
+    legacy = _legacy_chunk_count(store) if where is not None else 0
+    if legacy >= count:
+        logging.info("Vector store has no chunk metadata, falling back to unfiltered search.")
+        where, legacy = None, 0
+    reweight = recency_weight > 0 and reference_chapter is not None
+    n_results = min(k * 3 if reweight else k, count)
+    result = store.query(vectors, n_results, where=where)
+    if legacy:
+        # 新旧分块混存：过滤条件只约束带元数据的分块，旧分块从不过滤的检索中取出后按距离合并
+        unfiltered = store.query(vectors, min(n_results * LEGACY_QUERY_OVERFETCH, count))
+        result = _merge_legacy_results(result, unfiltered, len(vectors), n_results)
+
+    ids = result.get("ids") or []
+    documents = result.get("documents") or []
+    metadatas = result.get("metadatas") or []
+    distances = result.get("distances") or []
+    per_vector = []
+    for row in range(len(vectors)):
+        ids_row = ids[row] if row < len(ids) and ids[row] else []
+        docs_row = documents[row] if row < len(documents) and documents[row] else []
+        metas_row = metadatas[row] if row < len(metadatas) and metadatas[row] else []
+        dists_row = distances[row] if row < len(distances) and distances[row] else []
+        scored = []
+        for j, text in enumerate(docs_row):
+            if not text:
+                continue
+            meta = dict(metas_row[j]) if j < len(metas_row) and metas_row[j] else {}
+            if j < len(ids_row):
+                # 记录分块 ID，供 mmr_pack 直接读取已存储的向量
+                meta["chunk_id"] = ids_row[j]
+            relevance = 1.0 / (1.0 + dists_row[j]) if j < len(dists_row) else 0.0
+            score = relevance * (1.0 + recency_weight * _recency_boost(meta, reference_chapter))
+            scored.append((score, j, Document(page_content=text, metadata=meta)))
+        if reweight:
+            scored.sort(key=lambda item: (-item[0], item[1]))
+        per_vector.append([doc for _, _, doc in scored[:k]])
+    return per_vector
+
+def get_relevant_context_from_vector_store(embedding_adapter, query: str, filepath: str, k: int = 2,
+                                           source: str = None, before_chapter: int = None,
+                                           min_chapter: int = None, recency_weight: float = 0.0,
+                                           max_chars: int = 2000, hybrid: bool = False) -> str:
     """
     从向量库中检索与 query 最相关的 k 条文本，拼接后返回。
+    source / before_chapter / min_chapter 作为 where 条件下推到向量库后端；
+    recency_weight > 0 时越接近 before_chapter 的章节分块排名越靠前；
+    hybrid=True 时融合 BM25 词法检索结果（见 hybrid_search_many）。
     如果向量库加载/检索失败，则返回空字符串。
-    最终只返回最多2000字符的检索片段。
+    最终只返回最多 max_chars 字符的检索片段。
     """
+    if hybrid:
+        per_query, _ = hybrid_search_many(
+            embedding_adapter, [query], filepath, k=k, source=source,
+            before_chapter=before_chapter, min_chapter=min_chapter, recency_weight=recency_weight
+        )
+        return join_documents(per_query[0], max_chars)
+
     store = load_vector_store(embedding_adapter, filepath)
     if not store:
         logging.info("No vector store found or load failed. Returning empty context.")
         return ""
 
     try:
-        docs = store.similarity_search(query, k=k)
+        vector = store.embeddings.embed_query(query)
+        docs = _query_by_vectors(
+            store, [vector], k,
+            where=build_where(source, before_chapter, min_chapter),
+            recency_weight=recency_weight,
+            reference_chapter=before_chapter
+        )[0]
         if not docs:
             logging.info(f"No relevant documents found for query '{query}'. Returning empty context.")
             return ""
-        combined = "\n".join([d.page_content for d in docs])
-        if len(combined) > 2000:
-            combined = combined[:2000]
-        return combined
+        return join_documents(docs, max_chars)
     except Exception as e:
         logging.warning(f"Similarity search failed: {e}")
         traceback.print_exc()
         return ""
 
+def search_many(embedding_adapter, queries: list, filepath: str, k: int = 2,
+                source: str = None, before_chapter: int = None,
+                min_chapter: int = None, recency_weight: float = 0.0):
+    """
+    批量检索：所有 query 通过一次 embed_documents 请求向量化，
+    再以一次向量化查询在集合中检索（过滤条件同 get_relevant_context_from_vector_store）。
+    返回 (per_query, union)：
+      per_query 与 queries 一一对应，每项为该 query 命中的 Document 列表；
+      union 为全部命中按内容去重后的 Document 列表（保持首次出现的顺序）。
+    向量库不存在或检索失败时，per_query 中对应项为空列表。
+    """
+    queries = [str(q) if q is not None else "" for q in queries]
+    empty = ([[] for _ in queries], [])
+    # 空查询不参与检索，但在 per_query 中保留位置
+    valid = [i for i, q in enumerate(queries) if q.strip()]
+    if not valid:
+        return empty
+    store = load_vector_store(embedding_adapter, filepath)
+    if not store:
+        logging.info("No vector store found or load failed. Returning empty results.")
+        return empty
+
+    try:
+        vectors = store.embeddings.embed_documents([queries[i] for i in valid])
+        results = _query_by_vectors(
+            store, vectors, k,
+            where=build_where(source, before_chapter, min_chapter),
+            recency_weight=recency_weight,
+            reference_chapter=before_chapter
+        )
+    except Exception as e:
+        logging.warning(f"Batched similarity search failed: {e}")
+        traceback.print_exc()
+        return empty
+
+    per_query = [[] for _ in queries]
+    union = []
+    seen = set()
+    for row, i in enumerate(valid):
+        per_query[i] = results[row]
+        for doc in results[row]:
+            if doc.page_content not in seen:
+                seen.add(doc.page_content)
+                union.append(doc)
+    logging.info(f"search_many: {len(valid)} queries, {len(union)} unique chunks.")
+    return per_query, union
+
+# 倒数排名融合 (RRF) 的平滑常数
+RRF_K = 60
+
+def hybrid_search_many(embedding_adapter, queries: list, filepath: str, k: int = 2,
+                       source: str = None, before_chapter: int = None,
+                       min_chapter: int = None, recency_weight: float = 0.0):
+    """
+    向量检索 + BM25 词法检索，按倒数排名融合 (RRF) 合并，返回值同 search_many。
+    人名、地名、法宝名等稀有词由词法侧补足；embedding 服务不可用时自动退化为纯词法检索。
+    """
+    queries = [str(q) if q is not None else "" for q in queries]
+    candidates = max(k * 2, k)
+    vector_results, _ = search_many(
+        embedding_adapter, queries, filepath, k=candidates, source=source,
+        before_chapter=before_chapter, min_chapter=min_chapter, recency_weight=recency_weight
+    )
+
+    lexical = None
+    try:
+        store = load_vector_store(embedding_adapter, filepath)
+        lexical = sync_lexical_index(store, filepath) if store else get_lexical_index(filepath)
+    except Exception as e:
+        logging.warning(f"Lexical index unavailable: {e}")
+
+    per_query = []
+    union = []
+    seen = set()
+    lexical_only = 0
+    for query, vector_docs in zip(queries, vector_results):
+        scores = {}
+        docs_by_text = {}
+        for rank, doc in enumerate(vector_docs):
+            scores[doc.page_content] = scores.get(doc.page_content, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs_by_text.setdefault(doc.page_content, doc)
+        if lexical is not None and query.strip():
+            hits = lexical.search(query, k=candidates, source=source,
+                                  before_chapter=before_chapter, min_chapter=min_chapter)
+            if hits and not vector_docs:
+                lexical_only += 1
+            for rank, (chunk_id, _, text, meta) in enumerate(hits):
+                scores[text] = scores.get(text, 0.0) + 1.0 / (RRF_K + rank + 1)
+                docs_by_text.setdefault(text, Document(page_content=text, metadata=dict(meta, chunk_id=chunk_id)))
+        ranked = sorted(scores, key=lambda text: -scores[text])[:k]
+        docs = [docs_by_text[text] for text in ranked]
+        per_query.append(docs)
+        for doc in docs:
+            if doc.page_content not in seen:
+                seen.add(doc.page_content)
+                union.append(doc)
+    if lexical_only:
+        logging.info(f"hybrid_search_many: {lexical_only} query(s) answered by lexical index only.")
+    return per_query, union
+
+# MMR 中相关度与多样性的权衡系数（1 为只看相关度）
+MMR_LAMBDA = 0.7
+
+def mmr_pack(embedding_adapter, queries: list, docs: list, filepath: str,
+             token_budget: int, lambda_mult: float = MMR_LAMBDA) -> list:
+    """
+    对检索结果按最大边际相关 (MMR) 重排，并在 token 预算内装入尽量多且互不重复的片段：
+    每一步选择 lambda × 相关度 − (1 − lambda) × 与已选片段的最大相似度 最高、且放得下的片段。
+    相关度为片段与各 query 的最大余弦相似度，片段向量直接读取自向量库，不会重新 embedding；
+    query 向量与检索时相同，命中 embedding 缓存。
+    无法取得向量的片段（旧版向量库、检索失败等）按原顺序在剩余预算内补入。
+    """
+    docs = [d for d in docs if d.page_content and d.page_content.strip()]
+    if not docs:
+        return []
+    costs = [estimate_tokens(d.page_content) for d in docs]
+    vectors = {}
+    query_matrix = None
+    try:
+        store = load_vector_store(embedding_adapter, filepath)
+        chunk_ids = [d.metadata.get("chunk_id") for d in docs if d.metadata.get("chunk_id")]
+        if store and chunk_ids:
+            vectors = store.get_vectors(chunk_ids)
+            valid_queries = [q for q in queries if q and str(q).strip()]
+            if vectors and valid_queries:
+                query_matrix = np.asarray(store.embeddings.embed_documents(valid_queries), dtype=np.float32)
+    except Exception as e:
+        logging.warning(f"MMR rerank unavailable, keeping retrieval order: {e}")
+        vectors, query_matrix = {}, None
+
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    with_vectors = [i for i, d in enumerate(docs) if d.metadata.get("chunk_id") in vectors]
+    selected = []
+    remaining_budget = token_budget
+    if query_matrix is not None and with_vectors:
+        doc_matrix = _normalize(np.stack([vectors[docs[i].metadata["chunk_id"]] for i in with_vectors]))
+        query_matrix = _normalize(query_matrix)
+        relevance = (doc_matrix @ query_matrix.T).max(axis=1)
+        similarity = doc_matrix @ doc_matrix.T
+        redundancy = np.full(len(with_vectors), -1.0, dtype=np.float32)
+        candidates = set(range(len(with_vectors)))
+        while candidates:
+            fitting = [c for c in candidates if costs[with_vectors[c]] <= remaining_budget]
+            if not fitting:
+                break
+            scores = {
+                c: lambda_mult * relevance[c] - (1 - lambda_mult) * max(redundancy[c], 0.0)
+                for c in fitting
+            }
+            best = max(fitting, key=lambda c: (scores[c], -c))
+            candidates.discard(best)
+            selected.append(with_vectors[best])
+            remaining_budget -= costs[with_vectors[best]]
+            redundancy = np.maximum(redundancy, similarity[best])
+    else:
+        with_vectors = []
+    for i, doc in enumerate(docs):
+        if i not in with_vectors and costs[i] <= remaining_budget:
+            selected.append(i)
+            remaining_budget -= costs[i]
+    logging.info(
+        f"mmr_pack: kept {len(selected)}/{len(docs)} chunks, "
+        f"{token_budget - remaining_budget:.0f}/{token_budget} tokens."
+    )
+    return [docs[i] for i in selected]
+
 def _get_sentence_transformer(model_name: str = 'paraphrase-MiniLM-L6-v2'):
     """获取sentence transformer模型，处理SSL问题"""
     try:
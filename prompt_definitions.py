@@ -20,6 +20,9 @@ summarize_recent_chapters_prompt = """\
 已完成章节内容（仅作背景参考）：
 {global_summary}
 
+**近期章节摘要（最近几章的剧情进展）：**
+{recent_chapter_summaries}
+
 **上一章结尾内容（用于剧情衔接参考）：**
 {previous_chapter_excerpt}
 
@@ -524,6 +527,60 @@ summary_prompt = """\
 □ 近期3章是否只保留了影响后续的关键信息？
 """
 
+# 单章剧情摘要（定稿时生成一次，存入 summaries/chapter_N.json，供后续章节组合近期前情）
+chapter_record_summary_prompt = """\
+你是一名严谨的小说剧情档案管理员，请为第{novel_number}章《{chapter_title}》写一份**≤300字**的单章剧情摘要。
+
+【章节正文】：
+{chapter_text}
+
+【要求】
+- 只记录原文明确出现的信息，禁止推测、补充或评价
+- 按时间顺序写出推动剧情的关键事件（谁+做了什么+结果），合并过渡与琐事
+- 写明本章结束时主要人物所处的位置、状态（受伤、情绪、持有的关键物品）以及悬而未决的问题
+- 人物姓名、称号与原文保持一致
+
+【输出格式】
+仅返回纯文本摘要，无标题/解释
+"""
+
+# 分卷摘要（每若干章汇总一次单章摘要）
+arc_summary_prompt = """\
+你是一名严谨的小说剧情档案管理员，请将第{start_chapter}-{end_chapter}章的单章摘要汇总为一份**≤600字**的分卷摘要。
+
+【各章摘要】：
+{chapter_summaries}
+
+【要求】
+- 只整合输入中明确出现的信息，禁止推测或补充
+- 写清本卷的主线推进、关键转折与结果，合并重复与琐碎情节
+- 保留本卷新出现的重要人物/物品、人物关系与状态的变化
+- 列出本卷结束时仍未解决的伏笔与悬念
+
+【输出格式】
+仅返回纯文本摘要，无标题/解释
+"""
+
+# 全书梗概（随分卷摘要增量更新，篇幅有上限）
+book_synopsis_prompt = """\
+你是一名严谨的小说剧情档案管理员，请依据【旧梗概】与【新分卷摘要】输出一份**严格≤1000字**的全书梗概。
+
+【旧梗概】：
+{old_synopsis}
+
+【新分卷摘要（第{start_chapter}-{end_chapter}章）】：
+{arc_summary}
+
+【要求】
+- 若旧梗概已包含这些章节的内容（分卷被修订），以新的分卷摘要为准改写对应部分
+- 保留主线脉络、主角核心目标、关键人物关系的当前状态与未解决的核心伏笔
+- 早期剧情按故事弧压缩为一句话，已解决的支线标记为【已闭环】
+- 只整合输入中明确出现的信息，禁止推测或补充
+
+【输出格式】
+仅返回纯文本梗概，无标题/解释
+"""
+
 # =============== 7. 角色状态更新 ===================
 create_character_state_prompt = """\
 依据当前角色动力学设定：{character_dynamics}
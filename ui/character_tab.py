@@ -3,7 +3,8 @@
 import os
 import customtkinter as ctk
 from tkinter import messagebox
-from utils import read_file, save_string_to_txt, clear_file_content
+from utils import read_file
+from novel_generator.project_state import CHARACTER_STATE, get_project_state
 from ui.context_menu import TextWidgetContextMenu
 
 def build_character_tab(self):
@@ -39,7 +40,7 @@ def load_character_state(self):
         messagebox.showwarning("警告", "请先设置保存文件路径")
         return
     filename = os.path.join(filepath, "character_state.txt")
-    content = read_file(filename)
+    content = get_project_state(filepath).read(CHARACTER_STATE)
     self.character_text.delete("0.0", "end")
     self.character_text.insert("0.0", content)
     self.log("已加载 character_state.txt 到编辑区。")
@@ -62,7 +63,7 @@ def save_character_state(self):
         os.makedirs(filepath, exist_ok=True)
         
         # 直接保存
-        save_string_to_txt(content, filename)
+        get_project_state(filepath).write(CHARACTER_STATE, content)
         
         # 验证保存是否成功
         if os.path.exists(filename):
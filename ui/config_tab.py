@@ -195,6 +195,9 @@ def build_ai_config_tab(self):
             "opening_mode": self.opening_mode_var.get() if hasattr(self, 'opening_mode_var') else "continuation"
         }
         self.loaded_config["embedding_configs"][self.embedding_interface_format_var.get().strip()] = embedding_config
+        # 保留界面上没有对应控件的参数（如 vector_backend）
+        for key, value in self.loaded_config.get("other_params", {}).items():
+            other_params.setdefault(key, value)
         self.loaded_config["other_params"] = other_params
 
 
@@ -844,6 +847,9 @@ def save_config_btn(self):
     existing_config = load_config(self.config_file)
     if not existing_config:
         existing_config = {}
+    # 保留界面上没有对应控件的参数（如 vector_backend）
+    for key, value in existing_config.get("other_params", {}).items():
+        other_params.setdefault(key, value)
     existing_config["last_interface_format"] = current_llm_interface
     existing_config["last_embedding_interface_format"] = current_embedding_interface
     if "llm_configs" not in existing_config:
@@ -3,7 +3,8 @@
 import os
 import customtkinter as ctk
 from tkinter import messagebox
-from utils import read_file, save_string_to_txt, clear_file_content
+from utils import read_file
+from novel_generator.project_state import DIRECTORY, get_project_state
 from ui.context_menu import TextWidgetContextMenu
 
 def build_directory_tab(self):
@@ -56,7 +57,7 @@ def load_chapter_blueprint(self):
         messagebox.showwarning("警告", "请先设置保存文件路径")
         return
     filename = os.path.join(filepath, "Novel_directory.txt")
-    content = read_file(filename)
+    content = get_project_state(filepath).read(DIRECTORY)
     self.directory_text.delete("0.0", "end")
     self.directory_text.insert("0.0", content)
     self.log("已加载 Novel_directory.txt 内容到编辑区。")
@@ -79,7 +80,7 @@ def save_chapter_blueprint(self):
         os.makedirs(filepath, exist_ok=True)
         
         # 直接保存（不需要先清空）
-        save_string_to_txt(content, filename)
+        get_project_state(filepath).write(DIRECTORY, content)
         
         # 验证保存是否成功
         if os.path.exists(filename):
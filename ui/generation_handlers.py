@@ -15,7 +15,11 @@ from novel_generator import (
     generate_chapter_draft,
     finalize_chapter,
     import_knowledge_file,
+    import_knowledge_files,
+    list_knowledge_files,
+    format_import_report,
     clear_vector_store,
+    rebuild_vector_store,
     enrich_chapter_text,
     build_chapter_prompt,
     analyze_chapter_logic,
@@ -24,6 +28,7 @@ from novel_generator import (
     answer_novel_question
 )
 from consistency_checker import check_consistency
+from novel_generator.project_state import DIRECTORY, FORESHADOWING, get_project_state
 
 def generate_novel_architecture_ui(self):
     filepath = self.filepath_var.get().strip()
@@ -298,8 +303,23 @@ def generate_chapter_draft_ui(self):
                 self.safe_log("已取消生成。")
                 return
 
-            # === 3. 生成初稿 ===
+            # === 3. 生成初稿（流式输出到本章内容编辑框） ===
             self.safe_log("正在生成草稿正文，请稍候...")
+            stop_event = threading.Event()
+
+            def on_stop_draft():
+                stop_event.set()
+                self.safe_log("已请求停止生成，将保留已生成的内容。")
+
+            def prepare_streaming():
+                self.chapter_result.delete("0.0", "end")
+                self.btn_generate_chapter.configure(text="停止生成", command=on_stop_draft, state="normal")
+
+            def append_draft_chunk(chunk: str):
+                self.chapter_result.insert("end", chunk)
+                self.chapter_result.see("end")
+
+            self.master.after(0, prepare_streaming)
             draft_text = generate_chapter_draft(
                 api_key=draft_key, base_url=draft_url, model_name=draft_model,
                 filepath=filepath, novel_number=chap_num, word_number=word_num,
@@ -310,8 +330,14 @@ def generate_chapter_draft_ui(self):
                 embedding_interface_format=emb_fmt, embedding_model_name=emb_model,
                 embedding_retrieval_k=emb_k, interface_format=draft_interface,
                 max_tokens=draft_tokens, timeout=draft_timeout,
-                custom_prompt_text=final_prompt
+                custom_prompt_text=final_prompt,
+                on_chunk=lambda chunk: self.master.after(0, lambda c=chunk: append_draft_chunk(c)),
+                should_stop=stop_event.is_set
             )
+            self.master.after(0, lambda: self.btn_generate_chapter.configure(
+                text="Step3. 生成草稿", command=self.generate_chapter_draft_ui, state="disabled"
+            ))
+            self.master.after(0, lambda: self.show_chapter_in_textbox(draft_text))
 
             if not draft_text:
                 self.safe_log("生成失败：返回内容为空。")
@@ -536,6 +562,9 @@ def generate_chapter_draft_ui(self):
         except Exception as e:
             self.handle_exception("生成草稿流程出错")
         finally:
+            self.master.after(0, lambda: self.btn_generate_chapter.configure(
+                text="Step3. 生成草稿", command=self.generate_chapter_draft_ui
+            ))
             self.enable_button_safe(self.btn_generate_chapter)
 
     threading.Thread(target=task, daemon=True).start()
@@ -655,8 +684,8 @@ def do_consistency_check(self):
             self.safe_log("开始一致性审校...")
             result = check_consistency(
                 novel_setting="",
-                character_state=read_file(os.path.join(filepath, "character_state.txt")),
-                global_summary=read_file(os.path.join(filepath, "global_summary.txt")),
+                character_state=get_project_state(filepath).character_state,
+                global_summary=get_project_state(filepath).global_summary,
                 chapter_text=chapter_text,
                 api_key=api_key,
                 base_url=base_url,
@@ -932,72 +961,117 @@ def generate_batch_ui(self):
 
 
 def import_knowledge_handler(self):
-    selected_file = filedialog.askopenfilename(
-        title="选择要导入的知识库文件",
+    selected_files = filedialog.askopenfilenames(
+        title="选择要导入的知识库文件（可多选）",
         filetypes=[("Text Files", "*.txt"), ("All Files", "*.*")]
     )
-    if selected_file:
-        def task():
-            self.disable_button_safe(self.btn_import_knowledge)
-            try:
-                emb_api_key = self.embedding_api_key_var.get().strip()
-                emb_url = self.embedding_url_var.get().strip()
-                emb_format = self.embedding_interface_format_var.get().strip()
-                emb_model = self.embedding_model_name_var.get().strip()
-
-                # 尝试不同编码读取文件
-                content = None
-                encodings = ['utf-8', 'gbk', 'gb2312', 'ansi']
-                for encoding in encodings:
-                    try:
-                        with open(selected_file, 'r', encoding=encoding) as f:
-                            content = f.read()
-                            break
-                    except UnicodeDecodeError:
-                        continue
-                    except Exception as e:
-                        self.safe_log(f"读取文件时发生错误: {str(e)}")
-                        raise
-
-                if content is None:
-                    raise Exception("无法以任何已知编码格式读取文件")
-
-                # 创建临时UTF-8文件
-                import tempfile
-                import os
-                with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', delete=False, suffix='.txt') as temp:
-                    temp.write(content)
-                    temp_path = temp.name
+    if selected_files:
+        _start_knowledge_import(self, list(selected_files), self.btn_import_knowledge)
 
-                try:
-                    self.safe_log(f"开始导入知识库文件: {selected_file}")
-                    import_knowledge_file(
-                        embedding_api_key=emb_api_key,
-                        embedding_url=emb_url,
-                        embedding_interface_format=emb_format,
-                        embedding_model_name=emb_model,
-                        file_path=temp_path,
-                        filepath=self.filepath_var.get().strip()
+def import_knowledge_dir_handler(self):
+    selected_dir = filedialog.askdirectory(title="选择知识库目录（递归导入其中的 .txt / .md 文件）")
+    if not selected_dir:
+        return
+    files = list_knowledge_files(selected_dir)
+    if not files:
+        messagebox.showinfo("提示", "所选目录中没有可导入的 .txt / .md 文件。")
+        return
+    _start_knowledge_import(self, files, self.btn_import_knowledge_dir)
+
+def _start_knowledge_import(self, files, button):
+    """单个文件走可断点续传的流式导入，多个文件走并行批量导入"""
+    def task():
+        self.disable_button_safe(button)
+        try:
+            emb_api_key = self.embedding_api_key_var.get().strip()
+            emb_url = self.embedding_url_var.get().strip()
+            emb_format = self.embedding_interface_format_var.get().strip()
+            emb_model = self.embedding_model_name_var.get().strip()
+            filepath = self.filepath_var.get().strip()
+
+            import time
+            last_report = [0.0]
+
+            def throttled(message):
+                # 日志刷新限流，避免大文件或大量文件导入时刷屏
+                now = time.time()
+                if now - last_report[0] < 2.0:
+                    return
+                last_report[0] = now
+                self.safe_log(message)
+
+            if len(files) == 1:
+                selected_file = files[0]
+
+                def on_progress(chunks_done, bytes_read, total_bytes, chunks_per_sec):
+                    percent = min(100.0, bytes_read * 100.0 / max(total_bytes, 1))
+                    throttled(f"导入进度: {percent:.1f}%，已处理 {chunks_done} 个分块（{chunks_per_sec:.1f} 块/秒）")
+
+                self.safe_log(f"开始导入知识库文件: {selected_file}")
+                stats = import_knowledge_file(
+                    embedding_api_key=emb_api_key,
+                    embedding_url=emb_url,
+                    embedding_interface_format=emb_format,
+                    embedding_model_name=emb_model,
+                    file_path=selected_file,
+                    filepath=filepath,
+                    source_name=os.path.basename(selected_file),
+                    progress_callback=on_progress
+                )
+                if not stats:
+                    self.safe_log("❌ 知识库文件导入失败，请查看日志。")
+                elif stats.get("completed"):
+                    self.safe_log(
+                        f"✅ 知识库文件导入完成：共 {stats['chunks']} 个分块，"
+                        f"新写入 {stats['embedded']} 个，用时 {stats['seconds']:.1f} 秒。"
                     )
-                    self.safe_log("✅ 知识库文件导入完成。")
-                finally:
-                    # 清理临时文件
-                    try:
-                        os.unlink(temp_path)
-                    except:
-                        pass
+                    if stats.get("replaced"):
+                        self.safe_log(f"⚠️ 文件中有 {stats['replaced']} 个字符无法按识别出的编码解码，已替换为 �，请检查文件编码。")
+                else:
+                    self.safe_log(
+                        f"⚠️ 知识库导入中断：{stats.get('error', '')}。"
+                        f"已写入的分块会保留，重新导入同一文件将从断点继续。"
+                    )
+                return
 
-            except Exception:
-                self.handle_exception("导入知识库时出错")
-            finally:
-                self.enable_button_safe(self.btn_import_knowledge)
+            def on_batch_progress(files_done, total_files, chunks_written, chunks_per_sec):
+                throttled(f"导入进度: {files_done}/{total_files} 个文件，已写入 {chunks_written} 个分块（{chunks_per_sec:.1f} 块/秒）")
 
-        try:
-            thread = threading.Thread(target=task, daemon=True)
-            thread.start()
-        except Exception as e:
-            self.enable_button_safe(self.btn_import_knowledge)
-            messagebox.showerror("错误", f"线程启动失败: {str(e)}")
+            self.safe_log(f"开始批量导入 {len(files)} 个知识库文件...")
+            reports = import_knowledge_files(
+                embedding_api_key=emb_api_key,
+                embedding_url=emb_url,
+                embedding_interface_format=emb_format,
+                embedding_model_name=emb_model,
+                file_paths=files,
+                filepath=filepath,
+                progress_callback=on_batch_progress
+            )
+            if reports is None:
+                self.safe_log("❌ 知识库批量导入失败，请查看日志。")
+                return
+            report_text = format_import_report(reports)
+            report_file = os.path.join(filepath, "knowledge_import_report.txt")
+            save_string_to_txt(report_text, report_file)
+            failed = [r for r in reports if r["status"] != "ok"]
+            for r in failed:
+                self.safe_log(f"⚠️ 导入失败: {r['doc']}：{r['error']}")
+            self.safe_log(
+                f"✅ 知识库批量导入完成：{len(reports) - len(failed)}/{len(reports)} 个文件成功，"
+                f"跨文件重复段落 {sum(r['duplicates'] for r in reports)} 个，"
+                f"新写入 {sum(r['embedded'] for r in reports)} 个分块。详细报告: {report_file}"
+            )
+        except Exception:
+            self.handle_exception("导入知识库时出错")
+        finally:
+            self.enable_button_safe(button)
+
+    try:
+        thread = threading.Thread(target=task, daemon=True)
+        thread.start()
+    except Exception as e:
+        self.enable_button_safe(button)
+        messagebox.showerror("错误", f"线程启动失败: {str(e)}")
 
 def clear_vectorstore_handler(self):
     filepath = self.filepath_var.get().strip()
@@ -1014,6 +1088,58 @@ def clear_vectorstore_handler(self):
             else:
                 self.log(f"未能清空向量库，请关闭程序后手动删除 {filepath} 下的 vectorstore 文件夹。")
 
+def rebuild_vectorstore_handler(self):
+    filepath = self.filepath_var.get().strip()
+    if not filepath:
+        messagebox.showwarning("警告", "请先配置保存文件路径。")
+        return
+    if not messagebox.askyesno(
+        "重建向量库",
+        "将使用当前 Embedding 配置重新切分所有已定稿章节，并重新生成全部章节与知识库分块的向量。\n"
+        "重建完成前旧向量库仍可检索，期间定稿入库与知识库导入照常进行，替换前会补写到新向量库；中途中断后再次重建会从断点继续。是否开始？"
+    ):
+        return
+
+    def task():
+        self.disable_button_safe(self.btn_rebuild_vectorstore)
+        try:
+            import time
+            last_report = [0.0]
+
+            def on_progress(done, total, chunks_per_sec):
+                now = time.time()
+                if now - last_report[0] < 2.0:
+                    return
+                last_report[0] = now
+                self.safe_log(f"重建进度: {done}/{total} 个分块（{chunks_per_sec:.1f} 块/秒）")
+
+            self.safe_log("开始重建向量库...")
+            stats = rebuild_vector_store(
+                embedding_api_key=self.embedding_api_key_var.get().strip(),
+                embedding_url=self.embedding_url_var.get().strip(),
+                embedding_interface_format=self.embedding_interface_format_var.get().strip(),
+                embedding_model_name=self.embedding_model_name_var.get().strip(),
+                filepath=filepath,
+                progress_callback=on_progress
+            )
+            if stats.get("completed"):
+                self.safe_log(
+                    f"✅ 向量库重建完成：共 {stats['chunks']} 个分块，本次生成 {stats['embedded']} 个向量，"
+                    f"用时 {stats['seconds']:.1f} 秒。"
+                )
+                if stats.get("legacy_carried"):
+                    self.safe_log(
+                        f"旧向量库中有 {stats['legacy_carried']} 个无来源信息的旧分块，已作为知识库内容迁移到新向量库。"
+                    )
+            else:
+                self.safe_log(f"⚠️ 向量库重建中断：{stats.get('error', '')}。旧向量库未受影响，再次重建将从断点继续。")
+        except Exception:
+            self.handle_exception("重建向量库时出错")
+        finally:
+            self.enable_button_safe(self.btn_rebuild_vectorstore)
+
+    threading.Thread(target=task, daemon=True).start()
+
 def show_plot_arcs_ui(self):
     filepath = self.filepath_var.get().strip()
     if not filepath:
@@ -1103,7 +1229,7 @@ def refine_directory_card_ui(self):
                 messagebox.showerror("错误", "结束章节不能小于起始章节")
                 return
 
-            content = read_file(directory_file)
+            content = get_project_state(filepath).directory
             pattern = get_range_pattern(start_num, end_num)
             
             match = pattern.search(content)
@@ -1165,10 +1291,9 @@ def refine_directory_card_ui(self):
             return
             
         # 读取背景
-        arch_file = os.path.join(filepath, "Novel_architecture.txt")
-        summary_file = os.path.join(filepath, "global_summary.txt")
-        novel_arch_content = read_file(arch_file) if os.path.exists(arch_file) else ""
-        global_sum_content = read_file(summary_file) if os.path.exists(summary_file) else ""
+        state = get_project_state(filepath)
+        novel_arch_content = state.architecture
+        global_sum_content = state.global_summary
 
         # 获取配置 - 使用专门的目录微调配置
         try:
@@ -1239,15 +1364,15 @@ def refine_directory_card_ui(self):
                 return
 
             # 读取现有目录
-            directory_content = read_file(directory_file)
+            state = get_project_state(filepath)
+            directory_content = state.directory
             
             # 使用正则表达式替换指定范围内的章节
             pattern = get_range_pattern(start_num, end_num)
             updated_content = pattern.sub(content, directory_content, count=1)
             
             # 保存修改后的目录
-            clear_file_content(directory_file)
-            save_string_to_txt(updated_content.strip(), directory_file)
+            state.write(DIRECTORY, updated_content.strip())
             
             status_label.configure(text="✅ 保存成功", text_color="green")
             
@@ -1274,12 +1399,12 @@ def show_foreshadowing_records_ui(self):
         messagebox.showwarning("警告", "请先在主Tab中设置保存文件路径")
         return
 
-    record_file = os.path.join(filepath, "foreshadowing_records.txt")
-    if not os.path.exists(record_file):
+    state = get_project_state(filepath)
+    if not state.exists(FORESHADOWING):
         messagebox.showinfo("提示", "当前还未生成任何伏笔记录。\n请先进行章节定稿(Finalize)以自动生成。")
         return
 
-    content = read_file(record_file).strip()
+    content = state.foreshadowing.strip()
     if not content:
         content = "伏笔记录为空。"
 
@@ -1303,7 +1428,7 @@ def show_foreshadowing_records_ui(self):
     # 允许用户手动编辑和保存整理
     def on_save_edit():
         new_text = text_area.get("0.0", "end").strip()
-        save_string_to_txt(new_text, record_file)
+        state.write(FORESHADOWING, new_text)
         messagebox.showinfo("成功", "伏笔记录已保存更新。")
 
     btn_frame = ctk.CTkFrame(top)
@@ -1440,17 +1565,14 @@ def continue_directory_ui(self):
         messagebox.showwarning("警告", "尚未生成架构文件 (Novel_architecture.txt)。")
         return
 
-    directory_file = os.path.join(filepath, "Novel_directory.txt")
+    state = get_project_state(filepath)
     existing_chapters_count = 0
-    if os.path.exists(directory_file):
-        content = read_file(directory_file)
-        # 使用正则表达式找出所有章节编号
-        pattern = r"第\s*(\d+)\s*章"
-        chapter_numbers = re.findall(pattern, content)
-        if chapter_numbers:
-            chapter_numbers = [int(num) for num in chapter_numbers if num.isdigit()]
-            if chapter_numbers:
-                existing_chapters_count = max(chapter_numbers)
+    if state.exists(DIRECTORY):
+        existing_chapters_count = state.blueprint_index().max_chapter
+        if not existing_chapters_count:
+            # 标题格式不规范时，用正则表达式找出所有章节编号
+            chapter_numbers = [int(num) for num in re.findall(r"第\s*(\d+)\s*章", state.directory)]
+            existing_chapters_count = max(chapter_numbers) if chapter_numbers else 0
 
     # 创建弹窗
     dialog = ctk.CTkToplevel(self.master)
@@ -13,6 +13,7 @@ from llm_adapters import create_llm_adapter
 from config_manager import load_config, save_config, test_llm_config, test_embedding_config
 from utils import read_file, save_string_to_txt, clear_file_content
 from tooltips import tooltips
+from novel_generator.vector_backends import set_default_vector_backend
 
 from ui.context_menu import TextWidgetContextMenu
 from ui.main_tab import build_main_tab, build_left_layout, build_right_layout
@@ -25,7 +26,9 @@ from ui.generation_handlers import (
     finalize_chapter_ui,
     do_consistency_check,
     import_knowledge_handler,
+    import_knowledge_dir_handler,
     clear_vectorstore_handler,
+    rebuild_vectorstore_handler,
     show_plot_arcs_ui,
     generate_batch_ui,
     refine_directory_card_ui,
@@ -63,6 +66,8 @@ class NovelGeneratorGUI:
         # --------------- 配置文件路径 ---------------
         self.config_file = "config.json"
         self.loaded_config = load_config(self.config_file)
+        # 新建向量库使用的后端：chroma（默认）或 numpy
+        set_default_vector_backend((self.loaded_config or {}).get("other_params", {}).get("vector_backend", "chroma"))
 
         if self.loaded_config:
             last_llm = next(iter(self.loaded_config["llm_configs"].values())).get("interface_format", "OpenAI")
@@ -412,7 +417,9 @@ class NovelGeneratorGUI:
     refine_directory_card_ui = refine_directory_card_ui
     continue_directory_ui = continue_directory_ui
     import_knowledge_handler = import_knowledge_handler
+    import_knowledge_dir_handler = import_knowledge_dir_handler
     clear_vectorstore_handler = clear_vectorstore_handler
+    rebuild_vectorstore_handler = rebuild_vectorstore_handler
     show_plot_arcs_ui = show_plot_arcs_ui
     show_foreshadowing_records_ui = show_foreshadowing_records_ui
     show_novel_qa_ui = _show_novel_qa_ui
@@ -197,6 +197,20 @@ def build_optional_buttons_area(self, start_row=2):
     # 放在伏笔库旁边
     self.btn_qa.grid(row=1, column=2, columnspan=3, padx=5, pady=5, sticky="ew")
 
+    # 批量导入整个知识库目录
+    self.btn_import_knowledge_dir = ctk.CTkButton(
+        self.optional_btn_frame, text="导入知识库目录", command=self.import_knowledge_dir_handler,
+        font=("Microsoft YaHei", 12)
+    )
+    self.btn_import_knowledge_dir.grid(row=2, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+
+    # 更换 Embedding 模型后以新模型重建向量库
+    self.btn_rebuild_vectorstore = ctk.CTkButton(
+        self.optional_btn_frame, text="重建向量库", command=self.rebuild_vectorstore_handler,
+        font=("Microsoft YaHei", 12)
+    )
+    self.btn_rebuild_vectorstore.grid(row=2, column=3, columnspan=2, padx=5, pady=5, sticky="ew")
+
 def create_label_with_help_for_novel_params(self, parent, label_text, tooltip_key, row, column, font=None, sticky="e", padx=5, pady=5):
     frame = ctk.CTkFrame(parent)
     frame.grid(row=row, column=column, padx=padx, pady=pady, sticky=sticky)
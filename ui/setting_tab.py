@@ -3,7 +3,8 @@
 import os
 import customtkinter as ctk
 from tkinter import messagebox
-from utils import read_file, save_string_to_txt, clear_file_content
+from utils import read_file
+from novel_generator.project_state import ARCHITECTURE, get_project_state
 from ui.context_menu import TextWidgetContextMenu
 
 def build_setting_tab(self):
@@ -39,7 +40,7 @@ def load_novel_architecture(self):
         messagebox.showwarning("警告", "请先设置保存文件路径")
         return
     filename = os.path.join(filepath, "Novel_architecture.txt")
-    content = read_file(filename)
+    content = get_project_state(filepath).read(ARCHITECTURE)
     self.setting_text.delete("0.0", "end")
     self.setting_text.insert("0.0", content)
     self.log("已加载 Novel_architecture.txt 内容到编辑区。")
@@ -62,7 +63,7 @@ def save_novel_architecture(self):
         os.makedirs(filepath, exist_ok=True)
         
         # 直接保存
-        save_string_to_txt(content, filename)
+        get_project_state(filepath).write(ARCHITECTURE, content)
         
         # 验证保存是否成功
         if os.path.exists(filename):
@@ -3,7 +3,9 @@
 import os
 import customtkinter as ctk
 from tkinter import messagebox
-from utils import read_file, save_string_to_txt, clear_file_content
+from utils import read_file
+from novel_generator.project_state import GLOBAL_SUMMARY, get_project_state
+from novel_generator.chapter_summaries import save_global_summary_edit
 from ui.context_menu import TextWidgetContextMenu
 
 def build_summary_tab(self):
@@ -40,7 +42,7 @@ def load_global_summary(self):
         messagebox.showwarning("警告", "请先设置保存文件路径")
         return
     filename = os.path.join(filepath, "global_summary.txt")
-    content = read_file(filename)
+    content = get_project_state(filepath).read(GLOBAL_SUMMARY)
     self.summary_text.delete("0.0", "end")
     self.summary_text.insert("0.0", content)
     self.log("已加载 global_summary.txt 到编辑区。")
@@ -62,8 +64,10 @@ def save_global_summary(self):
         # 确保目录存在
         os.makedirs(filepath, exist_ok=True)
         
-        # 直接保存
-        save_string_to_txt(content, filename)
+        # 已启用分层摘要时只采用梗概部分，并按分层摘要重新组合
+        content = save_global_summary_edit(filepath, content).strip()
+        self.summary_text.delete("0.0", "end")
+        self.summary_text.insert("0.0", content)
         
         # 验证保存是否成功
         if os.path.exists(filename):
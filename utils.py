@@ -16,6 +16,49 @@ def read_file(filename: str) -> str:
         print(f"[read_file] 读取文件时发生错误: {e}")
         return ""
 
+def read_file_tail(filename: str, max_chars: int, block_size: int = 8192) -> str:
+    """
+    从文件末尾向前按块读取，返回去除首尾空白后的最后 max_chars 个字符
+    （与 read_file(filename).strip()[-max_chars:] 结果一致），不读取文件其余部分。
+    块边界落在多字节 UTF-8 字符中间时跳过残缺的前导字节；换行统一为 \\n。
+    若文件不存在或异常则返回空字符串。
+    """
+    if max_chars <= 0:
+        return ""
+    try:
+        with open(filename, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            pos = file.tell()
+            data = b""
+            while True:
+                step = min(block_size, pos)
+                pos -= step
+                file.seek(pos)
+                data = file.read(step) + data
+                head = data
+                if pos == 0:
+                    if head.startswith(b"\xef\xbb\xbf"):
+                        head = head[3:]
+                else:
+                    # 跳过 UTF-8 续字节（10xxxxxx），从完整字符开始解码
+                    skip = 0
+                    while skip < len(head) and skip < 4 and (head[skip] & 0xC0) == 0x80:
+                        skip += 1
+                    head = head[skip:]
+                text = head.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+                text = text.rstrip()
+                if pos == 0:
+                    return text.lstrip()[-max_chars:]
+                # 多读一个字符，确保开头可能被截断的 \r\n 不影响结果
+                if len(text) > max_chars:
+                    return text[-max_chars:]
+                block_size *= 2
+    except FileNotFoundError:
+        return ""
+    except Exception as e:
+        print(f"[read_file_tail] 读取文件时发生错误: {e}")
+        return ""
+
 def append_text_to_file(text_to_append: str, file_path: str):
     """在文件末尾追加文本(带换行)。若文本非空且无换行，则自动加换行。"""
     if text_to_append and not text_to_append.startswith('\n'):